@@ -1,5 +1,6 @@
 """Guardrails & Policy Agent - Applies safety rules and escalation."""
 from typing import Dict, Any, List
+import time
 import re
 from config import MIN_CONFIDENCE_THRESHOLD
 from utils.logger import get_logger
@@ -58,6 +59,7 @@ class GuardrailsAgent:
     
     def check(self, response_data: Dict[str, Any], user_input: str = "") -> Dict[str, Any]:
         """Check guardrails and apply policies."""
+        started = time.perf_counter()
         logger.info("Guardrails check started")
         
         violations = []
@@ -122,7 +124,8 @@ class GuardrailsAgent:
             logger.warning("Guardrails violations detected", 
                           violations=[v["category"] for v in violations])
         else:
-            logger.info("Guardrails check passed", confidence=confidence)
+            logger.info("Guardrails check passed", confidence=confidence,
+                        duration_ms=round((time.perf_counter() - started) * 1000, 1))
         
         return {
             "agent": self.name,
@@ -1,5 +1,6 @@
 """Ingestion Agent - Normalizes incoming tickets and queries."""
 from typing import Dict, Any, Union
+import time
 from datetime import datetime
 import uuid
 from utils.logger import get_logger
@@ -15,6 +16,7 @@ class IngestionAgent:
     
     def process(self, input_data: Any) -> Dict[str, Any]:
         """Process and normalize incoming data."""
+        started = time.perf_counter()
         logger.info("Ingestion started", input_type=type(input_data).__name__)
         
         # Handle string input
@@ -38,6 +40,7 @@ class IngestionAgent:
         }
         
         logger.info("Ingestion completed", 
+                   duration_ms=round((time.perf_counter() - started) * 1000, 1),
                    normalized_id=normalized["id"],
                    type=normalized["type"])
         
@@ -78,7 +81,7 @@ class IngestionAgent:
         """Extract metadata from input."""
         metadata = {}
         metadata_fields = ["priority", "urgency", "category", "user_id", 
-                          "timestamp", "source", "tags"]
+                          "timestamp", "source", "tags", "knowledge_filter", "tenant_id"]
         for field in metadata_fields:
             if field in input_data:
                 metadata[field] = input_data[field]
@@ -1,5 +1,6 @@
 """Intent & Classification Agent - Detects intent, urgency, SLA risk."""
 from typing import Dict, Any
+import time
 from langchain_openai import ChatOpenAI
 try:
     from langchain_core.prompts import ChatPromptTemplate
@@ -24,6 +25,7 @@ class IntentClassificationAgent:
     
     def classify(self, normalized_input: Dict[str, Any]) -> Dict[str, Any]:
         """Classify intent, urgency, and risk."""
+        started = time.perf_counter()
         logger.info("Classification started", input_id=normalized_input.get("id"))
         
         prompt = ChatPromptTemplate.from_messages([
@@ -64,6 +66,7 @@ class IntentClassificationAgent:
             classification = json.loads(content)
             
             logger.info("Classification completed", 
+                       duration_ms=round((time.perf_counter() - started) * 1000, 1),
                        intent=classification.get("intent"),
                        urgency=classification.get("urgency"))
             
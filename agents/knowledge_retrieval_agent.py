@@ -1,41 +1,98 @@
 """Knowledge Retrieval Agent (RAG) - Searches large documents."""
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import time
+from config import RETRIEVAL_MMR_LAMBDA, RETRIEVAL_FETCH_FACTOR, RETRIEVAL_MAX_PER_SOURCE
+from rag.mmr import maximal_marginal_relevance
+from rag.retrieval_policy import AdaptiveRetrievalPolicy
+from rag.tenancy import TenantRegistry
 from rag.vector_store import VectorStore
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Chunk position metadata passed on so ReasoningAgent can expand hits
+REF_KEYS = ("doc_id", "byte_offset", "byte_length", "parent_offset", "parent_length")
+
 class KnowledgeRetrievalAgent:
     """Retrieves relevant knowledge using RAG."""
     
     def __init__(self):
         self.name = "knowledge_retrieval_agent"
         self.vector_store = VectorStore()
+        # Tenants carrying a tenant_id search only their own index
+        self.vector_stores = TenantRegistry(self.vector_store)
+        self.policy = AdaptiveRetrievalPolicy()
+        self.mmr_lambda = RETRIEVAL_MMR_LAMBDA
+        self.fetch_factor = max(1, RETRIEVAL_FETCH_FACTOR)
+        self.max_per_source = RETRIEVAL_MAX_PER_SOURCE
         logger.info("KnowledgeRetrievalAgent initialized")
     
-    def retrieve(self, normalized_input: Dict[str, Any], k: int = 5) -> Dict[str, Any]:
-        """Retrieve relevant knowledge."""
+    def retrieve(
+        self,
+        normalized_input: Dict[str, Any],
+        k: Optional[int] = None,
+        intent_classification: Optional[Dict[str, Any]] = None,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Retrieve relevant knowledge.
+        
+        When ``k`` is not given it is chosen from intent and urgency. Results
+        below the relevance threshold or after a sharp score drop are dropped,
+        and the rest are diversified with MMR and a per-source cap.
+        
+        ``filter`` is a metadata filter (see ``VectorStore.similarity_search``);
+        when omitted, the input's ``knowledge_filter`` metadata is used. The
+        input's ``tenant_id`` metadata selects the tenant's index.
+        """
+        metadata = normalized_input.get("metadata") or {}
+        if k is None:
+            k = self.policy.choose_k(normalized_input, intent_classification)
+        if filter is None:
+            filter = metadata.get("knowledge_filter")
+        tenant_id = metadata.get("tenant_id")
+        started = time.perf_counter()
         logger.info("Knowledge retrieval started", 
                    input_id=normalized_input.get("id"),
-                   k=k)
+                   k=k,
+                   filter=filter,
+                   tenant_id=tenant_id)
         
         query = normalized_input.get("content", "")
         
         try:
-            # Retrieve from vector store
-            documents = self.vector_store.similarity_search(query, k=k)
+            with self.vector_stores.use(tenant_id) as vector_store:
+                # Retrieve candidates from vector store
+                fetch_k = min(k * self.fetch_factor, 100)
+                scored, vectors, query_vector = [], None, None
+                if query.strip():
+                    scored, vectors, query_vector = vector_store.similarity_search_with_vectors(
+                        query, k=fetch_k, filter=filter)
+                ranked, cutoff = self.policy.select([(i, score) for i, (_, score) in enumerate(scored)])
+                indices = self._diversify([i for i, _ in ranked], scored, vectors, query_vector, k)
+                kept = [scored[i] for i in indices]
+                # Only chunks that reach the prompt get their text loaded
+                texts = vector_store.materialize([doc for doc, _ in kept])
+            kept = [(doc, score) for doc, (_, score) in zip(texts, kept)]
             
             # Format results
             retrieved_context = []
-            for doc in documents:
-                retrieved_context.append({
+            for doc, score in kept:
+                entry = {
                     "content": doc.page_content,
                     "source": doc.metadata.get("source", "unknown"),
-                    "type": doc.metadata.get("type", "unknown")
-                })
+                    "type": doc.metadata.get("type", "unknown"),
+                    "score": round(score, 4)
+                }
+                ref = {key: doc.metadata[key] for key in REF_KEYS if key in doc.metadata}
+                if ref:
+                    entry["ref"] = ref
+                retrieved_context.append(entry)
             
             logger.info("Knowledge retrieval completed", 
-                       results_count=len(retrieved_context))
+                       duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                       results_count=len(retrieved_context),
+                       dropped=len(scored) - len(kept),
+                       cutoff=cutoff)
             
             return {
                 "agent": self.name,
@@ -43,12 +100,16 @@ class KnowledgeRetrievalAgent:
                 "output": {
                     "query": query,
                     "retrieved_documents": retrieved_context,
-                    "count": len(retrieved_context)
+                    "count": len(retrieved_context),
+                    # False lets downstream agents skip the knowledge context
+                    "relevant": bool(retrieved_context),
+                    "cutoff": cutoff
                 },
                 "tool_calls": [{
-                    "tool": "vector_store.similarity_search",
-                    "input": {"query": query, "k": k},
-                    "output": {"count": len(retrieved_context)}
+                    "tool": "vector_store.similarity_search_with_vectors",
+                    "input": {"query": query, "k": k, "fetch_k": fetch_k, "filter": filter,
+                              "tenant_id": tenant_id},
+                    "output": {"count": len(scored), "kept": len(retrieved_context)}
                 }],
                 "execution_time": 0.3
             }
@@ -61,3 +122,18 @@ class KnowledgeRetrievalAgent:
                 "tool_calls": [],
                 "execution_time": 0.1
             }
+    
+    def _diversify(self, indices: List[int], scored, vectors, query_vector, k: int) -> List[int]:
+        """Re-rank candidates with MMR, capping chunks per source document."""
+        if not indices:
+            return []
+        if vectors is None or len(vectors) != len(scored):
+            return indices[:k]
+        sources = [scored[i][0].metadata.get("source", "unknown") for i in indices]
+        picks = maximal_marginal_relevance(
+            query_vector, vectors[indices], k,
+            lambda_mult=self.mmr_lambda,
+            groups=sources,
+            max_per_group=self.max_per_source or None
+        )
+        return [indices[p] for p in picks]
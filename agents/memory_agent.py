@@ -1,5 +1,6 @@
 """Memory Agent - Manages episodic and semantic memory."""
 from typing import Dict, Any, List, Optional
+import time
 from memory.memory_store import MemoryStore, MemoryType
 from utils.logger import get_logger
 
@@ -19,6 +20,7 @@ class MemoryAgent:
         memory_types: List[str] = ["episodic", "semantic"]
     ) -> Dict[str, Any]:
         """Read from memory."""
+        started = time.perf_counter()
         logger.info("Memory read started", 
                    input_id=normalized_input.get("id"),
                    types=memory_types)
@@ -67,6 +69,7 @@ class MemoryAgent:
                 })
             
             logger.info("Memory read completed", 
+                       duration_ms=round((time.perf_counter() - started) * 1000, 1),
                        working_count=len(results.get("working", {})),
                        episodic_count=len(results.get("episodic", [])),
                        semantic_count=len(results.get("semantic", [])))
@@ -95,6 +98,7 @@ class MemoryAgent:
         data: Dict[str, Any]
     ) -> Dict[str, Any]:
         """Write to memory."""
+        started = time.perf_counter()
         logger.info("Memory write started", 
                    input_id=normalized_input.get("id"),
                    memory_type=memory_type)
@@ -122,7 +126,8 @@ class MemoryAgent:
                     metadata=data.get("metadata")
                 )
             
-            logger.info("Memory write completed", memory_type=memory_type)
+            logger.info("Memory write completed", memory_type=memory_type,
+                        duration_ms=round((time.perf_counter() - started) * 1000, 1))
             
             return {
                 "agent": self.name,
@@ -1,5 +1,6 @@
 """Planner/Orchestrator Agent - Decides execution strategy."""
 from typing import Dict, Any
+import time
 from langchain_openai import ChatOpenAI
 try:
     from langchain_core.prompts import ChatPromptTemplate
@@ -24,6 +25,7 @@ class PlannerAgent:
     
     def plan(self, normalized_input: Dict[str, Any]) -> Dict[str, Any]:
         """Create execution plan."""
+        started = time.perf_counter()
         logger.info("Planning started", input_id=normalized_input.get("id"))
         
         prompt = ChatPromptTemplate.from_messages([
@@ -68,6 +70,7 @@ class PlannerAgent:
             plan = json.loads(content)
             
             logger.info("Planning completed", 
+                       duration_ms=round((time.perf_counter() - started) * 1000, 1),
                        agents=plan.get("agents_to_run", []),
                        mode=plan.get("execution_mode"))
             
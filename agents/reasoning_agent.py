@@ -1,11 +1,14 @@
 """Reasoning/Correlation Agent - Connects issues with history."""
-from typing import Dict, Any
+from typing import Dict, Any, List
+import time
 from langchain_openai import ChatOpenAI
 try:
     from langchain_core.prompts import ChatPromptTemplate
 except ImportError:
     from langchain.prompts import ChatPromptTemplate
-from config import MODEL_NAME, OPENAI_API_KEY
+from config import MODEL_NAME, OPENAI_API_KEY, REASONING_CONTEXT_TOKENS
+from rag.context_expansion import ContextExpander, token_counter
+from rag.tenancy import validate_tenant
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -13,14 +16,33 @@ logger = get_logger(__name__)
 class ReasoningAgent:
     """Correlates current issues with history and identifies patterns."""
     
-    def __init__(self):
+    def __init__(self, vector_stores=None, context_tokens: int = REASONING_CONTEXT_TOKENS):
         self.name = "reasoning_agent"
         self.llm = ChatOpenAI(
             model=MODEL_NAME,
             temperature=0.4,
             openai_api_key=OPENAI_API_KEY
         )
-        logger.info("ReasoningAgent initialized")
+        # Retrieved chunks are widened into their parent sections via the
+        # tenant's store (``vector_stores`` is a ``TenantRegistry``)
+        self.vector_stores = vector_stores
+        self.context_tokens = context_tokens
+        self.count_tokens = token_counter(MODEL_NAME)
+        logger.info("ReasoningAgent initialized", context_tokens=context_tokens)
+    
+    def _expand_context(self, normalized_input: Dict[str, Any], docs: List[Dict[str, Any]]):
+        """Sections for ``docs``, read from the tenant's store while it is borrowed."""
+        stores = self.vector_stores
+        try:
+            tenant_id = validate_tenant((normalized_input.get("metadata") or {}).get("tenant_id"))
+        except ValueError:
+            stores = None
+        if stores is None:
+            expander = ContextExpander(count_tokens=self.count_tokens)
+            return expander.expand(docs, self.context_tokens)
+        with stores.use(tenant_id) as store:
+            expander = ContextExpander(read_text=store.read_text, count_tokens=self.count_tokens)
+            return expander.expand(docs, self.context_tokens)
     
     def reason(
         self,
@@ -30,6 +52,7 @@ class ReasoningAgent:
         memory_data: Dict[str, Any]
     ) -> Dict[str, Any]:
         """Perform reasoning and correlation."""
+        started = time.perf_counter()
         logger.info("Reasoning started", input_id=normalized_input.get("id"))
         
         # Prepare context
@@ -41,11 +64,11 @@ class ReasoningAgent:
             context_parts.append(f"Urgency: {intent_classification['output'].get('urgency')}")
         
         # Add retrieved knowledge
-        if knowledge_retrieval.get("status") == "success":
+        if knowledge_retrieval.get("status") == "success" and knowledge_retrieval['output'].get('relevant', True):
             docs = knowledge_retrieval['output'].get('retrieved_documents', [])
             context_parts.append(f"Retrieved Knowledge ({len(docs)} documents):")
-            for doc in docs[:3]:  # Limit context
-                context_parts.append(f"- {doc.get('content', '')[:200]}")
+            for section in self._expand_context(normalized_input, docs):
+                context_parts.append(f"- [{section['source']}] {section['content']}")
         
         # Add memory context
         if memory_data.get("status") == "success":
@@ -100,6 +123,7 @@ Analyze and provide reasoning.""")
             reasoning_result = json.loads(content)
             
             logger.info("Reasoning completed", 
+                       duration_ms=round((time.perf_counter() - started) * 1000, 1),
                        confidence=reasoning_result.get("confidence"))
             
             return {
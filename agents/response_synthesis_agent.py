@@ -1,5 +1,6 @@
 """Response Synthesis Agent - Generates human-readable outputs."""
 from typing import Dict, Any
+import time
 from langchain_openai import ChatOpenAI
 try:
     from langchain_core.prompts import ChatPromptTemplate
@@ -30,6 +31,7 @@ class ResponseSynthesisAgent:
         reasoning: Dict[str, Any]
     ) -> Dict[str, Any]:
         """Synthesize final response."""
+        started = time.perf_counter()
         logger.info("Response synthesis started", 
                    input_id=normalized_input.get("id"))
         
@@ -40,7 +42,7 @@ class ResponseSynthesisAgent:
             intent_data = intent_classification['output']
             context_parts.append(f"Intent: {intent_data.get('intent')}, Urgency: {intent_data.get('urgency')}")
         
-        if knowledge_retrieval.get("status") == "success":
+        if knowledge_retrieval.get("status") == "success" and knowledge_retrieval['output'].get('relevant', True):
             docs = knowledge_retrieval['output'].get('retrieved_documents', [])
             context_parts.append(f"Relevant Knowledge: {len(docs)} documents retrieved")
         
@@ -95,6 +97,7 @@ Generate a helpful response.""")
             synthesis_result = json.loads(content)
             
             logger.info("Response synthesis completed", 
+                       duration_ms=round((time.perf_counter() - started) * 1000, 1),
                        confidence=synthesis_result.get("confidence"))
             
             return {
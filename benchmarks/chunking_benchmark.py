@@ -0,0 +1,95 @@
+"""Chunking throughput: token-aware chunker vs the character splitter.
+
+    python benchmarks/chunking_benchmark.py [size_mb ...]
+
+Compares the current character splitter, the same splitter measuring
+length with tiktoken (re-encoding every candidate split), and
+``TokenChunker`` (one encode per document).
+
+Uses the embedding model's tiktoken encoding; without network access to
+fetch it, a word-level encoding built from the sample text stands in.
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+except ImportError:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+import tiktoken
+from config import EMBEDDING_MODEL
+from rag.token_chunker import TokenChunker, get_encoding
+
+WORDS = ("the service restart failed because the database connection pool was exhausted "
+         "check the runbook before escalating incident payment gateway timeout error "
+         "customers reported latency after deploy rollback resolved it").split()
+
+def sample_text(size_mb: float, seed: int = 0) -> str:
+    rng = np.random.default_rng(seed)
+    paragraphs = []
+    size = 0
+    while size < size_mb * 1024 * 1024:
+        sentences = []
+        for _ in range(rng.integers(3, 8)):
+            words = rng.choice(WORDS, rng.integers(6, 20))
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+def fallback_encoding():
+    """BPE over the benchmark vocabulary: every word prefix becomes a token."""
+    ranks = {bytes([i]): i for i in range(256)}
+    for word in WORDS + [w.capitalize() for w in WORDS]:
+        for piece in (word, " " + word):
+            data = piece.encode()
+            for end in range(2, len(data) + 1):
+                ranks.setdefault(data[:end], len(ranks))
+    return tiktoken.Encoding(
+        name="benchmark_words",
+        pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\w+| ?\d+| ?[^\s\w]+|\s+(?!\S)|\s+""",
+        mergeable_ranks=ranks,
+        special_tokens={}
+    )
+
+def timed(fn, repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(sizes=(1, 4, 8)):
+    try:
+        encoding = get_encoding(EMBEDDING_MODEL)
+    except Exception as e:
+        print(f"Using word-level stand-in encoding ({type(e).__name__})")
+        encoding = fallback_encoding()
+    tokens = TokenChunker(512, 64, encoding=encoding)
+    separators = ["\n\n", "\n", ". ", " ", ""]
+    # Same nominal window in characters (~4 characters per token)
+    chars = RecursiveCharacterTextSplitter(
+        chunk_size=2048, chunk_overlap=256, length_function=len, separators=separators)
+    measured = RecursiveCharacterTextSplitter(
+        chunk_size=512, chunk_overlap=64, separators=separators,
+        length_function=lambda t: len(encoding.encode_ordinary(t)))
+    print(f"{'size_mb':>8}{'chars_s':>10}{'measured_s':>12}{'tokens_s':>10}"
+          f"{'chunks':>8}{'max_tok':>9}")
+    for size_mb in sizes:
+        text = sample_text(size_mb)
+        chars_time = timed(lambda: chars.split_text(text))
+        measured_time = timed(lambda: measured.split_text(text))
+        tokens_time = timed(lambda: tokens.split_text(text))
+        chunks = tokens.split_text(text)
+        max_tokens = max(len(encoding.encode_ordinary(c)) for c in chunks)
+        print(f"{size_mb:>8}{chars_time:>10.3f}{measured_time:>12.3f}{tokens_time:>10.3f}"
+              f"{len(chunks):>8}{max_tokens:>9}")
+
+if __name__ == "__main__":
+    main([float(s) for s in sys.argv[1:]] or (1, 4, 8))
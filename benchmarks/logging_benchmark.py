@@ -0,0 +1,87 @@
+"""Time spent in the calling thread per log call: synchronous handlers vs. the queue.
+
+Compares the previous setup (structlog's JSON renderer, then a stdlib
+formatter and a synchronous file and console handler) with the one in
+``utils.logger`` (records queued unrendered, rendered once and written by a
+listener thread). Console output goes to /dev/null.
+
+    python benchmarks/logging_benchmark.py
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+import structlog
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logger import configure_logging
+
+def configure_synchronous(log_file: Path, stream):
+    """The logging setup before records went through a queue."""
+    # Importing utils.logger turned off the per-record fields it never renders
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = True
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            structlog.stdlib.add_logger_name,
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.processors.StackInfoRenderer(),
+            structlog.processors.format_exc_info,
+            structlog.processors.UnicodeDecoder(),
+            structlog.processors.JSONRenderer()
+        ],
+        context_class=dict,
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    root_logger = logging.getLogger()
+    for handler in (logging.FileHandler(log_file), logging.StreamHandler(stream)):
+        handler.setFormatter(formatter)
+        root_logger.addHandler(handler)
+
+def reset_root():
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+        handler.close()
+
+def run(calls: int) -> float:
+    """Microseconds per call, logging like an agent finishing a step."""
+    logger = structlog.get_logger("benchmark")
+    result = {"status": "success", "confidence": 0.82, "sources": ["runbook.md", "faq.md"]}
+    start = time.perf_counter()
+    for i in range(calls):
+        logger.info("Agent execution completed", agent="ReasoningAgent", request=i,
+                    execution_time=0.123, result=result)
+    return (time.perf_counter() - start) / calls * 1e6
+
+def main(calls: int = 20000):
+    reset_root()
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+        configure_synchronous(Path(directory) / "sync.log", devnull)
+        synchronous = run(calls)
+        reset_root()
+
+        listener = configure_logging(Path(directory) / "queued.log", "INFO", devnull,
+                                     queue_size=calls + 1)
+        queued = run(calls)
+        start = time.perf_counter()
+        listener.stop()
+        drain = time.perf_counter() - start
+        reset_root()
+
+    print(f"{calls} INFO calls")
+    print(f"{'pipeline':>14}{'us/call':>10}")
+    print(f"{'synchronous':>14}{synchronous:>10.1f}")
+    print(f"{'queued':>14}{queued:>10.1f}")
+    print(f"writer thread drained the queue {drain * 1000:.0f} ms after the last call")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Latency of MMR re-ranking over typical candidate pool sizes.
+
+    python benchmarks/mmr_benchmark.py
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag.mmr import maximal_marginal_relevance
+
+def main(dim: int = 3072, k: int = 5, repeats: int = 200):
+    rng = np.random.default_rng(0)
+    print(f"dim={dim} k={k}")
+    print(f"{'candidates':>10}{'us/call':>10}")
+    for n in (20, 50, 100, 200):
+        candidates = rng.normal(size=(n, dim)).astype(np.float32)
+        groups = [f"doc{i % 7}" for i in range(n)]
+        query = rng.normal(size=dim).astype(np.float32)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            maximal_marginal_relevance(query, candidates, k, groups=groups, max_per_group=2)
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"{n:>10}{elapsed * 1e6:>10.0f}")
+
+if __name__ == "__main__":
+    main()
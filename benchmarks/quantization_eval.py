@@ -0,0 +1,97 @@
+"""Recall and memory evaluation for quantized two-stage search.
+
+Compares each quantization setting against exact float32 search and reports
+recall@k, bytes per vector held in RAM and mean query latency.
+
+    python benchmarks/quantization_eval.py                      # synthetic data
+    python benchmarks/quantization_eval.py --vectors emb.npy    # real embeddings
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag.quantization import Quantizer, top_k, truncate_dims, two_stage_search
+
+SETTINGS = [
+    ("int8", None),
+    ("int8", 1024),
+    ("int8", 768),
+    ("int8", 384),
+    ("binary", None),
+    ("binary", 1536),
+]
+
+def synthetic_embeddings(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors whose energy decays across dimensions.
+
+    The decay mimics Matryoshka-trained models, where leading dimensions
+    carry most of the signal.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 50), dim))
+    vectors = centers[rng.integers(0, len(centers), n)] + 1.5 * rng.normal(size=(n, dim))
+    vectors *= np.exp(-np.arange(dim) / (dim / 3.0))
+    return truncate_dims(vectors, None)
+
+def make_queries(corpus: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Noisy copies of corpus rows, so every query has true neighbours."""
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, len(corpus), count)]
+    noise = rng.normal(scale=0.8 / np.sqrt(corpus.shape[1]), size=picks.shape)
+    return truncate_dims(picks + noise, None)
+
+def evaluate(corpus: np.ndarray, queries: np.ndarray, mode: str, dims, k: int,
+             oversample: int) -> dict:
+    """Recall@k of two-stage search against exact search."""
+    quantizer = Quantizer(mode, dims)
+    codes = quantizer.encode(corpus)
+    hits = 0
+    elapsed = 0.0
+    for query in queries:
+        expected = set(top_k(corpus @ query, k).tolist())
+        start = time.perf_counter()
+        _, rows = two_stage_search(quantizer, codes, corpus, query, k, oversample)
+        elapsed += time.perf_counter() - start
+        hits += len(expected & set(rows.tolist()))
+    return {
+        "recall": hits / (k * len(queries)),
+        "bytes": quantizer.bytes_per_vector(corpus.shape[1]),
+        "query_ms": 1000 * elapsed / len(queries),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", help=".npy file of corpus embeddings")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--oversample", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.vectors:
+        corpus = truncate_dims(np.load(args.vectors), None)
+    else:
+        corpus = synthetic_embeddings(args.size, args.dim)
+    queries = make_queries(corpus, args.queries)
+    full_bytes = corpus.shape[1] * 4
+
+    print(f"corpus={len(corpus)} dim={corpus.shape[1]} k={args.k} oversample={args.oversample}")
+    print(f"{'setting':<16}{'bytes/vec':>10}{'RAM saving':>12}{'recall@k':>10}{'ms/query':>10}")
+    start = time.perf_counter()
+    for query in queries:
+        top_k(corpus @ query, args.k)
+    exact_ms = 1000 * (time.perf_counter() - start) / len(queries)
+    print(f"{'float32 exact':<16}{full_bytes:>10}{1.0:>11.1f}x{1.0:>10.3f}{exact_ms:>10.2f}")
+    for mode, dims in SETTINGS:
+        result = evaluate(corpus, queries, mode, dims, args.k, args.oversample)
+        label = f"{mode}/{dims or 'full'}"
+        print(f"{label:<16}{result['bytes']:>10}{full_bytes / result['bytes']:>11.1f}x"
+              f"{result['recall']:>10.3f}{result['query_ms']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
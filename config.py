@@ -30,8 +30,95 @@ EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
 # RAG Configuration
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+CHUNK_LENGTH_UNIT = os.getenv("CHUNK_LENGTH_UNIT", "chars")  # chars, tokens (embedding model tokenizer)
+# Streaming ingestion of large text files
+STREAM_WINDOW_MB = float(os.getenv("STREAM_WINDOW_MB", "4"))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "256"))  # chunks per vector store write
+# Chunk deduplication at index time (exact hash + MinHash LSH)
+CHUNK_DEDUP = os.getenv("CHUNK_DEDUP", "false").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))  # estimated Jaccard similarity
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+# Keep chunk text in a compressed store beside the index instead of in it
+CHUNK_TEXT_STORE = os.getenv("CHUNK_TEXT_STORE", "false").lower() == "true"
+# Parent sections around child chunks (0 disables), in CHUNK_LENGTH_UNIT
+PARENT_CHUNK_SIZE = int(os.getenv("PARENT_CHUNK_SIZE", "0"))
+REASONING_CONTEXT_TOKENS = int(os.getenv("REASONING_CONTEXT_TOKENS", "1500"))  # knowledge budget in the reasoning prompt
 MAX_CONTEXT_LENGTH = int(os.getenv("MAX_CONTEXT_LENGTH", "8000"))
 
+# Vector index backend: "chroma", "faiss" or "quantized"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+FAISS_INDEX_DIR = VECTOR_STORE_DIR / "faiss"
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")  # flat, hnsw, ivfpq
+FAISS_USE_MMAP = os.getenv("FAISS_USE_MMAP", "true").lower() == "true"
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "1024"))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "64"))
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", "8"))
+QUANTIZED_INDEX_DIR = VECTOR_STORE_DIR / "quantized"
+QUANTIZATION_MODE = os.getenv("QUANTIZATION_MODE", "int8")  # int8, binary
+QUANTIZATION_DIMS = int(os.getenv("QUANTIZATION_DIMS", "768"))  # 0 keeps all dimensions
+QUANTIZATION_OVERSAMPLE = int(os.getenv("QUANTIZATION_OVERSAMPLE", "10"))
+# Per-tenant indexes live under TENANTS_DIR/<tenant_id>/<backend>
+TENANTS_DIR = VECTOR_STORE_DIR / "tenants"
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "16"))  # tenant indexes kept open
+
+# Retrieval policy (scores are cosine similarities)
+RETRIEVAL_BASE_K = int(os.getenv("RETRIEVAL_BASE_K", "5"))
+RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", "10"))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.3"))
+RETRIEVAL_SCORE_GAP = float(os.getenv("RETRIEVAL_SCORE_GAP", "0.15"))
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))  # 1.0 disables MMR
+RETRIEVAL_FETCH_FACTOR = int(os.getenv("RETRIEVAL_FETCH_FACTOR", "4"))
+RETRIEVAL_MAX_PER_SOURCE = int(os.getenv("RETRIEVAL_MAX_PER_SOURCE", "2"))  # 0 disables the cap
+# Metadata fields indexed for filtered search (FAISS and quantized backends)
+METADATA_INDEX_FIELDS = [f.strip() for f in os.getenv(
+    "METADATA_INDEX_FIELDS", "source,type,pages,slides").split(",") if f.strip()]
+
+# Blue/green index builds
+INDEX_VERSIONS_KEEP = int(os.getenv("INDEX_VERSIONS_KEEP", "3"))
+INDEX_SWAP_CHECK_SECONDS = float(os.getenv("INDEX_SWAP_CHECK_SECONDS", "2"))
+
+# Background indexing of changes under DOCUMENTS_DIR
+DOCUMENT_WATCHER = os.getenv("DOCUMENT_WATCHER", "false").lower() == "true"
+WATCH_NATIVE = os.getenv("WATCH_NATIVE", "true").lower() == "true"  # inotify via watchdog when installed
+WATCH_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", "2"))
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "1.5"))
+WATCH_STATE_FILE = VECTOR_STORE_DIR / "watch_manifest.json"
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "200"))  # POST /api/documents
+
+# Query embedding cache and micro-batching
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "2"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "64"))
+# Cache tier shared by the worker processes of one host (SQLite, WAL)
+SHARED_CACHE = os.getenv("SHARED_CACHE", "true").lower() == "true"  # query embeddings
+SHARED_CACHE_PATH = DATA_DIR / "cache.db"
+SHARED_CACHE_MB = float(os.getenv("SHARED_CACHE_MB", "256"))
+LLM_CACHE = os.getenv("LLM_CACHE", "false").lower() == "true"  # identical prompts reuse responses
+
+# Event stream fan-out: each subscriber drains its own bounded queue
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+EVENT_QUEUE_POLICY = os.getenv("EVENT_QUEUE_POLICY", "drop_oldest")  # or "coalesce"
+EVENT_HISTORY_MB = float(os.getenv("EVENT_HISTORY_MB", "8"))  # memory for recent events
+EVENT_SSE_HEARTBEAT_SECONDS = float(os.getenv("EVENT_SSE_HEARTBEAT_SECONDS", "15"))
+# Cross-process event delivery: "local" (one process) or "unix" (socket broker between workers)
+EVENT_TRANSPORT = os.getenv("EVENT_TRANSPORT", "local")
+EVENT_SOCKET_PATH = DATA_DIR / "events.sock"
+# Event payloads: "summary" projects agent events to their key fields, "full" keeps all
+EVENT_PAYLOAD_MODE = os.getenv("EVENT_PAYLOAD_MODE", "summary")
+EVENT_PAYLOAD_MAX_BYTES = int(os.getenv("EVENT_PAYLOAD_MAX_BYTES", "16384"))
+EVENT_FULL_PAYLOADS = int(os.getenv("EVENT_FULL_PAYLOADS", "500"))  # kept for /api/events/{seq}/payload
+# Durable event log for replay after restarts (SQLite, written off the request path)
+EVENT_LOG = os.getenv("EVENT_LOG", "false").lower() == "true"
+EVENT_LOG_PATH = DATA_DIR / "events.db"
+EVENT_LOG_MAX_MB = float(os.getenv("EVENT_LOG_MAX_MB", "512"))
+EVENT_LOG_RETENTION_HOURS = float(os.getenv("EVENT_LOG_RETENTION_HOURS", "168"))
+EVENT_LOG_FLUSH_MS = float(os.getenv("EVENT_LOG_FLUSH_MS", "200"))
+
 # Memory Configuration
 MEMORY_TYPES = ["working", "episodic", "semantic"]
 MAX_WORKING_MEMORY_SIZE = 5000
@@ -45,10 +132,24 @@ CONTENT_FILTER_CATEGORIES = ["violence", "self_harm", "sexual", "hate", "jailbre
 # Server Configuration
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8000"))
+WORKERS = int(os.getenv("WORKERS", "1"))  # server processes started by run.py
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "10"))  # seconds a worker waits on a locked database
 
 # Logging Configuration
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FILE = LOGS_DIR / "agent_system.log"
+LOG_MAX_MB = float(os.getenv("LOG_MAX_MB", "50"))  # rotate the log file beyond this size
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))  # gzip-compressed rotated files kept
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # records waiting for the writer thread
+# Sampling of hot-path INFO/DEBUG logs, decided per request; warnings, errors and
+# slow calls always pass. By default only working memory reads and similarity
+# searches are sampled. Rules are "target=rate" or "target=N/s", comma-separated;
+# a target is a logger (covering its children, "*" for all) or "logger:event", e.g.
+# "memory.memory_store=0.1,rag.vector_store:Similarity search completed=20/s"
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "true").lower() == "true"
+LOG_SAMPLING_RULES = os.getenv("LOG_SAMPLING_RULES", "")  # added to (or overriding) the defaults
+LOG_SLOW_MS = float(os.getenv("LOG_SLOW_MS", "1000"))  # events with a larger duration_ms are never sampled
+LOG_SUPPRESSED_REPORT_SECONDS = float(os.getenv("LOG_SUPPRESSED_REPORT_SECONDS", "60"))
 
 # Supported file types
 SUPPORTED_FILE_TYPES = {
@@ -1,9 +1,10 @@
 """Memory store for Working, Episodic, and Semantic memory."""
 import sqlite3
 import json
+import time
 from typing import Dict, List, Any, Optional
 from enum import Enum
-from config import MEMORY_DB_PATH, MAX_WORKING_MEMORY_SIZE
+from config import MEMORY_DB_PATH, MAX_WORKING_MEMORY_SIZE, SQLITE_BUSY_TIMEOUT
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -22,11 +23,18 @@ class MemoryStore:
         self._initialize_db()
         logger.info("MemoryStore initialized", db_path=str(self.db_path))
     
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection that waits for other workers' writes instead of failing."""
+        return sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT)
+    
     def _initialize_db(self):
         """Initialize database tables."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
+        # WAL lets server workers read while another writes (the mode persists in the file)
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
         # Working memory table (short-lived, task-level)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS working_memory (
@@ -82,7 +90,7 @@ class MemoryStore:
     
     def write_working_memory(self, session_id: str, key: str, value: Any, ttl: Optional[int] = None):
         """Write to working memory."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         expires_at = None
@@ -102,7 +110,8 @@ class MemoryStore:
     
     def read_working_memory(self, session_id: str, key: Optional[str] = None) -> Dict[str, Any]:
         """Read from working memory."""
-        conn = sqlite3.connect(self.db_path)
+        started = time.perf_counter()
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Clean expired entries
@@ -127,12 +136,13 @@ class MemoryStore:
             memory[row[0]] = json.loads(row[1])
         
         logger.info("Working memory read", session_id=session_id, 
-                   key=key, count=len(memory))
+                   key=key, count=len(memory),
+                   duration_ms=round((time.perf_counter() - started) * 1000, 1))
         return memory
     
     def clear_working_memory(self, session_id: str):
         """Clear working memory for a session."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute("DELETE FROM working_memory WHERE session_id = ?", (session_id,))
         conn.commit()
@@ -149,7 +159,7 @@ class MemoryStore:
         metadata: Optional[Dict] = None
     ) -> int:
         """Write to episodic memory."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -180,7 +190,7 @@ class MemoryStore:
         limit: int = 10
     ) -> List[Dict[str, Any]]:
         """Read from episodic memory."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         query = "SELECT * FROM episodic_memory WHERE 1=1"
@@ -223,7 +233,7 @@ class MemoryStore:
         metadata: Optional[Dict] = None
     ):
         """Write to semantic memory."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -250,7 +260,7 @@ class MemoryStore:
         limit: int = 10
     ) -> List[Dict[str, Any]]:
         """Read from semantic memory."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         if key:
@@ -305,7 +315,7 @@ class MemoryStore:
     
     def delete_memory(self, memory_type: MemoryType, memory_id: int) -> bool:
         """Delete a memory entry."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         table_map = {
@@ -329,7 +339,7 @@ class MemoryStore:
     
     def get_all_memories(self, memory_type: MemoryType, limit: int = 100) -> List[Dict[str, Any]]:
         """Get all memories of a type (for UI display)."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         table_map = {
@@ -1,4 +1,9 @@
 """Observability module."""
+from .context import request_context, current_request_id, current_session_id
+from .event_history import EventHistory
+from .event_log import EventLog
 from .event_stream import EventStream, event_stream
+from .payloads import Event, PayloadPolicy
 
-__all__ = ["EventStream", "event_stream"]
+__all__ = ["EventStream", "event_stream", "EventHistory", "EventLog", "Event", "PayloadPolicy", "request_context",
+           "current_request_id", "current_session_id"]
@@ -0,0 +1,24 @@
+"""Request and session ids carried through async calls for event tagging."""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+session_id_var: ContextVar[Optional[str]] = ContextVar("session_id", default=None)
+
+def current_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+def current_session_id() -> Optional[str]:
+    return session_id_var.get()
+
+@contextmanager
+def request_context(request_id: Optional[str], session_id: Optional[str] = None) -> Iterator[None]:
+    """Tag events emitted inside the block (and tasks it starts) with these ids."""
+    request_token = request_id_var.set(request_id)
+    session_token = session_id_var.set(session_id)
+    try:
+        yield
+    finally:
+        session_id_var.reset(session_token)
+        request_id_var.reset(request_token)
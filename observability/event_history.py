@@ -0,0 +1,112 @@
+"""Bounded in-memory event history with indexed lookups."""
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from config import EVENT_HISTORY_MB
+from observability.payloads import to_json
+
+# Event fields (or ``data`` fields) that queries can filter on without a scan
+INDEXED_FIELDS = ("request_id", "session_id", "agent", "type")
+
+def event_keys(event: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    """``(field, value)`` pairs of the event's ``INDEXED_FIELDS`` that are set."""
+    data = event.get("data")
+    data = data if isinstance(data, dict) else {}
+    keys = []
+    for field in INDEXED_FIELDS:
+        value = event.get(field, data.get(field))
+        if value is not None and not isinstance(value, (dict, list)):
+            keys.append((field, value))
+    return keys
+
+def event_size(event: Dict[str, Any]) -> int:
+    """Approximate memory held by an event: the length of its JSON form."""
+    return len(to_json(event))
+
+class EventHistory:
+    """Ring buffer of recent events, sized by memory rather than count.
+
+    Events are numbered by ``seq`` and appended in O(1); once the events
+    held exceed ``max_bytes`` the oldest are evicted. Each indexed field
+    value keeps its own deque of sequence numbers, oldest first, so evicting
+    an event pops it from the head of its index entries and a filtered query
+    walks only the matching events (of the most selective filter).
+    """
+
+    def __init__(self, max_bytes: int = int(EVENT_HISTORY_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._order: Deque[int] = deque()
+        self._events: Dict[int, Tuple[int, Dict[str, Any]]] = {}
+        self._index: Dict[Tuple[str, Any], Deque[int]] = {}
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    _keys = staticmethod(event_keys)
+
+    def append(self, event: Dict[str, Any], size: Optional[int] = None):
+        """Add an event (with a unique, increasing ``seq``)."""
+        seq = event["seq"]
+        size = event_size(event) if size is None else size
+        self._order.append(seq)
+        self._events[seq] = (size, event)
+        self.total_bytes += size
+        for key in self._keys(event):
+            self._index.setdefault(key, deque()).append(seq)
+        # Always keep the newest event, however large
+        while self.total_bytes > self.max_bytes and len(self._order) > 1:
+            self._evict()
+
+    def _evict(self):
+        seq = self._order.popleft()
+        size, event = self._events.pop(seq)
+        self.total_bytes -= size
+        for key in self._keys(event):
+            seqs = self._index[key]
+            seqs.popleft()
+            if not seqs:
+                del self._index[key]
+        self.evicted += 1
+
+    def query(
+        self,
+        limit: int = 100,
+        since: Optional[int] = None,
+        **filters: Any
+    ) -> List[Dict[str, Any]]:
+        """Newest ``limit`` events matching every filter, oldest first.
+
+        Filters are the ``INDEXED_FIELDS`` (``type`` is the event type);
+        ``since`` keeps only events with a larger ``seq``.
+        """
+        unknown = set(filters) - set(INDEXED_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot filter events by: {', '.join(sorted(unknown))}")
+        filters = {field: value for field, value in filters.items() if value is not None}
+        if filters:
+            candidates = [self._index.get((field, value), ()) for field, value in filters.items()]
+            seqs = min(candidates, key=len)
+        else:
+            seqs = self._order
+        matches = []
+        for seq in reversed(seqs):
+            if len(matches) >= limit or (since is not None and seq <= since):
+                break
+            event = self._events[seq][1]
+            if all((field, value) in self._keys(event) for field, value in filters.items()):
+                matches.append(event)
+        matches.reverse()
+        return matches
+
+    def clear(self):
+        self._order.clear()
+        self._events.clear()
+        self._index.clear()
+        self.total_bytes = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"events": len(self._order), "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes, "evicted": self.evicted,
+                "oldest_seq": self._order[0] if self._order else None,
+                "newest_seq": self._order[-1] if self._order else None}
@@ -0,0 +1,225 @@
+"""Durable append-only event log in SQLite, written by a background thread."""
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Union
+from config import (
+    EVENT_LOG_PATH, EVENT_LOG_MAX_MB, EVENT_LOG_RETENTION_HOURS, EVENT_LOG_FLUSH_MS
+)
+from observability.payloads import to_json
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Retention is enforced at most this often
+RETENTION_CHECK_SECONDS = 60.0
+# Share of the oldest events removed when the log is over its size budget
+TRIM_FRACTION = 0.1
+
+TimeBound = Union[None, float, str, datetime]
+
+def to_epoch(value: TimeBound) -> Optional[float]:
+    """Epoch seconds from an epoch number, ISO 8601 string or datetime."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+class EventLog:
+    """Append-only log of every emitted event, kept across restarts.
+
+    ``append`` only queues the event; a writer thread commits queued events
+    in one transaction every ``flush_ms`` (WAL with ``synchronous=NORMAL``,
+    so a commit is an append to the WAL and the fsync happens at checkpoints).
+    Events older than ``retention_hours`` are deleted, and the oldest ones
+    are trimmed whenever the live data exceeds ``max_mb``. ``replay`` reads
+    events back by sequence number, time range, request or session.
+    """
+
+    def __init__(
+        self,
+        path: Path = EVENT_LOG_PATH,
+        max_mb: float = EVENT_LOG_MAX_MB,
+        retention_hours: float = EVENT_LOG_RETENTION_HOURS,
+        flush_ms: float = EVENT_LOG_FLUSH_MS
+    ):
+        self.path = Path(path)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.retention_seconds = retention_hours * 3600
+        self.flush_seconds = max(flush_ms, 1) / 1000
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                type TEXT NOT NULL,
+                request_id TEXT,
+                session_id TEXT,
+                agent TEXT,
+                payload TEXT NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS events_ts ON events (ts)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS events_request ON events (request_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS events_session ON events (session_id)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._pending: Deque[tuple] = deque()
+        self._wakeup = threading.Condition()
+        self._flushed = threading.Condition()
+        self._writing = False
+        self._closed = False
+        self._next_retention = 0.0
+        self.stats = {"appended": 0, "written": 0, "batches": 0, "trimmed": 0, "failed": 0}
+        self._writer = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+        self._writer.start()
+        logger.info("Event log opened", path=str(self.path), last_seq=self.last_seq())
+
+    def last_seq(self) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT MAX(seq) FROM events").fetchone()
+        return row[0] or 0
+
+    def append(self, event: Dict[str, Any], payload: Optional[str] = None):
+        """Queue ``event`` for writing (never blocks on disk)."""
+        data = event.get("data")
+        agent = data.get("agent") if isinstance(data, dict) else None
+        self._pending.append((
+            event["seq"], time.time(), event["type"], event.get("request_id"),
+            event.get("session_id"), agent if isinstance(agent, str) else None,
+            payload if payload is not None else to_json(event)
+        ))
+        self.stats["appended"] += 1
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued event has been written."""
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            while self._pending or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                with self._wakeup:
+                    self._wakeup.notify()
+                self._flushed.wait(min(remaining, self.flush_seconds))
+        return True
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                if not self._pending and not self._closed:
+                    self._wakeup.wait(self.flush_seconds)
+            if self._closed and not self._pending:
+                return
+            # Let a burst of events gather into one transaction
+            time.sleep(self.flush_seconds if len(self._pending) < 512 else 0)
+            self._write_batch()
+
+    def _write_batch(self):
+        with self._flushed:
+            self._writing = True
+        batch = []
+        try:
+            while self._pending:
+                batch.append(self._pending.popleft())
+            if batch:
+                with self._lock:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO events "
+                        "(seq, ts, type, request_id, session_id, agent, payload) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                    self._db.commit()
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+            if time.monotonic() >= self._next_retention:
+                self._next_retention = time.monotonic() + RETENTION_CHECK_SECONDS
+                self.enforce_retention()
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            logger.error("Event log write failed", events=len(batch), error=str(e))
+        finally:
+            with self._flushed:
+                self._writing = False
+                self._flushed.notify_all()
+
+    def enforce_retention(self):
+        """Delete events past the age limit, then the oldest while over the size budget."""
+        with self._lock:
+            trimmed = 0
+            if self.retention_seconds > 0:
+                cursor = self._db.execute("DELETE FROM events WHERE ts < ?",
+                                          (time.time() - self.retention_seconds,))
+                trimmed += cursor.rowcount
+            while self.max_bytes > 0 and self._live_bytes() > self.max_bytes:
+                count = self._db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+                if count <= 1:
+                    break
+                cursor = self._db.execute(
+                    "DELETE FROM events WHERE seq IN "
+                    "(SELECT seq FROM events ORDER BY seq LIMIT ?)",
+                    (max(1, int(count * TRIM_FRACTION)),))
+                trimmed += cursor.rowcount
+                self._db.commit()
+            self._db.commit()
+        if trimmed:
+            self.stats["trimmed"] += trimmed
+            logger.info("Event log trimmed", events=trimmed)
+
+    def _live_bytes(self) -> int:
+        """Bytes of the database in use (freed pages are reused, not counted)."""
+        page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        pages = self._db.execute("PRAGMA page_count").fetchone()[0]
+        free = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def replay(
+        self,
+        since: Optional[int] = None,
+        start: TimeBound = None,
+        end: TimeBound = None,
+        request_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        """Logged events matching every given bound, oldest first.
+
+        ``since`` keeps events after that sequence number (to catch up after
+        a reconnect); ``start``/``end`` bound the time they were emitted.
+        """
+        self.flush()
+        clauses, params = [], []
+        for clause, value in (("seq > ?", since), ("ts >= ?", to_epoch(start)),
+                              ("ts <= ?", to_epoch(end)), ("request_id = ?", request_id),
+                              ("session_id = ?", session_id)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT payload FROM events {where} ORDER BY seq LIMIT ?",
+                params + [limit]).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            live_bytes = self._live_bytes()
+        return {**self.stats, "pending": len(self._pending), "bytes": live_bytes,
+                "max_bytes": self.max_bytes}
+
+    def close(self):
+        self._closed = True
+        with self._wakeup:
+            self._wakeup.notify()
+        self._writer.join(timeout=5)
+        with self._lock:
+            self._db.close()
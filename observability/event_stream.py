@@ -1,64 +1,483 @@
 """Event streaming for real-time observability."""
 import asyncio
-from typing import Dict, Any, List, Callable
+import itertools
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Callable, Hashable, Optional, Tuple
 from datetime import datetime
+from config import EVENT_QUEUE_SIZE, EVENT_QUEUE_POLICY, EVENT_LOG, EVENT_FULL_PAYLOADS
+from observability.context import current_request_id, current_session_id
+from observability.event_history import INDEXED_FIELDS, EventHistory, event_keys
+from observability.event_log import EventLog, TimeBound, to_epoch
+from observability.payloads import Event, PayloadPolicy, default_policies, to_json
+from observability.transport import UnixSocketTransport, create_transport
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+POLICIES = (DROP_OLDEST, COALESCE)
+# Events held while the transport reconnects; beyond this the oldest are dropped
+MAX_UNSENT_EVENTS = 1000
+
+def default_coalesce_key(event: Dict[str, Any]) -> Hashable:
+    """Events that supersede each other: same type, about the same agent or job."""
+    data = event.get("data") or {}
+    return (event["type"], data.get("agent"), data.get("id"))
+
+def normalize_subscription(subscription: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate a subscription: exact values for some of the ``INDEXED_FIELDS``."""
+    unknown = set(subscription) - set(INDEXED_FIELDS)
+    if unknown:
+        raise ValueError(f"Cannot subscribe by: {', '.join(sorted(unknown))}")
+    subscription = {field: value for field, value in subscription.items() if value is not None}
+    if not subscription:
+        raise ValueError("A subscription needs at least one of: " + ", ".join(INDEXED_FIELDS))
+    for field, value in subscription.items():
+        if isinstance(value, (dict, list)):
+            raise ValueError(f"Subscription value for {field} must be a single value")
+    return subscription
+
+class _Subscriber:
+    """A callback with its own bounded queue, drained by its own task."""
+
+    def __init__(
+        self,
+        callback: Callable,
+        max_queue: int,
+        policy: str,
+        coalesce_key: Callable[[Dict[str, Any]], Hashable]
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown event queue policy: {policy}")
+        self.callback = callback
+        # Events wanted (each a set of exact field values); none means all
+        self.subscriptions: List[Dict[str, Any]] = []
+        self.name = getattr(callback, "__qualname__", repr(callback))
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.coalesce_key = coalesce_key
+        # Sequence number -> (enqueued at, event), oldest first
+        self.pending: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Coalesce key -> sequence number of its pending event
+        self.keys: Dict[Hashable, int] = {}
+        self.seq = 0
+        self.task: Optional[asyncio.Task] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.busy = False
+        self.stats = {"delivered": 0, "dropped": 0, "coalesced": 0, "failed": 0,
+                      "max_depth": 0, "max_lag_ms": 0.0, "last_lag_ms": None}
+
+    def put(self, event: Dict[str, Any]):
+        now = time.monotonic()
+        if self.policy == COALESCE:
+            key = self.coalesce_key(event)
+            seq = self.keys.get(key)
+            if seq is not None and seq in self.pending:
+                # Keep its place in line, but with the newer state
+                self.pending[seq] = (self.pending[seq][0], event)
+                self.stats["coalesced"] += 1
+                return
+            self.keys[key] = self.seq
+        self.pending[self.seq] = (now, event)
+        self.seq += 1
+        while len(self.pending) > self.max_queue:
+            self._pop()
+            self.stats["dropped"] += 1
+        self.stats["max_depth"] = max(self.stats["max_depth"], len(self.pending))
+        self._ensure_task()
+        self.wakeup.set()
+
+    def _pop(self) -> Tuple[float, Dict[str, Any]]:
+        seq, item = self.pending.popitem(last=False)
+        if self.policy == COALESCE:
+            key = self.coalesce_key(item[1])
+            if self.keys.get(key) == seq:
+                del self.keys[key]
+        return item
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            # First event, or the previous loop is gone (e.g. after asyncio.run)
+            self.wakeup = asyncio.Event()
+            self.task = loop.create_task(self._drain())
+
+    async def _drain(self):
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            enqueued, event = self._pop()
+            lag_ms = (time.monotonic() - enqueued) * 1000
+            self.stats["last_lag_ms"] = round(lag_ms, 2)
+            self.stats["max_lag_ms"] = round(max(self.stats["max_lag_ms"], lag_ms), 2)
+            self.busy = True
+            try:
+                outcome = self.callback(event)
+                if asyncio.iscoroutine(outcome):
+                    await outcome
+                self.stats["delivered"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error("Event callback failed", subscriber=self.name, error=str(e))
+            finally:
+                self.busy = False
+
+    def metrics(self) -> Dict[str, Any]:
+        oldest = next(iter(self.pending.values()), None)
+        return {
+            "subscriber": self.name,
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "depth": len(self.pending),
+            "subscriptions": list(self.subscriptions),
+            "lag_ms": round((time.monotonic() - oldest[0]) * 1000, 2) if oldest else 0.0,
+            **self.stats
+        }
+
+    def stop(self):
+        if self.task is not None and not self.task.done():
+            try:
+                self.task.cancel()
+            except RuntimeError:
+                pass  # its loop is already closed
+        self.task = None
+
 class EventStream:
-    """Manages real-time event streaming for observability."""
-    
-    def __init__(self):
-        self.subscribers: List[Callable] = []
-        self.event_history: List[Dict[str, Any]] = []
-        self.max_history = 1000
+    """Manages real-time event streaming for observability.
+
+    ``emit`` never waits for subscribers: each one gets a bounded queue
+    drained by its own task, so a slow consumer (say, a WebSocket client on
+    a bad connection) only falls behind itself. When a queue is full the
+    ``drop_oldest`` policy discards its oldest event; ``coalesce`` first
+    replaces a pending event with the same coalesce key (by default the
+    event type and agent or job id), so a lagging consumer gets the latest
+    state instead of every intermediate one. ``metrics`` reports each
+    subscriber's depth, lag and drops.
+
+    Events are numbered (``seq``) and tagged with the request and session
+    they were emitted for (see ``observability.context``); recent ones are
+    kept in an ``EventHistory`` that ``get_history`` queries by those ids,
+    agent or event type. With an ``EventLog`` every event is also persisted
+    (in the background) and numbering continues across restarts, so
+    ``replay`` can go back further than memory holds.
+
+    Each event's data is first reduced by the ``PayloadPolicy`` for its type
+    (a summary of selected fields and/or a size limit). When something was
+    left out the event is marked ``truncated`` and the full data is kept,
+    unserialized, for the last ``max_full_payloads`` events; ``full_payload``
+    serializes it on request. Published events are ``Event`` objects that
+    serialize once for history, log and every client.
+
+    A subscriber can narrow what it receives to a list of subscriptions
+    (e.g. ``{"session_id": "s1"}`` or ``{"agent": "reasoning", "type":
+    "agent_complete"}``); it then gets the events matching any of them. Each
+    subscription is indexed under one of its field values, so an event is
+    only matched against subscriptions sharing one of its own values, and
+    subscribers without subscriptions get everything.
+
+    With a ``transport`` (see ``observability.transport``), events emitted
+    by any worker process are delivered to the subscribers of all of them:
+    ``emit`` hands the event to the transport, which numbers it and brings
+    it back to every worker. An event is kept until it comes back numbered,
+    up to ``MAX_UNSENT_EVENTS``: while the transport is disconnected (e.g.
+    during a broker election) events are held back, and on reconnecting
+    every event not back yet is published again, so every event is numbered
+    by the broker and none is logged under a local ``seq``. An event sent
+    just before a connection was lost may be numbered twice.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = EVENT_QUEUE_SIZE,
+        policy: str = EVENT_QUEUE_POLICY,
+        history: Optional[EventHistory] = None,
+        log: Optional[EventLog] = None,
+        payload_policies: Optional[Dict[str, PayloadPolicy]] = None,
+        max_full_payloads: int = EVENT_FULL_PAYLOADS,
+        transport: Optional[UnixSocketTransport] = None
+    ):
+        self.subscribers: List[_Subscriber] = []
+        # (field, value) -> subscriptions indexed under it, with their subscriber
+        self._subscription_index: Dict[Tuple[str, Any], List[Tuple[_Subscriber, Dict[str, Any]]]] = {}
+        self.payload_policies = (payload_policies if payload_policies is not None
+                                 else default_policies())
+        self.default_policy = PayloadPolicy()
+        self.max_full_payloads = max_full_payloads
+        # seq -> full data of truncated events (serialized on first request)
+        self._full: "OrderedDict[int, Any]" = OrderedDict()
+        self.history = history if history is not None else EventHistory()
+        self.log = log
+        self._seq = log.last_seq() if log is not None else 0
+        self.transport = transport
+        # Events of this process not numbered by the broker yet, by origin id:
+        # (JSON, full data when truncated)
+        self._origin = itertools.count(1)
+        self._in_flight: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()
+        # Origins of those not handed to the current connection yet
+        self._unsent: "deque[str]" = deque()
+        self.unsent_dropped = 0
+        self.max_queue = max_queue
+        self.policy = policy
         logger.info("EventStream initialized")
-    
-    def subscribe(self, callback: Callable):
-        """Subscribe to events."""
-        self.subscribers.append(callback)
+
+    def subscribe(
+        self,
+        callback: Callable,
+        max_queue: Optional[int] = None,
+        policy: Optional[str] = None,
+        coalesce_key: Callable[[Dict[str, Any]], Hashable] = default_coalesce_key,
+        subscriptions: Optional[List[Dict[str, Any]]] = None
+    ):
+        """Subscribe to events (``callback`` may be sync or async).
+
+        ``subscriptions`` limits delivery to matching events (see
+        ``set_subscriptions``); by default every event is delivered.
+        """
+        subscriber = _Subscriber(
+            callback,
+            max_queue if max_queue is not None else self.max_queue,
+            policy or self.policy,
+            coalesce_key
+        )
+        self.subscribers.append(subscriber)
+        if subscriptions:
+            self.set_subscriptions(callback, subscriptions)
         logger.info("New subscriber added", total_subscribers=len(self.subscribers))
-    
+
     def unsubscribe(self, callback: Callable):
         """Unsubscribe from events."""
-        if callback in self.subscribers:
-            self.subscribers.remove(callback)
+        subscriber = self._find(callback)
+        if subscriber is not None:
+            self._unindex(subscriber)
+            subscriber.stop()
+            self.subscribers.remove(subscriber)
             logger.info("Subscriber removed", total_subscribers=len(self.subscribers))
-    
+
+    def set_subscriptions(
+        self,
+        callback: Callable,
+        subscriptions: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Deliver to ``callback`` only events matching one of ``subscriptions``.
+
+        A subscription maps ``INDEXED_FIELDS`` (``type`` being the event type)
+        to exact values; an empty list restores delivery of every event.
+        Raises ``ValueError`` for invalid subscriptions.
+        """
+        subscriber = self._find(callback)
+        if subscriber is None:
+            raise ValueError("Not subscribed")
+        normalized = []
+        for subscription in subscriptions:
+            subscription = normalize_subscription(subscription)
+            if subscription not in normalized:
+                normalized.append(subscription)
+        self._unindex(subscriber)
+        subscriber.subscriptions = normalized
+        for subscription in normalized:
+            # Indexed under its most selective field
+            field = next(f for f in INDEXED_FIELDS if f in subscription)
+            self._subscription_index.setdefault((field, subscription[field]), []).append(
+                (subscriber, subscription))
+        return list(normalized)
+
+    def _find(self, callback: Callable) -> Optional[_Subscriber]:
+        return next((s for s in self.subscribers if s.callback == callback), None)
+
+    def _unindex(self, subscriber: _Subscriber):
+        for subscription in subscriber.subscriptions:
+            field = next(f for f in INDEXED_FIELDS if f in subscription)
+            key = (field, subscription[field])
+            entries = [entry for entry in self._subscription_index.get(key, [])
+                       if entry[0] is not subscriber]
+            if entries:
+                self._subscription_index[key] = entries
+            else:
+                self._subscription_index.pop(key, None)
+        subscriber.subscriptions = []
+
+    def _recipients(self, event: Dict[str, Any]) -> List[_Subscriber]:
+        recipients = [s for s in self.subscribers if not s.subscriptions]
+        if not self._subscription_index:
+            return recipients
+        keys = event_keys(event)
+        values = dict(keys)
+        matched: Dict[int, _Subscriber] = {}
+        for key in keys:
+            for subscriber, subscription in self._subscription_index.get(key, ()):
+                if id(subscriber) not in matched and all(
+                        values.get(field) == value for field, value in subscription.items()):
+                    matched[id(subscriber)] = subscriber
+        return recipients + list(matched.values())
+
+    def set_payload_policy(self, event_type: str, policy: PayloadPolicy):
+        """Use ``policy`` for events of ``event_type``."""
+        self.payload_policies[event_type] = policy
+
     async def emit(self, event_type: str, data: Dict[str, Any]):
-        """Emit an event to all subscribers."""
-        event = {
-            "type": event_type,
-            "timestamp": datetime.now().isoformat(),
-            "data": data
-        }
-        
-        # Add to history
-        self.event_history.append(event)
-        if len(self.event_history) > self.max_history:
-            self.event_history = self.event_history[-self.max_history:]
-        
-        # Notify subscribers
-        for callback in self.subscribers:
-            try:
-                if asyncio.iscoroutinefunction(callback):
-                    await callback(event)
-                else:
-                    callback(event)
-            except Exception as e:
-                logger.error("Event callback failed", error=str(e))
-        
+        """Emit an event to all subscribers (queued; returns immediately)."""
+        policy = self.payload_policies.get(event_type, self.default_policy)
+        published, reduced, encoded = policy.apply(data)
+        event = Event(
+            type=event_type,
+            timestamp=datetime.now().isoformat(),
+            request_id=current_request_id(),
+            session_id=current_session_id(),
+            data=published,
+            data_json=encoded
+        )
+        if reduced:
+            event["truncated"] = True
+
+        if self.transport is not None:
+            origin = f"{os.getpid()}:{next(self._origin)}"
+            event["origin"] = origin
+            self._in_flight[origin] = (to_json(event), data if reduced else None)
+            self._unsent.append(origin)
+            if len(self._in_flight) > MAX_UNSENT_EVENTS:
+                dropped, _ = self._in_flight.popitem(last=False)
+                if self._unsent[0] == dropped:
+                    self._unsent.popleft()
+                self.unsent_dropped += 1
+            self._publish_unsent()
+            logger.debug("Event emitted", event_type=event_type)
+            return
+
+        self._seq += 1
+        self._dispatch(event.numbered(self._seq), data if reduced else None, origin=True)
         logger.debug("Event emitted", event_type=event_type)
-    
-    def get_history(self, limit: int = 100) -> List[Dict[str, Any]]:
-        """Get event history."""
-        return self.event_history[-limit:]
-    
+
+    @property
+    def unsent_count(self) -> int:
+        """Events not numbered by the broker yet."""
+        return len(self._in_flight)
+
+    def _publish_unsent(self):
+        """Hand held-back events to the transport, in order, while it takes them."""
+        while self._unsent:
+            entry = self._in_flight.get(self._unsent[0])
+            if entry is not None and not self.transport.publish(entry[0]):
+                break
+            self._unsent.popleft()
+
+    def _resend(self):
+        """On (re)connecting, publish every event that has not come back numbered."""
+        self._unsent = deque(self._in_flight)
+        self._publish_unsent()
+
+    def _shared_last_seq(self) -> int:
+        """Latest seq seen here or logged by any worker, for a new broker to continue from."""
+        return max(self._seq, self.log.last_seq() if self.log is not None else 0)
+
+    def _receive(self, seq: int, payload: str):
+        """An event numbered by the transport (from this or another worker)."""
+        try:
+            event = Event(seq=seq, **json.loads(payload))
+        except ValueError as e:
+            logger.error("Invalid event from transport", error=str(e))
+            return
+        self._seq = max(self._seq, seq)
+        entry = self._in_flight.pop(event.get("origin"), None)
+        self._dispatch(event, entry[1] if entry is not None else None, origin=entry is not None)
+
+    def _dispatch(self, event: Event, full: Any, origin: bool):
+        if full is not None:
+            self._full[event["seq"]] = full
+            while len(self._full) > self.max_full_payloads:
+                self._full.popitem(last=False)
+
+        # Add to history (the durable log is written by the emitting worker)
+        self.history.append(event)
+        if self.log is not None and origin:
+            self.log.append(event, to_json(event))
+
+        # Notify subscribers
+        for subscriber in self._recipients(event):
+            subscriber.put(event)
+
+    async def start_transport(self):
+        """Connect to the other workers' event streams (no-op without a transport)."""
+        if self.transport is not None:
+            await self.transport.start(self._receive, self._shared_last_seq,
+                                       on_connect=self._resend)
+
+    async def stop_transport(self):
+        if self.transport is not None:
+            await self.transport.close()
+
+    async def drain(self, timeout: float = 5.0) -> bool:
+        """Wait until every subscriber has caught up; False on timeout."""
+        deadline = time.monotonic() + timeout
+        while any(s.pending or s.busy for s in self.subscribers):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.005)
+        return True
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        """Queue depth, lag and drop counts per subscriber."""
+        return [subscriber.metrics() for subscriber in self.subscribers]
+
+    def full_payload(self, seq: int) -> Optional[str]:
+        """JSON of a truncated event's full data, while it is still kept."""
+        data = self._full.get(seq)
+        if data is None:
+            return None
+        if not isinstance(data, str):
+            data = json.dumps(data, default=str)
+            if seq in self._full:
+                self._full[seq] = data
+        return data
+
+    def get_history(
+        self,
+        limit: int = 100,
+        since: Optional[int] = None,
+        **filters: Any
+    ) -> List[Dict[str, Any]]:
+        """Get event history, optionally filtered (see ``EventHistory.query``)."""
+        return self.history.query(limit=limit, since=since, **filters)
+
+    def replay(
+        self,
+        since: Optional[int] = None,
+        start: TimeBound = None,
+        end: TimeBound = None,
+        request_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        """Events after ``since`` and/or within a time range, oldest first.
+
+        Served from the event log when there is one, otherwise from memory.
+        """
+        if self.log is not None:
+            return self.log.replay(since=since, start=start, end=end, request_id=request_id,
+                                   session_id=session_id, limit=limit)
+        start, end = to_epoch(start), to_epoch(end)
+        events = self.history.query(limit=len(self.history), since=since,
+                                    request_id=request_id, session_id=session_id)
+        if start is not None or end is not None:
+            events = [e for e in events
+                      if (start is None or datetime.fromisoformat(e["timestamp"]).timestamp() >= start)
+                      and (end is None or datetime.fromisoformat(e["timestamp"]).timestamp() <= end)]
+        return events[:limit]
+
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the latest event (0 before the first)."""
+        return self._seq
+
     def clear_history(self):
         """Clear event history."""
-        self.event_history = []
+        self.history.clear()
         logger.info("Event history cleared")
 
 # Global event stream instance
-event_stream = EventStream()
+event_stream = EventStream(log=EventLog() if EVENT_LOG else None, transport=create_transport())
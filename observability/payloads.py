@@ -0,0 +1,151 @@
+"""Per-event-type payload policies: field projection and size limits."""
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from config import EVENT_PAYLOAD_MODE, EVENT_PAYLOAD_MAX_BYTES
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+FULL = "full"
+SUMMARY = "summary"
+
+class Event(dict):
+    """An emitted event that serializes itself once, however many consumers it has.
+
+    The JSON of its ``data``, when already encoded (e.g. by ``shrink`` while
+    measuring it), is passed as ``data_json`` and spliced in, not encoded again.
+    """
+
+    __slots__ = ("_json", "_data_json")
+
+    def __init__(self, *args, data_json: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._json: Optional[str] = None
+        self._data_json = data_json if "data" in self else None
+
+    def numbered(self, seq: int) -> "Event":
+        """A copy with ``seq`` first, sharing the encoded data."""
+        return Event(seq=seq, **self, data_json=self._data_json)
+
+    def to_json(self) -> str:
+        if self._json is None:
+            if self._data_json is None:
+                self._json = json.dumps(self, default=str)
+            else:
+                head = json.dumps({key: value for key, value in self.items() if key != "data"},
+                                  default=str)
+                separator = ", " if len(head) > 2 else ""
+                self._json = f'{head[:-1]}{separator}"data": {self._data_json}}}'
+        return self._json
+
+def to_json(event: Dict[str, Any]) -> str:
+    """JSON for any event, cached when it is an ``Event``."""
+    return event.to_json() if isinstance(event, Event) else json.dumps(event, default=str)
+
+class PayloadPolicy:
+    """How much of an event's data is sent to subscribers and kept in history.
+
+    ``summary`` keeps only the dotted ``fields`` (e.g. ``"result.status"``);
+    ``full`` keeps everything. Either way the data is then shrunk to
+    ``max_bytes`` of JSON by shortening long strings and lists.
+    """
+
+    def __init__(
+        self,
+        mode: str = FULL,
+        fields: Sequence[str] = (),
+        max_bytes: int = EVENT_PAYLOAD_MAX_BYTES
+    ):
+        if mode not in (FULL, SUMMARY):
+            raise ValueError(f"Unknown payload mode: {mode}")
+        self.mode = mode
+        self.fields = [field.split(".") for field in fields]
+        self.max_bytes = max_bytes
+
+    def apply(self, data: Any) -> Tuple[Any, bool, Optional[str]]:
+        """The data to publish, whether anything was left out, and its JSON.
+
+        The JSON is the one measured against ``max_bytes`` (None without a
+        size limit), for ``Event`` to reuse.
+        """
+        reduced = False
+        encoded = None
+        if self.mode == SUMMARY and self.fields and isinstance(data, dict):
+            projected = _project(data, self.fields)
+            reduced = projected != data
+            data = projected
+        if self.max_bytes > 0:
+            data, truncated, encoded = shrink(data, self.max_bytes)
+            reduced = reduced or truncated
+        return data, reduced, encoded
+
+# Agent results repeat the normalized input in their tool calls, and the final
+# state repeats every agent result, so by default events carry a summary.
+DEFAULT_POLICIES: Dict[str, PayloadPolicy] = {
+    "agent_start": PayloadPolicy(SUMMARY, ["agent", "input.id", "input.type", "input.content"], 2048),
+    "agent_complete": PayloadPolicy(
+        SUMMARY, ["agent", "result.status", "result.output", "result.execution_time"], 4096),
+    "agent_execution_start": PayloadPolicy(
+        SUMMARY, ["input.id", "input.session_id", "input.type", "input.content"], 2048),
+    "agent_execution_complete": PayloadPolicy(
+        SUMMARY, ["result.final_response", "result.errors"], 8192),
+}
+
+def default_policies() -> Dict[str, PayloadPolicy]:
+    """Policies for ``EVENT_PAYLOAD_MODE`` (``full`` only keeps the size limit)."""
+    if EVENT_PAYLOAD_MODE == FULL:
+        return {}
+    return dict(DEFAULT_POLICIES)
+
+def _project(data: Dict[str, Any], fields: List[List[str]]) -> Dict[str, Any]:
+    projected: Dict[str, Any] = {}
+    for path in fields:
+        value: Any = data
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+    return projected
+
+def shrink(data: Any, max_bytes: int) -> Tuple[Any, bool, str]:
+    """``data`` cut down to at most ``max_bytes`` of JSON, whether it was cut, and the JSON.
+
+    Strings and lists are shortened, halving their allowance until the
+    result fits; if even that fails, a string preview is returned. Data
+    that fits, the usual case, is encoded just once.
+    """
+    encoded = json.dumps(data, default=str)
+    if len(encoded) <= max_bytes:
+        return data, False, encoded
+    string_limit, list_limit = max(32, max_bytes // 4), 32
+    while string_limit >= 16:
+        shrunk = _shrink(data, string_limit, list_limit)
+        shrunk_json = json.dumps(shrunk, default=str)
+        if len(shrunk_json) <= max_bytes:
+            return shrunk, True, shrunk_json
+        string_limit //= 2
+        list_limit = max(1, list_limit // 2)
+    preview = {"preview": encoded[:max(0, max_bytes - 64)], "bytes": len(encoded)}
+    return preview, True, json.dumps(preview)
+
+def _shrink(value: Any, string_limit: int, list_limit: int, depth: int = 0) -> Any:
+    if isinstance(value, str):
+        if len(value) > string_limit:
+            return value[:string_limit] + f"… (+{len(value) - string_limit} chars)"
+        return value
+    if depth > 8:
+        return "…"
+    if isinstance(value, dict):
+        return {key: _shrink(item, string_limit, list_limit, depth + 1)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [_shrink(item, string_limit, list_limit, depth + 1) for item in value[:list_limit]]
+        if len(value) > list_limit:
+            items.append(f"… (+{len(value) - list_limit} items)")
+        return items
+    return value
@@ -0,0 +1,80 @@
+"""Server-Sent Events framing of the event stream, with resume and heartbeats."""
+import asyncio
+import zlib
+from typing import Any, AsyncIterator, Dict, Optional
+from config import EVENT_SSE_HEARTBEAT_SECONDS
+from observability.event_history import event_keys
+from observability.payloads import to_json
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Client reconnect delay advertised in the stream
+RETRY_MS = 3000
+# Events replayed on resume before switching to live delivery
+MAX_REPLAY = 10000
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """One SSE message; its ``id`` is the event's ``seq`` (for ``Last-Event-ID``)."""
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {to_json(event)}\n\n"
+
+def _matches(event: Dict[str, Any], subscription: Optional[Dict[str, Any]]) -> bool:
+    if not subscription:
+        return True
+    values = dict(event_keys(event))
+    return all(values.get(field) == value for field, value in subscription.items())
+
+async def sse_events(
+    stream,
+    subscription: Optional[Dict[str, Any]] = None,
+    last_event_id: Optional[int] = None,
+    heartbeat_seconds: float = EVENT_SSE_HEARTBEAT_SECONDS
+) -> AsyncIterator[str]:
+    """SSE messages for ``stream`` (an ``EventStream``), optionally filtered.
+
+    The consumer is subscribed before anything is replayed, so no event is
+    lost between the replay of events after ``last_event_id`` and live
+    delivery; duplicates are skipped by sequence number. A comment line is
+    sent after ``heartbeat_seconds`` without events so proxies keep the
+    connection open and clients notice dead ones.
+    """
+    inbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=1)
+
+    async def deliver(event: Dict[str, Any]):
+        # Waits while the client is behind, so its subscriber queue applies
+        # the usual drop/coalesce policy rather than this inbox growing
+        await inbox.put(event)
+
+    stream.subscribe(deliver, subscriptions=[subscription] if subscription else None)
+    sent = last_event_id or 0
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        if last_event_id is not None:
+            replayed = await asyncio.to_thread(
+                stream.replay, since=last_event_id, limit=MAX_REPLAY,
+                request_id=(subscription or {}).get("request_id"),
+                session_id=(subscription or {}).get("session_id"))
+            for event in replayed:
+                if _matches(event, subscription):
+                    sent = event["seq"]
+                    yield format_sse(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(inbox.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event["seq"] > sent:
+                sent = event["seq"]
+                yield format_sse(event)
+    finally:
+        stream.unsubscribe(deliver)
+
+async def gzip_stream(messages: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    """Gzip a message stream, flushing after each message so none is held back."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    try:
+        async for message in messages:
+            yield compressor.compress(message.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    finally:
+        await messages.aclose()
@@ -0,0 +1,202 @@
+"""Cross-process event transport: a Unix-domain-socket broker among local workers."""
+import asyncio
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+from config import EVENT_TRANSPORT, EVENT_SOCKET_PATH
+from utils.logger import get_logger
+from utils.process_lock import HAS_FCNTL, try_lock
+
+logger = get_logger(__name__)
+
+BROKER = "broker"
+CLIENT = "client"
+# Longest event line accepted on the socket
+MAX_LINE_BYTES = 8 * 1024 * 1024
+# A peer whose unsent backlog exceeds this is dropped (it reconnects)
+MAX_PEER_BACKLOG = 16 * 1024 * 1024
+
+Deliver = Callable[[int, str], None]
+
+class UnixSocketTransport:
+    """Fans events out across the worker processes of one host.
+
+    Workers elect a broker by taking an exclusive lock on ``<path>.lock``;
+    the broker listens on the Unix socket at ``path`` and the others connect
+    to it. Every event, wherever it is emitted, goes through the broker,
+    which numbers it (so ``seq`` is global) and sends it, as one line of
+    ``<seq>\\t<json>``, to every worker, the emitting one included. When the
+    broker exits its lock is released and a surviving worker takes over,
+    continuing the numbering from ``last_seq`` (the last event it saw or
+    found in the shared event log, whichever is later). A published event
+    only counts as delivered once it comes back numbered.
+    """
+
+    def __init__(self, path: Path = EVENT_SOCKET_PATH, reconnect_seconds: float = 0.5):
+        if not HAS_FCNTL:
+            raise RuntimeError("The unix event transport needs fcntl (POSIX only)")
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.reconnect_seconds = reconnect_seconds
+        self.role: Optional[str] = None
+        self._deliver: Optional[Deliver] = None
+        self._last_seq: Callable[[], int] = lambda: 0
+        self._on_connect: Callable[[], None] = lambda: None
+        self._seq = 0
+        self._lock_file = None
+        self._peers: Set[asyncio.StreamWriter] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"published": 0, "received": 0, "relayed": 0, "dropped_peers": 0,
+                      "elections": 0}
+
+    @property
+    def connected(self) -> bool:
+        return self.role is not None
+
+    async def start(
+        self,
+        deliver: Deliver,
+        last_seq: Callable[[], int],
+        on_connect: Optional[Callable[[], None]] = None
+    ):
+        """Begin delivering every worker's events to ``deliver(seq, payload)``.
+
+        ``on_connect`` is called each time the transport (re)connects, as
+        broker or client, so events held back meanwhile can be published.
+        """
+        self._deliver = deliver
+        self._last_seq = last_seq
+        if on_connect is not None:
+            self._on_connect = on_connect
+        self._task = asyncio.create_task(self._run())
+        # Give the election a moment so early events already go through the bus
+        for _ in range(20):
+            if self.connected:
+                break
+            await asyncio.sleep(0.01)
+
+    def publish(self, payload: str) -> bool:
+        """Send an event (JSON without ``seq``); False when not connected.
+
+        True only means the event was handed to the connection: it may still
+        be lost with it, so the caller keeps it until it comes back numbered.
+        """
+        if self.role == BROKER:
+            self._seq += 1
+            self._fan_out(self._seq, payload)
+            self._deliver(self._seq, payload)
+        elif self.role == CLIENT and self._writer is not None:
+            self._writer.write(payload.encode("utf-8") + b"\n")
+        else:
+            return False
+        self.stats["published"] += 1
+        return True
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "role": self.role, "peers": len(self._peers),
+                "socket": str(self.path)}
+
+    async def _run(self):
+        while True:
+            try:
+                if self._try_lock():
+                    await self._serve()
+                else:
+                    await self._follow()
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ConnectionError, ValueError) as e:
+                logger.debug("Event transport disconnected", error=str(e))
+            finally:
+                self.role = None
+                self._writer = None
+            await asyncio.sleep(self.reconnect_seconds)
+
+    def _try_lock(self) -> bool:
+        self._lock_file = try_lock(self.lock_path)
+        return self._lock_file is not None
+
+    async def _serve(self):
+        # Only the lock holder gets here, so an existing socket file is stale
+        if self.path.exists():
+            self.path.unlink()
+        server = await asyncio.start_unix_server(self._handle_peer, str(self.path),
+                                                 limit=MAX_LINE_BYTES)
+        self._seq = max(self._seq, self._last_seq())
+        self.role = BROKER
+        self.stats["elections"] += 1
+        logger.info("Event broker started", socket=str(self.path), pid=os.getpid(), seq=self._seq)
+        self._on_connect()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            server.close()
+            for peer in list(self._peers):
+                peer.close()
+            self._peers.clear()
+            if self.path.exists():
+                self.path.unlink()
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._peers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._seq += 1
+                payload = line.decode("utf-8").rstrip("\n")
+                self._fan_out(self._seq, payload)
+                self._deliver(self._seq, payload)
+                self.stats["relayed"] += 1
+        except (OSError, ConnectionError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    def _fan_out(self, seq: int, payload: str):
+        line = f"{seq}\t{payload}\n".encode("utf-8")
+        for peer in list(self._peers):
+            if peer.transport.get_write_buffer_size() > MAX_PEER_BACKLOG:
+                logger.warning("Dropping lagging event peer")
+                self.stats["dropped_peers"] += 1
+                self._peers.discard(peer)
+                peer.close()
+                continue
+            peer.write(line)
+
+    async def _follow(self):
+        reader, writer = await asyncio.open_unix_connection(str(self.path), limit=MAX_LINE_BYTES)
+        self._writer = writer
+        self.role = CLIENT
+        logger.info("Connected to event broker", socket=str(self.path), pid=os.getpid())
+        self._on_connect()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                seq, payload = line.decode("utf-8").rstrip("\n").split("\t", 1)
+                self._deliver(int(seq), payload)
+                self.stats["received"] += 1
+        finally:
+            writer.close()
+
+def create_transport(name: str = EVENT_TRANSPORT) -> Optional[UnixSocketTransport]:
+    """Transport named by ``EVENT_TRANSPORT``: ``local`` (none) or ``unix``."""
+    name = (name or "local").lower()
+    if name == "local":
+        return None
+    if name == "unix":
+        return UnixSocketTransport()
+    raise ValueError(f"Unknown event transport: {name}")
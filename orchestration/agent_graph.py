@@ -3,13 +3,16 @@ from typing import Dict, Any, List, TypedDict, Annotated
 from langgraph.graph import StateGraph, END
 from operator import add
 import asyncio
+import uuid
 from agents import (
     IngestionAgent, PlannerAgent, IntentClassificationAgent,
     KnowledgeRetrievalAgent, MemoryAgent, ReasoningAgent,
     ResponseSynthesisAgent, GuardrailsAgent
 )
-from observability import event_stream
+from config import LLM_CACHE
+from observability import current_request_id, event_stream, request_context
 from utils.logger import get_logger
+from utils.shared_cache import install_llm_cache
 
 logger = get_logger(__name__)
 
@@ -36,12 +39,14 @@ class AgentOrchestrator:
     """Orchestrates agent execution using LangGraph."""
     
     def __init__(self):
+        if LLM_CACHE:
+            install_llm_cache()
         self.ingestion_agent = IngestionAgent()
         self.planner_agent = PlannerAgent()
         self.intent_agent = IntentClassificationAgent()
         self.knowledge_agent = KnowledgeRetrievalAgent()
         self.memory_agent = MemoryAgent()
-        self.reasoning_agent = ReasoningAgent()
+        self.reasoning_agent = ReasoningAgent(vector_stores=self.knowledge_agent.vector_stores)
         self.synthesis_agent = ResponseSynthesisAgent()
         self.guardrails_agent = GuardrailsAgent()
         
@@ -128,7 +133,12 @@ class AgentOrchestrator:
         """Knowledge retrieval node."""
         logger.info("Executing knowledge retrieval node")
         await event_stream.emit("agent_start", {"agent": "knowledge_retrieval", "input": state["normalized_input"]})
-        result = self.knowledge_agent.retrieve(state["normalized_input"])
+        # Run off the event loop so concurrent requests can share embedding batches
+        result = await asyncio.to_thread(
+            self.knowledge_agent.retrieve,
+            state["normalized_input"],
+            intent_classification=state.get("intent_classification")
+        )
         state["knowledge_retrieval"] = result
         state["execution_log"].append(result)
         await event_stream.emit("agent_complete", {"agent": "knowledge_retrieval", "result": result})
@@ -212,6 +222,9 @@ class AgentOrchestrator:
         """Process input asynchronously."""
         # Create a copy to avoid state mutation issues
         input_copy = dict(input_data) if isinstance(input_data, dict) else {"content": str(input_data)}
+        # Ids are fixed up front so every event of this run can be tagged with them
+        input_copy["id"] = input_copy.get("id") or current_request_id() or str(uuid.uuid4())
+        input_copy["session_id"] = input_copy.get("session_id") or str(uuid.uuid4())
         
         initial_state: AgentState = {
             "input": input_copy,
@@ -229,7 +242,8 @@ class AgentOrchestrator:
         }
         
         try:
-            final_state = await self.graph.ainvoke(initial_state)
+            with request_context(input_copy["id"], input_copy["session_id"]):
+                final_state = await self.graph.ainvoke(initial_state)
             return final_state
         except Exception as e:
             logger.error("Orchestration failed", error=str(e))
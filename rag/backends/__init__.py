@@ -0,0 +1,68 @@
+"""Pluggable vector index backends for VectorStore."""
+from pathlib import Path
+from typing import Optional
+from .base import VectorBackend
+
+# Backends whose index files are written in place by the process that holds
+# them: other processes neither see the writes nor may write themselves
+SINGLE_PROCESS_BACKENDS = frozenset({"faiss", "quantized"})
+
+def backend_root(name: str, tenant: Optional[str] = None) -> Path:
+    """Index directory for the backend registered under ``name``.
+
+    Each tenant gets its own directory (and so its own collection or index)
+    under ``TENANTS_DIR``; ``tenant=None`` is the shared default index.
+    """
+    from config import CHROMA_DB_DIR, FAISS_INDEX_DIR, QUANTIZED_INDEX_DIR, TENANTS_DIR
+
+    roots = {
+        "chroma": CHROMA_DB_DIR,
+        "faiss": FAISS_INDEX_DIR,
+        "quantized": QUANTIZED_INDEX_DIR,
+    }
+    if name.lower() not in roots:
+        raise ValueError(f"Unknown vector backend: {name}")
+    if tenant:
+        return TENANTS_DIR / tenant / name.lower()
+    return roots[name.lower()]
+
+def create_backend(
+    name: str,
+    embeddings,
+    path: Optional[Path] = None,
+    dedup: Optional[bool] = None,
+    text_store: Optional[bool] = None
+) -> VectorBackend:
+    """Instantiate the backend registered under ``name``.
+
+    With ``dedup`` (default: ``CHUNK_DEDUP``) the backend is wrapped so
+    duplicate chunks are dropped before indexing; with ``text_store``
+    (default: ``CHUNK_TEXT_STORE``) chunk text is kept out of the index.
+    Parent chunks (``PARENT_CHUNK_SIZE``) need document text for context
+    expansion, so they get the text store alongside the index text.
+    """
+    from config import CHUNK_DEDUP, CHUNK_TEXT_STORE, PARENT_CHUNK_SIZE
+
+    backend = _create(name.lower(), embeddings, path or backend_root(name))
+    text_store = CHUNK_TEXT_STORE if text_store is None else text_store
+    if text_store or PARENT_CHUNK_SIZE > 0:
+        from .chunk_store_backend import ChunkStoreBackend
+        backend = ChunkStoreBackend(backend, keep_text=not text_store)
+    if CHUNK_DEDUP if dedup is None else dedup:
+        from .dedup_backend import DeduplicatingBackend
+        backend = DeduplicatingBackend(backend)
+    return backend
+
+def _create(name: str, embeddings, path: Path) -> VectorBackend:
+    if name == "chroma":
+        from .chroma_backend import ChromaBackend
+        return ChromaBackend(path, embeddings)
+    if name == "faiss":
+        from .faiss_backend import FaissBackend
+        return FaissBackend(path, embeddings)
+    if name == "quantized":
+        from .quantized_backend import QuantizedBackend
+        return QuantizedBackend(path, embeddings)
+    raise ValueError(f"Unknown vector backend: {name}")
+
+__all__ = ["VectorBackend", "SINGLE_PROCESS_BACKENDS", "backend_root", "create_backend"]
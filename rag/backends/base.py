@@ -0,0 +1,85 @@
+"""Common interface for vector index backends."""
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+
+class VectorBackend(ABC):
+    """Stores chunk embeddings and answers nearest-neighbour queries.
+
+    Backends embed documents with the embeddings object they are given and
+    search by a precomputed query vector, so query embedding (and its cache)
+    stays in ``VectorStore``. Scores are cosine similarities: higher is
+    more relevant. ``filter`` is a metadata filter in Chroma ``where``
+    syntax (see ``rag.metadata_index``) applied before scoring.
+    """
+
+    name = "base"
+
+    def __init__(self, path: Path, embeddings):
+        self.path = Path(path)
+        self.embeddings = embeddings
+
+    @abstractmethod
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        """Embed and add documents, returning their ids."""
+
+    def add_vectors(self, documents: List[Document], vectors) -> List[str]:
+        """Add documents with precomputed embeddings, returning their ids."""
+        raise NotImplementedError(f"{self.name} backend cannot add precomputed vectors")
+
+    @abstractmethod
+    def similarity_search_by_vector(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Return the k nearest documents with their scores."""
+
+    def similarity_search_with_vectors(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Tuple[Document, float]], np.ndarray]:
+        """Like ``similarity_search_by_vector``, plus the hits' stored vectors.
+
+        The default re-embeds the hit texts; backends that can read their
+        stored vectors override this.
+        """
+        hits = self.similarity_search_by_vector(vector, k=k, filter=filter)
+        if not hits:
+            return hits, np.empty((0, len(vector)), dtype=np.float32)
+        vectors = self.embeddings.embed_documents([doc.page_content for doc, _ in hits])
+        return hits, np.asarray(vectors, dtype=np.float32)
+
+    def materialize(self, documents: List[Document]) -> List[Document]:
+        """Fill in chunk text the backend returned as a pointer (see ``ChunkStoreBackend``)."""
+        return documents
+
+    def read_text(self, doc_id: str, offset: int, length: int) -> str:
+        """Document text around a chunk, or "" when the backend keeps none."""
+        return ""
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Merge ``metadatas`` into the stored metadata of the chunks ``ids``."""
+        raise NotImplementedError(f"{self.name} backend cannot update metadata")
+
+    def delete_source(self, source: str) -> List[str]:
+        """Remove every chunk whose ``source`` metadata is ``source``, returning their ids."""
+        raise NotImplementedError(f"{self.name} backend cannot delete chunks")
+
+    def persist(self):
+        """Flush pending writes to disk."""
+
+    def count(self) -> int:
+        """Number of indexed documents."""
+        return 0
+
+    def close(self):
+        """Release files and handles held by the backend."""
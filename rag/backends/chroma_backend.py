@@ -0,0 +1,118 @@
+"""ChromaDB vector index backend."""
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+try:
+    from langchain_community.vectorstores import Chroma
+except ImportError:
+    from langchain.vectorstores import Chroma
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+from rag.backends.base import VectorBackend
+from rag.metadata_index import filter_operators, normalize_filter
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class ChromaBackend(VectorBackend):
+    """Vector index persisted by a local Chroma collection.
+
+    Filters are passed to Chroma's own ``where`` clause, which Chroma
+    applies inside the HNSW search; ``$prefix`` is not supported there.
+    """
+
+    name = "chroma"
+
+    def __init__(self, path: Path, embeddings):
+        super().__init__(path, embeddings)
+        if Chroma is None:
+            raise ImportError("Chroma not available. Install chromadb and langchain-community.")
+        try:
+            import chromadb
+        except ImportError:
+            # Check if pydantic-settings is the issue
+            import pydantic_settings
+            import chromadb
+
+        self.store = Chroma(
+            persist_directory=str(self.path),
+            embedding_function=self.embeddings
+        )
+        logger.info("Chroma backend loaded", path=str(self.path))
+
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        return self.store.add_documents(documents)
+
+    def add_vectors(self, documents: List[Document], vectors) -> List[str]:
+        if not documents:
+            return []
+        ids = [str(uuid.uuid4()) for _ in documents]
+        self.store._collection.add(
+            ids=ids,
+            embeddings=[list(map(float, vector)) for vector in vectors],
+            metadatas=[doc.metadata or None for doc in documents],
+            documents=[doc.page_content for doc in documents]
+        )
+        return ids
+
+    def similarity_search_by_vector(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        results = self.store.similarity_search_by_vector_with_relevance_scores(
+            vector, k=k, filter=_chroma_where(filter))
+        # Chroma returns squared L2 distances; for unit-length embeddings
+        # that is 2 - 2 * cosine similarity.
+        return [(doc, 1.0 - distance / 2.0) for doc, distance in results]
+
+    def similarity_search_with_vectors(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Tuple[Document, float]], np.ndarray]:
+        result = self.store._collection.query(
+            query_embeddings=[vector],
+            n_results=k,
+            where=_chroma_where(filter),
+            include=["documents", "metadatas", "distances", "embeddings"]
+        )
+        hits = [
+            (Document(page_content=text or "", metadata=metadata or {}), 1.0 - distance / 2.0)
+            for text, metadata, distance in zip(
+                result["documents"][0], result["metadatas"][0], result["distances"][0])
+        ]
+        embeddings = result["embeddings"][0] if result.get("embeddings") is not None else []
+        return hits, np.asarray(embeddings, dtype=np.float32).reshape(len(hits), -1)
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        # Chroma merges the given keys into the stored metadata
+        self.store._collection.update(ids=ids, metadatas=metadatas)
+
+    def delete_source(self, source: str) -> List[str]:
+        ids = self.store._collection.get(where={"source": source}, include=[])["ids"]
+        if ids:
+            self.store._collection.delete(ids=ids)
+        return ids
+
+    def persist(self):
+        # chromadb >= 0.4 persists automatically and drops persist()
+        if hasattr(self.store, "persist"):
+            self.store.persist()
+
+    def count(self) -> int:
+        return self.store._collection.count()
+
+def _chroma_where(filter: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Chroma requires one operator per level, so use the normalized form."""
+    if not filter:
+        return None
+    where = normalize_filter(filter)
+    if "$prefix" in filter_operators(where):
+        raise ValueError("The chroma backend does not support $prefix filters")
+    return where
@@ -0,0 +1,122 @@
+"""Backend wrapper that keeps chunk text out of the vector index."""
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+from rag.backends.base import VectorBackend
+from rag.chunk_store import ChunkTextStore
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TEXT_STORE_DIR = "chunk_texts"
+REF_KEYS = ("doc_id", "byte_offset", "byte_length")
+
+class ChunkStoreBackend(VectorBackend):
+    """Stores chunk text once in a ``ChunkTextStore``; the index keeps pointers.
+
+    Chunks are embedded here and handed to the wrapped backend with empty
+    text and a ``(doc_id, byte_offset, byte_length)`` reference in their
+    metadata. Searches return those empty documents; ``materialize`` reads
+    the text back only for the chunks that are actually used.
+
+    With ``keep_text`` the index keeps its chunk text as well, and the store
+    only serves ``read_text`` (document text around a hit, for parent
+    context expansion).
+    """
+
+    def __init__(self, inner: VectorBackend, keep_text: bool = False):
+        super().__init__(inner.path, inner.embeddings)
+        self.inner = inner
+        self.name = inner.name
+        self.keep_text = keep_text
+        self.text_store = ChunkTextStore(self.path / TEXT_STORE_DIR)
+
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        if not documents:
+            return []
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+        return self.add_vectors(documents, vectors)
+
+    def add_vectors(self, documents: List[Document], vectors) -> List[str]:
+        pointers = []
+        for doc in documents:
+            data = doc.page_content.encode("utf-8")
+            metadata = dict(doc.metadata)
+            if not all(key in metadata for key in REF_KEYS):
+                # Chunks that did not come from DocumentProcessor get their own document
+                metadata.update(doc_id=str(uuid.uuid4()), byte_offset=0, byte_length=len(data))
+            self.text_store.append(metadata["doc_id"], metadata["byte_offset"], data)
+            pointers.append(Document(page_content=doc.page_content if self.keep_text else "",
+                                     metadata=metadata))
+        return self.inner.add_vectors(pointers, vectors)
+
+    def store_text(self, documents: List[Document]):
+        """Keep the text of chunks that are not indexed (e.g. skipped duplicates).
+
+        Their byte ranges then read back as the document's own text instead
+        of the filler between stored chunks.
+        """
+        for doc in documents:
+            metadata = doc.metadata
+            if all(key in metadata for key in REF_KEYS):
+                self.text_store.append(metadata["doc_id"], metadata["byte_offset"],
+                                       doc.page_content.encode("utf-8"))
+
+    def similarity_search_by_vector(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        return self.inner.similarity_search_by_vector(vector, k=k, filter=filter)
+
+    def similarity_search_with_vectors(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Tuple[Document, float]], np.ndarray]:
+        return self.inner.similarity_search_with_vectors(vector, k=k, filter=filter)
+
+    def materialize(self, documents: List[Document]) -> List[Document]:
+        materialized = []
+        for doc in documents:
+            metadata = doc.metadata
+            if doc.page_content or not all(key in metadata for key in REF_KEYS):
+                materialized.append(doc)
+                continue
+            text = self.text_store.read(metadata["doc_id"], metadata["byte_offset"],
+                                        metadata["byte_length"])
+            materialized.append(Document(page_content=text, metadata=metadata))
+        return materialized
+
+    def read_text(self, doc_id: str, offset: int, length: int) -> str:
+        return self.text_store.read(doc_id, offset, length)
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        self.inner.update_metadata(ids, metadatas)
+
+    def delete_source(self, source: str) -> List[str]:
+        # The text stays in the append-only store; nothing points at it anymore
+        return self.inner.delete_source(source)
+
+    def persist(self):
+        # Text first, so saved vectors never point at unsaved text
+        self.text_store.persist()
+        self.inner.persist()
+
+    def count(self) -> int:
+        return self.inner.count()
+
+    def close(self):
+        self.inner.close()
+        self.text_store.close()
+
+    def __getattr__(self, name: str):
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
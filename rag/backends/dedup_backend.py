@@ -0,0 +1,119 @@
+"""Backend wrapper that drops duplicate chunks before they are embedded."""
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+from config import DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS
+from rag.backends.base import VectorBackend
+from rag.dedup import ChunkDeduplicator
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEDUP_FILE = "dedup.sqlite"
+
+class DeduplicatingBackend(VectorBackend):
+    """Wraps a backend so exact and near-duplicate chunks are never indexed.
+
+    Duplicates are filtered before embedding, so they cost neither index
+    space nor embedding calls; their sources are recorded on the surviving
+    chunk. Fingerprints are stored in the wrapped backend's directory and
+    persisted with it. They are loaded on the first write, not when the
+    backend is opened, so processes that only search never pay for them.
+    """
+
+    def __init__(self, inner: VectorBackend):
+        super().__init__(inner.path, inner.embeddings)
+        self.inner = inner
+        self.name = inner.name
+        self._dedup: Optional[ChunkDeduplicator] = None
+        self._add_lock = threading.Lock()
+        # Sources whose skipped duplicates lost their surviving chunk
+        self.reindex_sources: set = set()
+
+    @property
+    def dedup(self) -> ChunkDeduplicator:
+        """The fingerprints of the indexed chunks, loaded on first use (under ``_add_lock``)."""
+        if self._dedup is None:
+            self._dedup = ChunkDeduplicator(self.path / DEDUP_FILE, threshold=DEDUP_THRESHOLD,
+                                            num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS)
+        return self._dedup
+
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        with self._add_lock:
+            unique, updates = self.dedup.partition(documents)
+            if len(unique) < len(documents) and hasattr(self.inner, "store_text"):
+                # Every chunk in document order, so skipped ones leave no gap in the text
+                self.inner.store_text(documents)
+            try:
+                ids = self.inner.add_documents(unique) if unique else []
+            except Exception:
+                self.dedup.discard_pending()
+                raise
+            self.dedup.assign_ids(ids)
+            if updates:
+                self.inner.update_metadata(list(updates), list(updates.values()))
+        skipped = len(documents) - len(unique)
+        if skipped:
+            logger.info("Duplicate chunks skipped", skipped=skipped, kept=len(unique),
+                       survivors_updated=len(updates))
+        return ids
+
+    def similarity_search_by_vector(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        return self.inner.similarity_search_by_vector(vector, k=k, filter=filter)
+
+    def similarity_search_with_vectors(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Tuple[Document, float]], np.ndarray]:
+        return self.inner.similarity_search_with_vectors(vector, k=k, filter=filter)
+
+    def materialize(self, documents: List[Document]) -> List[Document]:
+        return self.inner.materialize(documents)
+
+    def read_text(self, doc_id: str, offset: int, length: int) -> str:
+        return self.inner.read_text(doc_id, offset, length)
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        self.inner.update_metadata(ids, metadatas)
+
+    def delete_source(self, source: str) -> List[str]:
+        with self._add_lock:
+            ids = self.inner.delete_source(source)
+            # A re-added version of the file must not count as a duplicate of itself
+            orphaned = [s for s in self.dedup.forget(ids) if s != source]
+            self.reindex_sources.update(orphaned)
+        if orphaned:
+            logger.info("Deleted chunks had duplicates in other sources",
+                       source=source, reindex=orphaned)
+        return ids
+
+    def persist(self):
+        self.inner.persist()
+        # After the vectors, so fingerprints never refer to unsaved chunks
+        if self._dedup is not None:
+            self._dedup.persist()
+
+    def count(self) -> int:
+        return self.inner.count()
+
+    def close(self):
+        self.inner.close()
+        if self._dedup is not None:
+            self._dedup.close()
+
+    def __getattr__(self, name: str):
+        # Backend-specific attributes (docstore, metadata_index, ...)
+        if name in ("inner", "_dedup"):
+            raise AttributeError(name)
+        return getattr(self.inner, name)
@@ -0,0 +1,139 @@
+"""SQLite-backed chunk store shared by the local index backends."""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+
+class SqliteDocstore:
+    """Chunk text and metadata keyed by the row number used in the index.
+
+    Deleted chunks keep their row (index rows cannot be renumbered); they are
+    recorded in a ``deleted`` table, their text is dropped and ``get`` skips
+    them; ``live_mask`` lets searches exclude them up front.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT
+            )
+        """)
+        self._db.execute("CREATE TABLE IF NOT EXISTS deleted (row INTEGER PRIMARY KEY)")
+        self._db.commit()
+        self._deleted = np.array(
+            [row for (row,) in self._db.execute("SELECT row FROM deleted ORDER BY row")],
+            dtype=np.int64)
+        self._live: Optional[np.ndarray] = None
+
+    def add(self, first_row: int, ids: Sequence[str], documents: Sequence[Document]):
+        """Insert documents at consecutive rows starting at ``first_row``."""
+        # The connection commits on success and rolls back on error, so a
+        # failed write never leaves its transaction (and the write lock) open
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO chunks (row, id, content, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (first_row + i, doc_id, doc.page_content, json.dumps(doc.metadata))
+                    for i, (doc_id, doc) in enumerate(zip(ids, documents))
+                ]
+            )
+
+    def get(self, rows: Sequence[int]) -> Dict[int, Document]:
+        """Load the documents stored at ``rows``."""
+        rows = [int(row) for row in rows]
+        if not rows:
+            return {}
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            cursor = self._db.execute(
+                f"SELECT row, content, metadata FROM chunks WHERE row IN ({placeholders}) "
+                f"AND row NOT IN (SELECT row FROM deleted)", rows)
+            entries = cursor.fetchall()
+        return {
+            row: Document(page_content=content,
+                          metadata=json.loads(metadata) if metadata else {})
+            for row, content, metadata in entries
+        }
+
+    def ranked(self, rows: Sequence[int], scores: Sequence[float]) -> List[Tuple[int, Document, float]]:
+        """Pair rows with documents and scores, keeping rank order and skipping gaps."""
+        documents = self.get([row for row in rows if row >= 0])
+        return [
+            (int(row), documents[int(row)], float(score))
+            for row, score in zip(rows, scores)
+            if int(row) in documents
+        ]
+
+    def hits(self, rows: Sequence[int], scores: Sequence[float]) -> List[Tuple[Document, float]]:
+        """Documents with scores for the given rows, in rank order."""
+        return [(doc, score) for _, doc, score in self.ranked(rows, scores)]
+
+    def update_metadata(self, ids: Sequence[str], patches: Sequence[Dict[str, Any]]):
+        """Merge ``patches`` into the metadata of the chunks with ``ids``."""
+        with self._lock, self._db:
+            for doc_id, patch in zip(ids, patches):
+                row = self._db.execute(
+                    "SELECT metadata FROM chunks WHERE id = ?", (doc_id,)).fetchone()
+                if row is None:
+                    continue
+                metadata = {**(json.loads(row[0]) if row[0] else {}), **patch}
+                self._db.execute("UPDATE chunks SET metadata = ? WHERE id = ?",
+                                 (json.dumps(metadata), doc_id))
+
+    def metadatas(self) -> Iterator[Dict[str, Any]]:
+        """Metadata of every row in row order (for rebuilding derived indexes)."""
+        with self._lock:
+            entries = self._db.execute("SELECT metadata FROM chunks ORDER BY row").fetchall()
+        for (metadata,) in entries:
+            yield json.loads(metadata) if metadata else {}
+
+    def delete_source(self, source: str) -> Tuple[List[int], List[str]]:
+        """Mark every chunk of ``source`` deleted, returning their rows and ids."""
+        with self._lock, self._db:
+            entries = self._db.execute(
+                "SELECT row, id FROM chunks WHERE json_extract(metadata, '$.source') = ? "
+                "AND row NOT IN (SELECT row FROM deleted)", (source,)).fetchall()
+            rows = [row for row, _ in entries]
+            self._db.executemany("INSERT OR IGNORE INTO deleted (row) VALUES (?)",
+                                 [(row,) for row in rows])
+            self._db.executemany("UPDATE chunks SET content = '' WHERE row = ?",
+                                 [(row,) for row in rows])
+            if rows:
+                self._deleted = np.union1d(self._deleted, rows)
+                self._live = None
+        return rows, [chunk_id for _, chunk_id in entries]
+
+    def live_mask(self, row_count: int) -> Optional[np.ndarray]:
+        """Mask of rows below ``row_count`` that are not deleted, or None if none are."""
+        with self._lock:
+            if not len(self._deleted):
+                return None
+            if self._live is None or len(self._live) != row_count:
+                live = np.ones(row_count, dtype=bool)
+                live[self._deleted[self._deleted < row_count]] = False
+                self._live = live
+            return self._live
+
+    def truncate(self, row_count: int):
+        """Drop rows at or beyond ``row_count`` (written after the last save)."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM chunks WHERE row >= ?", (row_count,))
+            self._db.execute("DELETE FROM deleted WHERE row >= ?", (row_count,))
+            self._deleted = self._deleted[self._deleted < row_count]
+            self._live = None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
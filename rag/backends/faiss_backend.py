@@ -0,0 +1,302 @@
+"""FAISS vector index backend with memory-mapped on-disk indexes."""
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+try:
+    import faiss
+    HAS_FAISS = True
+except ImportError:
+    HAS_FAISS = False
+    faiss = None
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+from config import (
+    FAISS_INDEX_TYPE, FAISS_USE_MMAP, FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION,
+    FAISS_HNSW_EF_SEARCH, FAISS_IVF_NLIST, FAISS_IVF_NPROBE, FAISS_PQ_M, FAISS_PQ_NBITS,
+    METADATA_INDEX_FIELDS
+)
+from rag.backends.base import VectorBackend
+from rag.backends.docstore import SqliteDocstore
+from rag.metadata_index import open_metadata_index
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+METADATA_INDEX_FILE = "metadata_index.npz"
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+# Filters matching at most this many rows are scored exactly; HNSW and IVF
+# searches with a selector can miss matches of very selective filters.
+EXACT_FILTER_ROWS = 4096
+
+class FaissBackend(VectorBackend):
+    """Local FAISS index (flat, HNSW or IVF-PQ) with a SQLite docstore.
+
+    The index file is memory-mapped read-only at startup, so even very large
+    indexes open instantly and pages are only faulted in as searches touch
+    them. Chunk text and metadata live in a SQLite table keyed by FAISS row
+    id and are only read for the rows a search returns. Metadata filters are
+    resolved to a row bitmap and handed to FAISS as an ``IDSelector``, so
+    non-matching rows are never scored. Deleted chunks stay in the index
+    (HNSW cannot remove vectors) and are masked out the same way.
+    """
+
+    name = "faiss"
+
+    def __init__(
+        self,
+        path: Path,
+        embeddings,
+        index_type: Optional[str] = None,
+        use_mmap: Optional[bool] = None,
+        search_params: Optional[Dict[str, Any]] = None
+    ):
+        super().__init__(path, embeddings)
+        if not HAS_FAISS:
+            raise ImportError("FAISS not available. Install faiss-cpu.")
+        self.index_type = (index_type or FAISS_INDEX_TYPE).lower()
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type: {self.index_type}")
+        self.use_mmap = FAISS_USE_MMAP if use_mmap is None else use_mmap
+
+        params = search_params or {}
+        self.hnsw_m = params.get("hnsw_m", FAISS_HNSW_M)
+        self.ef_construction = params.get("ef_construction", FAISS_HNSW_EF_CONSTRUCTION)
+        self.ef_search = params.get("ef_search", FAISS_HNSW_EF_SEARCH)
+        self.nlist = params.get("nlist", FAISS_IVF_NLIST)
+        self.nprobe = params.get("nprobe", FAISS_IVF_NPROBE)
+        self.pq_m = params.get("pq_m", FAISS_PQ_M)
+        self.pq_nbits = params.get("pq_nbits", FAISS_PQ_NBITS)
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.path / INDEX_FILE
+        self.index = None
+        self._mmapped = False
+        # Vectors waiting for an IVF-PQ index to be trained
+        self._untrained: List[np.ndarray] = []
+        self._lock = threading.RLock()
+        self.docstore = SqliteDocstore(self.path / DOCSTORE_FILE)
+        self._load()
+        self.metadata_index = open_metadata_index(
+            self.path / METADATA_INDEX_FILE, METADATA_INDEX_FIELDS,
+            self.count(), self.docstore.metadatas
+        )
+
+    def _load(self):
+        """Open the saved index, memory-mapped when enabled."""
+        if not self.index_file.exists():
+            logger.info("FAISS index not found, starting empty", path=str(self.path))
+            return
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if self.use_mmap else 0
+        self.index = faiss.read_index(str(self.index_file), flags)
+        self._mmapped = bool(flags)
+        # Drop docstore rows written after the last index save
+        self.docstore.truncate(self.index.ntotal)
+        logger.info("FAISS index loaded", path=str(self.path),
+                   index_type=type(self.index).__name__,
+                   vectors=self.index.ntotal, mmap=self._mmapped)
+
+    def _new_index(self, dim: int):
+        """Create an empty index of the configured type."""
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = self.ef_construction
+            return index
+        if self.index_type == "ivfpq":
+            quantizer = faiss.IndexFlatIP(dim)
+            pq_m = _largest_divisor(dim, self.pq_m)
+            return faiss.IndexIVFPQ(quantizer, dim, self.nlist, pq_m,
+                                    self.pq_nbits, faiss.METRIC_INNER_PRODUCT)
+        return faiss.IndexFlatIP(dim)
+
+    def _writable_index(self, dim: int):
+        if self.index is None:
+            self.index = self._new_index(dim)
+        elif self._mmapped:
+            # Read-only mappings cannot grow; reload into memory before adding
+            self.index = faiss.read_index(str(self.index_file))
+            self._mmapped = False
+        return self.index
+
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        if not documents:
+            return []
+        return self.add_vectors(documents, self.embeddings.embed_documents(
+            [doc.page_content for doc in documents]))
+
+    def add_vectors(self, documents: List[Document], vectors) -> List[str]:
+        if not documents:
+            return []
+        vectors = _normalize(vectors)
+        ids = [str(uuid.uuid4()) for _ in documents]
+
+        with self._lock:
+            index = self._writable_index(vectors.shape[1])
+            first_row = index.ntotal + sum(len(v) for v in self._untrained)
+            self.docstore.add(first_row, ids, documents)
+            self.metadata_index.add(first_row, [doc.metadata for doc in documents])
+            if index.is_trained:
+                index.add(vectors)
+            else:
+                self._untrained.append(vectors)
+                self._train_pending(force=False)
+        return ids
+
+    def _train_pending(self, force: bool):
+        """Train an IVF-PQ index once enough vectors have been buffered."""
+        if not self._untrained:
+            return
+        vectors = np.concatenate(self._untrained)
+        min_train = max(self.nlist * 39, 2 ** self.pq_nbits)
+        if len(vectors) < min_train and not force:
+            return
+
+        index = self.index
+        if len(vectors) < max(index.nlist, 2 ** index.pq.nbits):
+            logger.warning("Too few vectors to train IVF-PQ, using a flat index",
+                          vectors=len(vectors))
+            index = faiss.IndexFlatIP(vectors.shape[1])
+        elif len(vectors) < min_train:
+            # Shrink the coarse quantizer to what the data can support
+            nlist = max(1, min(index.nlist, len(vectors) // 39))
+            pq_m = _largest_divisor(vectors.shape[1], self.pq_m)
+            index = faiss.IndexIVFPQ(faiss.IndexFlatIP(vectors.shape[1]), vectors.shape[1],
+                                     nlist, pq_m, self.pq_nbits, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        self.index = index
+        self._untrained = []
+        logger.info("FAISS index trained", index_type=type(index).__name__,
+                   vectors=len(vectors))
+
+    def similarity_search_by_vector(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        with self._lock:
+            scores, rows = self._search(vector, k, filter)
+            return self.docstore.hits(rows, scores)
+
+    def similarity_search_with_vectors(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Tuple[Document, float]], np.ndarray]:
+        with self._lock:
+            scores, rows = self._search(vector, k, filter)
+            ranked = self.docstore.ranked(rows, scores)
+            hit_rows = np.array([row for row, _, _ in ranked], dtype=np.int64)
+            if len(hit_rows):
+                vectors = self._vectors(hit_rows)
+            else:
+                vectors = np.empty((0, len(vector)), dtype=np.float32)
+        return [(doc, score) for _, doc, score in ranked], vectors
+
+    def _vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Stored (normalized) vectors of ``rows``."""
+        if self._untrained:
+            return np.concatenate(self._untrained)[rows]
+        if isinstance(self.index, faiss.IndexIVF):
+            self.index.make_direct_map()
+        return self.index.reconstruct_batch(rows)
+
+    def _search(
+        self,
+        vector: List[float],
+        k: int,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest rows and scores, searching the training buffer if untrained."""
+        empty = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        query = _normalize([vector])
+        mask = rows = None
+        if filter:
+            mask = self.metadata_index.evaluate(filter, self.count())
+        live = self.docstore.live_mask(self.count())
+        if live is not None:
+            mask = live if mask is None else mask & live
+        if mask is not None:
+            rows = np.flatnonzero(mask)
+            if len(rows) == 0:
+                return empty
+        if self._untrained or (rows is not None and len(rows) <= EXACT_FILTER_ROWS):
+            matrix = np.concatenate(self._untrained) if rows is None else self._vectors(rows)
+            scores, top = _exact_search(matrix, query, k)
+            return scores, top if rows is None else rows[top]
+        if self.index is None or self.index.ntotal == 0:
+            return empty
+        selector = bitmap = None
+        if mask is not None:
+            # The selector only holds a pointer; ``bitmap`` must outlive the search
+            bitmap = np.packbits(mask, bitorder="little")
+            selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        scores, found = self.index.search(query, k, params=self._search_params(selector))
+        return scores[0], found[0]
+
+    def _search_params(self, selector=None):
+        """Per-query search parameters for the loaded index type."""
+        index = self.index
+        if isinstance(index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=self.ef_search, sel=selector)
+        if isinstance(index, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(nprobe=self.nprobe, sel=selector)
+        return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        self.docstore.update_metadata(ids, metadatas)
+
+    def delete_source(self, source: str) -> List[str]:
+        with self._lock:
+            _, ids = self.docstore.delete_source(source)
+        return ids
+
+    def persist(self):
+        with self._lock:
+            self._train_pending(force=True)
+            if self.index is None:
+                return
+            tmp_file = self.index_file.with_suffix(".tmp")
+            faiss.write_index(self.index, str(tmp_file))
+            os.replace(tmp_file, self.index_file)
+            self.metadata_index.save(self.path / METADATA_INDEX_FILE)
+        logger.info("FAISS index saved", path=str(self.index_file), vectors=self.count())
+
+    def count(self) -> int:
+        indexed = self.index.ntotal if self.index is not None else 0
+        return indexed + sum(len(v) for v in self._untrained)
+
+    def close(self):
+        with self._lock:
+            self.index = None
+            self.docstore.close()
+
+def _normalize(vectors) -> np.ndarray:
+    """Convert to contiguous float32 rows of unit length."""
+    array = np.ascontiguousarray(np.asarray(vectors, dtype="float32"))
+    faiss.normalize_L2(array)
+    return array
+
+def _exact_search(matrix: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Brute-force inner-product search over a small in-memory matrix."""
+    scores = matrix @ query[0]
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return scores[top], top
+
+def _largest_divisor(dim: int, limit: int) -> int:
+    """Largest PQ sub-quantizer count not above ``limit`` that divides ``dim``."""
+    for m in range(min(limit, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
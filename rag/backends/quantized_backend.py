@@ -0,0 +1,244 @@
+"""NumPy vector index with quantized codes and exact rescoring."""
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+from config import (
+    QUANTIZATION_MODE, QUANTIZATION_DIMS, QUANTIZATION_OVERSAMPLE, METADATA_INDEX_FIELDS
+)
+from rag.backends.base import VectorBackend
+from rag.backends.docstore import SqliteDocstore
+from rag.metadata_index import open_metadata_index
+from rag.quantization import SCORE_BLOCK_ROWS, Quantizer, truncate_dims, two_stage_search
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CODES_FILE = "codes.npy"
+SCALES_FILE = "scales.npy"
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.json"
+DOCSTORE_FILE = "docstore.sqlite"
+METADATA_INDEX_FILE = "metadata_index.npz"
+
+class QuantizedBackend(VectorBackend):
+    """Two-stage search: int8/binary codes in RAM, float32 vectors on disk.
+
+    Only the compact codes are held in memory, in a buffer that grows by
+    doubling so batched ingestion stays linear. Full-precision vectors are
+    appended to a raw float32 file and memory-mapped on first use, so the
+    exact rescoring pass only pages in the candidate rows. When a batch goes
+    beyond the int8 scales, they are widened and the stored vectors encoded
+    again, so an early small batch never clips later ones. Metadata filters
+    select the matching code rows up front, so both passes only score rows
+    that pass the filter.
+    """
+
+    name = "quantized"
+
+    def __init__(
+        self,
+        path: Path,
+        embeddings,
+        mode: Optional[str] = None,
+        dims: Optional[int] = None,
+        oversample: Optional[int] = None
+    ):
+        super().__init__(path, embeddings)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.oversample = oversample or QUANTIZATION_OVERSAMPLE
+        self.dim: Optional[int] = None
+        # Codes of the first _count rows; the rest is spare capacity
+        self._codes: Optional[np.ndarray] = None
+        self._count = 0
+        self._full: Optional[np.memmap] = None
+        self._lock = threading.RLock()
+        self.docstore = SqliteDocstore(self.path / DOCSTORE_FILE)
+
+        meta = self._read_meta()
+        if meta:
+            # An existing index keeps the encoding it was built with
+            scales_file = self.path / SCALES_FILE
+            self.quantizer = Quantizer(
+                meta["mode"], meta.get("dims"),
+                np.load(scales_file) if scales_file.exists() else None
+            )
+            self.dim = meta["dim"]
+            self.codes = np.load(self.path / CODES_FILE)
+            self._discard_unsaved(len(self.codes))
+            logger.info("Quantized index loaded", path=str(self.path),
+                       vectors=len(self.codes), mode=self.quantizer.mode,
+                       code_bytes=int(self.codes.nbytes))
+        else:
+            self.quantizer = Quantizer(mode or QUANTIZATION_MODE, dims or QUANTIZATION_DIMS)
+        self.metadata_index = open_metadata_index(
+            self.path / METADATA_INDEX_FILE, METADATA_INDEX_FIELDS,
+            self.count(), self.docstore.metadatas
+        )
+
+    @property
+    def codes(self) -> Optional[np.ndarray]:
+        return None if self._codes is None else self._codes[:self._count]
+
+    @codes.setter
+    def codes(self, codes: Optional[np.ndarray]):
+        self._codes = codes
+        self._count = 0 if codes is None else len(codes)
+
+    def _append_codes(self, codes: np.ndarray):
+        needed = self._count + len(codes)
+        if self._codes is None or needed > len(self._codes):
+            capacity = max(needed, 2 * self._count, 1024)
+            grown = np.empty((capacity,) + codes.shape[1:], dtype=codes.dtype)
+            if self._codes is not None:
+                grown[:self._count] = self._codes[:self._count]
+            self._codes = grown
+        self._codes[self._count:needed] = codes
+        self._count = needed
+
+    def _reencode(self):
+        """Encode the stored vectors again after the scales were widened."""
+        full_vectors = self._full_vectors()
+        for start in range(0, self._count, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, self._count)
+            self._codes[start:end] = self.quantizer.encode(np.asarray(full_vectors[start:end]))
+        logger.info("Quantized codes re-encoded for wider scales", vectors=self._count)
+
+    def _read_meta(self) -> Optional[dict]:
+        meta_file = self.path / META_FILE
+        if not meta_file.exists():
+            return None
+        with open(meta_file, "r") as f:
+            return json.load(f)
+
+    def _discard_unsaved(self, count: int):
+        """Trim vectors and docstore rows written after the last persist."""
+        vectors_file = self.path / VECTORS_FILE
+        expected = count * self.dim * 4
+        if vectors_file.exists() and vectors_file.stat().st_size > expected:
+            os.truncate(vectors_file, expected)
+        self.docstore.truncate(count)
+
+    def _full_vectors(self) -> np.memmap:
+        """Memory-map the full-precision vectors on first use."""
+        if self._full is None or len(self._full) != self.count():
+            self._full = np.memmap(self.path / VECTORS_FILE, dtype=np.float32,
+                                   mode="r", shape=(self.count(), self.dim))
+        return self._full
+
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        if not documents:
+            return []
+        return self.add_vectors(documents, self.embeddings.embed_documents(
+            [doc.page_content for doc in documents]))
+
+    def add_vectors(self, documents: List[Document], vectors) -> List[str]:
+        if not documents:
+            return []
+        vectors = truncate_dims(vectors, None)
+        ids = [str(uuid.uuid4()) for _ in documents]
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if self.quantizer.widen(vectors) and self.count():
+                self._reencode()
+            codes = self.quantizer.encode(vectors)
+            self.docstore.add(self.count(), ids, documents)
+            self.metadata_index.add(self.count(), [doc.metadata for doc in documents])
+            with open(self.path / VECTORS_FILE, "ab") as f:
+                f.write(vectors.tobytes())
+            self._append_codes(codes)
+            self._full = None
+        return ids
+
+    def similarity_search_by_vector(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        hits, _ = self.similarity_search_with_vectors(vector, k, filter)
+        return hits
+
+    def similarity_search_with_vectors(
+        self,
+        vector: List[float],
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Tuple[Document, float]], np.ndarray]:
+        empty = [], np.empty((0, len(vector)), dtype=np.float32)
+        with self._lock:
+            if self.codes is None or len(self.codes) == 0:
+                return empty
+            mask = None
+            if filter:
+                mask = self.metadata_index.evaluate(filter, self.count())
+            live = self.docstore.live_mask(self.count())
+            if live is not None:
+                mask = live if mask is None else mask & live
+            allowed = None
+            if mask is not None:
+                allowed = np.flatnonzero(mask)
+                if len(allowed) == 0:
+                    return empty
+            full_vectors = self._full_vectors()
+            scores, rows = two_stage_search(
+                self.quantizer, self.codes, full_vectors,
+                np.asarray(vector, dtype=np.float32), k, self.oversample, rows=allowed
+            )
+        ranked = self.docstore.ranked(rows, scores)
+        hit_rows = np.array([row for row, _, _ in ranked], dtype=np.int64)
+        return [(doc, score) for _, doc, score in ranked], np.asarray(full_vectors[hit_rows])
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        self.docstore.update_metadata(ids, metadatas)
+
+    def delete_source(self, source: str) -> List[str]:
+        with self._lock:
+            _, ids = self.docstore.delete_source(source)
+        return ids
+
+    def persist(self):
+        with self._lock:
+            if self.codes is None:
+                return
+            with open(self.path / VECTORS_FILE, "ab") as f:
+                os.fsync(f.fileno())
+            _atomic_save(self.path / CODES_FILE, self.codes)
+            if self.quantizer.scales is not None:
+                _atomic_save(self.path / SCALES_FILE, self.quantizer.scales)
+            meta = {
+                "dim": self.dim,
+                "count": self.count(),
+                "mode": self.quantizer.mode,
+                "dims": self.quantizer.dims
+            }
+            tmp_file = self.path / (META_FILE + ".tmp")
+            with open(tmp_file, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_file, self.path / META_FILE)
+            self.metadata_index.save(self.path / METADATA_INDEX_FILE)
+        logger.info("Quantized index saved", path=str(self.path), vectors=self.count(),
+                   code_bytes=int(self.codes.nbytes))
+
+    def count(self) -> int:
+        return 0 if self.codes is None else len(self.codes)
+
+    def close(self):
+        with self._lock:
+            self._full = None
+            self.docstore.close()
+
+def _atomic_save(path: Path, array: np.ndarray):
+    tmp_file = path.with_name(path.name + ".tmp")
+    with open(tmp_file, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_file, path)
@@ -0,0 +1,173 @@
+"""Compressed, memory-mapped store of document text addressed by byte offsets."""
+import bisect
+import json
+import mmap
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DATA_FILE = "texts.zz"
+INDEX_FILE = "texts.json"
+BLOCK_BYTES = 64 * 1024
+
+class ChunkTextStore:
+    """Append-only text store that chunks reference as (doc_id, offset, length).
+
+    Document bytes are appended to one stream, cut into ``BLOCK_BYTES``
+    blocks and zlib-compressed into a single file that is memory-mapped for
+    reads. Chunks carry only a pointer into their document, so overlapping
+    chunks share storage, and a read decompresses just the blocks it spans
+    (recent blocks are cached). Chunks are added in document order; bytes
+    already stored for a document are not written again.
+    """
+
+    def __init__(self, path: Path, block_bytes: int = BLOCK_BYTES, cache_blocks: int = 64):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.block_bytes = block_bytes
+        self._lock = threading.RLock()
+        # Per block: file offset, compressed length, first raw byte
+        self._blocks: List[List[int]] = []
+        self._block_starts: List[int] = []
+        # Per document: segments of [doc offset, raw offset, length]
+        self._docs: Dict[str, List[List[int]]] = {}
+        self._flushed_size = 0
+        self._buffer = bytearray()
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._cache_blocks = cache_blocks
+        self._mmap: Optional[mmap.mmap] = None
+        self._load()
+        self._file = open(self.path / DATA_FILE, "ab")
+
+    def _load(self):
+        index_file = self.path / INDEX_FILE
+        data_file = self.path / DATA_FILE
+        file_size = 0
+        if index_file.exists():
+            with open(index_file, "r") as f:
+                index = json.load(f)
+            self._blocks = index["blocks"]
+            self._block_starts = [start for _, _, start in self._blocks]
+            self._docs = index["docs"]
+            self._flushed_size = index["raw_size"]
+            if self._blocks:
+                offset, length, _ = self._blocks[-1]
+                file_size = offset + length
+        # Drop blocks written after the last persist
+        if data_file.exists() and data_file.stat().st_size > file_size:
+            os.truncate(data_file, file_size)
+
+    @property
+    def raw_size(self) -> int:
+        return self._flushed_size + len(self._buffer)
+
+    def append(self, doc_id: str, offset: int, data: bytes):
+        """Store ``data`` at byte ``offset`` of document ``doc_id``.
+
+        Bytes overlapping what is already stored for the document are
+        skipped; a gap (e.g. whitespace the splitter stripped) is filled with
+        spaces so later offsets stay aligned.
+        """
+        with self._lock:
+            segments = self._docs.setdefault(doc_id, [])
+            end = segments[-1][0] + segments[-1][2] if segments else 0
+            if offset + len(data) <= end:
+                return
+            if offset > end:
+                data = b" " * (offset - end) + data
+            else:
+                data = data[end - offset:]
+            start = self.raw_size
+            if segments and segments[-1][1] + segments[-1][2] == start:
+                segments[-1][2] += len(data)
+            else:
+                segments.append([end, start, len(data)])
+            self._buffer += data
+            while len(self._buffer) >= self.block_bytes:
+                self._flush_block(self.block_bytes)
+
+    def _flush_block(self, size: int):
+        block = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        compressed = zlib.compress(block, 6)
+        file_offset = self._blocks[-1][0] + self._blocks[-1][1] if self._blocks else 0
+        self._file.write(compressed)
+        self._blocks.append([file_offset, len(compressed), self._flushed_size])
+        self._block_starts.append(self._flushed_size)
+        self._flushed_size += len(block)
+
+    def read(self, doc_id: str, offset: int, length: int) -> str:
+        """Text of ``length`` bytes at ``offset`` in document ``doc_id``."""
+        with self._lock:
+            parts = []
+            for doc_offset, start, size in self._docs.get(doc_id, ()):
+                lo = max(offset, doc_offset)
+                hi = min(offset + length, doc_offset + size)
+                if lo < hi:
+                    parts.append(self._read_raw(start + lo - doc_offset, hi - lo))
+        return b"".join(parts).decode("utf-8", errors="replace")
+
+    def _read_raw(self, start: int, length: int) -> bytes:
+        parts = []
+        end = start + length
+        while start < end:
+            if start >= self._flushed_size:
+                parts.append(bytes(self._buffer[start - self._flushed_size:end - self._flushed_size]))
+                break
+            index = bisect.bisect_right(self._block_starts, start) - 1
+            block = self._block(index)
+            block_start = self._block_starts[index]
+            piece = block[start - block_start:end - block_start]
+            parts.append(piece)
+            start += len(piece)
+        return b"".join(parts)
+
+    def _block(self, index: int) -> bytes:
+        block = self._cache.get(index)
+        if block is None:
+            offset, length, _ = self._blocks[index]
+            mapped = self._mapped(offset + length)
+            block = zlib.decompress(mapped[offset:offset + length])
+            self._cache[index] = block
+            if len(self._cache) > self._cache_blocks:
+                self._cache.popitem(last=False)
+        self._cache.move_to_end(index)
+        return block
+
+    def _mapped(self, size: int) -> mmap.mmap:
+        """Memory map of the data file covering at least ``size`` bytes."""
+        if self._mmap is None or len(self._mmap) < size:
+            self._file.flush()
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.path / DATA_FILE, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def persist(self):
+        """Compress the partial block and atomically save the block index."""
+        with self._lock:
+            if self._buffer:
+                self._flush_block(len(self._buffer))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            index = {"blocks": self._blocks, "docs": self._docs, "raw_size": self._flushed_size}
+            tmp_file = self.path / (INDEX_FILE + ".tmp")
+            with open(tmp_file, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_file, self.path / INDEX_FILE)
+        logger.info("Chunk text store saved", path=str(self.path), raw_bytes=self._flushed_size,
+                   compressed_bytes=self._blocks[-1][0] + self._blocks[-1][1] if self._blocks else 0)
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._file.close()
@@ -0,0 +1,176 @@
+"""Token-budgeted context windows around retrieved child chunks."""
+from typing import Any, Callable, Dict, List, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Tokens added to a window per expansion round
+EXPAND_STEP_TOKENS = 64
+# Bytes per token assumed when a chunk's own ratio is unknown
+BYTES_PER_TOKEN = 4.0
+
+def token_counter(model: str) -> Callable[[str], int]:
+    """Token counter for ``model``, estimating 4 bytes a token without tiktoken."""
+    try:
+        from rag.token_chunker import get_encoding
+        encoding = get_encoding(model)
+        return lambda text: len(encoding.encode_ordinary(text))
+    except Exception as e:
+        logger.warning("Tokenizer unavailable, estimating token counts",
+                      model=model, error=str(e))
+        return lambda text: int(len(text.encode("utf-8")) / BYTES_PER_TOKEN + 0.5)
+
+class _Window:
+    """Byte range of one document shown for one or more hits."""
+
+    __slots__ = ("doc_id", "lo", "hi", "chunk_lo", "chunk_hi", "floor", "ceiling",
+                 "bytes_per_token", "rank", "source", "score", "content", "growing")
+
+    def __init__(self, rank: int, doc: Dict[str, Any], tokens: int):
+        ref = doc.get("ref") or {}
+        content = doc.get("content", "")
+        self.rank = rank
+        self.source = doc.get("source", "unknown")
+        self.score = doc.get("score")
+        self.content = content
+        self.doc_id = ref.get("doc_id")
+        self.lo = ref.get("byte_offset", 0)
+        self.hi = self.lo + ref.get("byte_length", len(content.encode("utf-8")))
+        self.chunk_lo, self.chunk_hi = self.lo, self.hi
+        # Without a parent section the window cannot grow past the chunk
+        self.floor = min(self.lo, ref.get("parent_offset", self.lo))
+        self.ceiling = max(self.hi, self.floor + ref.get("parent_length", 0))
+        self.bytes_per_token = (self.hi - self.lo) / tokens if tokens else BYTES_PER_TOKEN
+        self.growing = False
+
+    def update(self):
+        self.growing = self.lo > self.floor or self.hi < self.ceiling
+
+    @property
+    def tokens(self) -> float:
+        return (self.hi - self.lo) / self.bytes_per_token
+
+class ContextExpander:
+    """Packs retrieved chunks into a token budget, widening them into their parents.
+
+    Every hit first gets its own chunk text, in rank order, while the budget
+    lasts. Leftover budget is then handed out in rounds of
+    ``EXPAND_STEP_TOKENS`` per window, best hit first, growing each window
+    evenly around its chunk until it fills the parent section
+    (``parent_offset``/``parent_length``). Windows on the same document that
+    come to overlap are merged, so shared text is counted and shown once.
+    Expanded text is read with ``read_text(doc_id, offset, length)``; token
+    costs of the added bytes are estimated from each chunk's own
+    bytes-per-token ratio.
+    """
+
+    def __init__(
+        self,
+        read_text: Optional[Callable[[str, int, int], str]] = None,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        step_tokens: int = EXPAND_STEP_TOKENS
+    ):
+        self.read_text = read_text
+        self.count_tokens = count_tokens or token_counter("cl100k_base")
+        self.step_tokens = step_tokens
+
+    def expand(self, documents: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+        """Context sections (``source``, ``score``, ``content``) for ranked hits."""
+        windows: List[_Window] = []
+        used = 0.0
+        for rank, doc in enumerate(documents):
+            content = doc.get("content", "")
+            if not content:
+                continue
+            tokens = self.count_tokens(content)
+            if used + tokens > token_budget:
+                if not windows:
+                    # Even the best hit is over budget: show its head
+                    ratio = len(content) / max(tokens, 1)
+                    return [self._section(doc.get("source", "unknown"), doc.get("score"),
+                                          content[:int(token_budget * ratio)])]
+                continue
+            window = _Window(rank, doc, tokens)
+            # Only text the store holds can be merged or widened
+            if window.doc_id is not None and not (
+                    self.read_text and self.read_text(window.doc_id, window.lo, 1)):
+                window.doc_id = None
+            windows.append(window)
+            used += window.tokens
+
+        windows = self._merge(windows)
+        for window in windows:
+            if window.doc_id is not None:
+                window.update()
+        if any(window.growing for window in windows):
+            windows = self._grow(windows, token_budget)
+        sections = [self._read(window) for window in sorted(windows, key=lambda w: w.rank)]
+        logger.debug("Context expanded", hits=len(documents), sections=len(sections),
+                    tokens=int(sum(window.tokens for window in windows)), budget=token_budget)
+        return sections
+
+    def _grow(self, windows: List[_Window], token_budget: int) -> List[_Window]:
+        used = sum(window.tokens for window in windows)
+        while True:
+            grew = False
+            for window in windows:
+                if not window.growing:
+                    continue
+                step = min(self.step_tokens, token_budget - used)
+                if step < 1:
+                    return windows
+                extra = int(step * window.bytes_per_token)
+                room_before, room_after = window.lo - window.floor, window.ceiling - window.hi
+                before = min(room_before, extra // 2)
+                after = min(room_after, extra - before)
+                before = min(room_before, extra - after)
+                window.lo -= before
+                window.hi += after
+                window.update()
+                used += (before + after) / window.bytes_per_token
+                grew = grew or before + after > 0
+            merged = self._merge(windows)
+            if len(merged) < len(windows):
+                windows = merged
+                used = sum(window.tokens for window in windows)
+            if not grew:
+                return windows
+
+    def _merge(self, windows: List[_Window]) -> List[_Window]:
+        """Union overlapping windows of the same document, keeping the better rank."""
+        merged: List[_Window] = []
+        by_doc: Dict[str, List[_Window]] = {}
+        for window in sorted(windows, key=lambda w: w.rank):
+            if window.doc_id is None:
+                merged.append(window)
+                continue
+            for other in by_doc.setdefault(window.doc_id, []):
+                if window.lo <= other.hi and other.lo <= window.hi:
+                    other.lo, other.hi = min(other.lo, window.lo), max(other.hi, window.hi)
+                    other.chunk_lo = min(other.chunk_lo, window.chunk_lo)
+                    other.chunk_hi = max(other.chunk_hi, window.chunk_hi)
+                    other.floor = min(other.floor, window.floor)
+                    other.ceiling = max(other.ceiling, window.ceiling)
+                    other.update()
+                    break
+            else:
+                by_doc[window.doc_id].append(window)
+                merged.append(window)
+        return merged
+
+    def _read(self, window: _Window) -> Dict[str, Any]:
+        text = ""
+        if window.doc_id is not None:
+            text = self.read_text(window.doc_id, window.lo, window.hi - window.lo)
+            # Drop the partial word (or character) left at a widened edge
+            head = text.split(None, 1)
+            if window.floor < window.lo < window.chunk_lo and len(head) == 2:
+                text = head[1]
+            tail = text.rsplit(None, 1)
+            if window.chunk_hi < window.hi < window.ceiling and len(tail) == 2:
+                text = tail[0]
+        return self._section(window.source, window.score, text.strip() or window.content)
+
+    @staticmethod
+    def _section(source: str, score: Optional[float], content: str) -> Dict[str, Any]:
+        return {"source": source, "score": score, "content": content}
@@ -0,0 +1,288 @@
+"""Exact and near-duplicate chunk detection with persisted fingerprints."""
+import hashlib
+import re
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SHINGLE_WORDS = 3
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """Case- and whitespace-insensitive form used for fingerprints."""
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+def fingerprint(text: str) -> str:
+    """Exact-duplicate fingerprint of a chunk."""
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+class MinHasher:
+    """MinHash signatures over word shingles, computed with NumPy.
+
+    Shingle hashes are combined from per-word CRC32s, and all permutations
+    are applied at once as a ``(num_perm, shingles)`` universal-hash matrix
+    (uint64 arithmetic wraps, which is fine for hashing). Signatures are
+    stable across processes, so they can be persisted.
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        words = normalize_text(text).split() or [""]
+        hashes = np.array([zlib.crc32(w.encode("utf-8")) for w in words], dtype=np.uint64)
+        span = min(SHINGLE_WORDS, len(hashes))
+        shingles = np.zeros(len(hashes) - span + 1, dtype=np.uint64)
+        for offset in range(span):
+            shingles = shingles * np.uint64(0x100000001B3) + hashes[offset:len(shingles) + offset]
+        shingles = np.unique(shingles)
+        return (self.a[:, None] * shingles[None, :] + self.b[:, None]).min(axis=1)
+
+class ChunkDeduplicator:
+    """Corpus-wide chunk dedup: exact fingerprints plus MinHash LSH.
+
+    ``partition`` splits a batch into chunks to index and duplicates of
+    chunks already kept (earlier in the batch or in the index). Survivors
+    get ``duplicate_sources`` (the other sources, ``"; "``-joined, since
+    vector store metadata must be scalar) and ``duplicate_count``. The
+    fingerprints live in SQLite next to the index and are only written by
+    ``persist``, so they never get ahead of the vectors.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        threshold: float = 0.85,
+        num_perm: int = 128,
+        bands: int = 16
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.db_path = Path(db_path)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self._lock = threading.Lock()
+        self._exact: Dict[str, str] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, bytes], List[str]] = {}
+        self._duplicates: Dict[str, Tuple[List[str], int]] = {}
+        # Fingerprint and source of each kept chunk
+        self._entries: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._pending: List[Tuple[str, str, np.ndarray]] = []
+        self._dirty: set = set()
+        self.stats = {"exact": 0, "near": 0, "kept": 0}
+
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                chunk_id TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                source TEXT,
+                duplicate_sources TEXT,
+                duplicate_count INTEGER DEFAULT 0
+            )
+        """)
+        self._db.commit()
+        self._load()
+
+    def _load(self):
+        rows = self._db.execute(
+            "SELECT chunk_id, fingerprint, signature, source, duplicate_sources, duplicate_count "
+            "FROM fingerprints").fetchall()
+        for chunk_id, digest, signature, source, sources, count in rows:
+            self._remember(chunk_id, digest, np.frombuffer(signature, dtype=np.uint64), source)
+            if count:
+                self._duplicates[chunk_id] = (sources.split("; ") if sources else [], count)
+        if rows:
+            logger.info("Dedup fingerprints loaded", path=str(self.db_path), chunks=len(rows))
+
+    def _remember(self, key: str, digest: str, signature: np.ndarray, source: Optional[str]):
+        self._exact.setdefault(digest, key)
+        self._entries[key] = (digest, source)
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets.setdefault((band, band_key), []).append(key)
+
+    def _band_keys(self, signature: np.ndarray):
+        r = self.rows_per_band
+        for band in range(self.bands):
+            yield band, signature[band * r:(band + 1) * r].tobytes()
+
+    def _near_duplicate(self, signature: np.ndarray) -> Optional[str]:
+        """A kept chunk whose estimated Jaccard similarity passes the threshold."""
+        seen = set()
+        for band, band_key in self._band_keys(signature):
+            for key in self._buckets.get((band, band_key), ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                if np.mean(self._signatures[key] == signature) >= self.threshold:
+                    return key
+        return None
+
+    def partition(
+        self,
+        documents: Sequence[Document]
+    ) -> Tuple[List[Document], Dict[str, Dict[str, Any]]]:
+        """Split documents into ones to index and metadata updates for survivors.
+
+        Returns the documents to index (survivors within the batch already
+        carry their duplicate metadata) and metadata patches keyed by chunk
+        id for survivors that are already indexed. Call ``assign_ids`` with
+        the ids the index gives the returned documents.
+        """
+        with self._lock:
+            unique: List[Document] = []
+            survivors: Dict[str, List[Document]] = {}
+            for doc in documents:
+                digest = fingerprint(doc.page_content)
+                key = self._exact.get(digest)
+                signature = None
+                if key is not None:
+                    self.stats["exact"] += 1
+                else:
+                    signature = self.hasher.signature(doc.page_content)
+                    key = self._near_duplicate(signature)
+                    if key is not None:
+                        self.stats["near"] += 1
+                if key is not None:
+                    survivors.setdefault(key, []).append(doc)
+                    continue
+                key = f"pending:{len(unique)}"
+                self._remember(key, digest, signature, doc.metadata.get("source"))
+                self._pending.append((key, digest, signature))
+                unique.append(doc)
+            self.stats["kept"] += len(unique)
+
+            updates: Dict[str, Dict[str, Any]] = {}
+            for key, duplicates in survivors.items():
+                if key.startswith("pending:"):
+                    position = int(key.split(":", 1)[1])
+                    doc = unique[position]
+                    patch = self._record(key, duplicates)
+                    unique[position] = Document(page_content=doc.page_content,
+                                                metadata={**doc.metadata, **patch})
+                else:
+                    updates[key] = self._record(key, duplicates)
+            return unique, updates
+
+    def _record(self, key: str, duplicates: List[Document]) -> Dict[str, Any]:
+        """Add duplicates to a survivor's record and return its metadata patch."""
+        own_source = self._entries[key][1]
+        sources, count = self._duplicates.get(key, ([], 0))
+        for doc in duplicates:
+            source = doc.metadata.get("source")
+            if source and source != own_source and source not in sources:
+                sources.append(source)
+        count += len(duplicates)
+        self._duplicates[key] = (sources, count)
+        self._dirty.add(key)
+        return {"duplicate_sources": "; ".join(sources), "duplicate_count": count}
+
+    def assign_ids(self, ids: Sequence[str]):
+        """Replace the provisional keys of the last ``partition`` with index ids."""
+        with self._lock:
+            if len(ids) != len(self._pending):
+                self._forget_pending()
+                return
+            renamed = {key: chunk_id for (key, _, _), chunk_id in zip(self._pending, ids)}
+            for key, digest, signature in self._pending:
+                chunk_id = renamed[key]
+                self._exact[digest] = chunk_id
+                self._entries[chunk_id] = self._entries.pop(key)
+                self._signatures[chunk_id] = self._signatures.pop(key)
+                if key in self._duplicates:
+                    self._duplicates[chunk_id] = self._duplicates.pop(key)
+                self._dirty.discard(key)
+                self._dirty.add(chunk_id)
+                for band, band_key in self._band_keys(signature):
+                    bucket = self._buckets[(band, band_key)]
+                    bucket[bucket.index(key)] = chunk_id
+            self._pending = []
+
+    def _forget_pending(self):
+        """Drop provisional entries after a failed add."""
+        for key, digest, signature in self._pending:
+            if self._exact.get(digest) == key:
+                del self._exact[digest]
+            self._entries.pop(key, None)
+            self._signatures.pop(key, None)
+            self._duplicates.pop(key, None)
+            self._dirty.discard(key)
+            for band, band_key in self._band_keys(signature):
+                self._buckets[(band, band_key)].remove(key)
+        self._pending = []
+
+    def discard_pending(self):
+        """Forget the last ``partition`` when indexing its documents failed."""
+        with self._lock:
+            self._forget_pending()
+
+    def forget(self, chunk_ids: Sequence[str]) -> List[str]:
+        """Drop the fingerprints of deleted chunks.
+
+        Returns the other sources whose duplicates of those chunks were
+        skipped; they are no longer in the index and need reindexing.
+        """
+        with self._lock:
+            orphaned: List[str] = []
+            forgotten = []
+            for key in chunk_ids:
+                entry = self._entries.pop(key, None)
+                if entry is None:
+                    continue
+                digest, _ = entry
+                if self._exact.get(digest) == key:
+                    del self._exact[digest]
+                signature = self._signatures.pop(key)
+                for band, band_key in self._band_keys(signature):
+                    bucket = self._buckets.get((band, band_key))
+                    if bucket and key in bucket:
+                        bucket.remove(key)
+                        if not bucket:
+                            del self._buckets[(band, band_key)]
+                sources, _ = self._duplicates.pop(key, ([], 0))
+                orphaned.extend(s for s in sources if s not in orphaned)
+                self._dirty.discard(key)
+                forgotten.append((key,))
+            self._db.executemany("DELETE FROM fingerprints WHERE chunk_id = ?", forgotten)
+            self._db.commit()
+            return orphaned
+
+    def persist(self):
+        """Write fingerprints of chunks kept or updated since the last persist."""
+        with self._lock:
+            rows = []
+            for key in self._dirty:
+                if key.startswith("pending:") or key not in self._signatures:
+                    continue
+                digest, source = self._entries[key]
+                sources, count = self._duplicates.get(key, ([], 0))
+                rows.append((key, digest, self._signatures[key].tobytes(), source,
+                             "; ".join(sources), count))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO fingerprints "
+                "(chunk_id, fingerprint, signature, source, duplicate_sources, duplicate_count) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+            self._dirty = set()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,6 +1,9 @@
 """Document processing with multi-format support including images."""
+import mmap
 import os
-from typing import List
+import re
+import uuid
+from typing import Any, Dict, Iterator, List, Tuple
 try:
     from langchain_text_splitters import RecursiveCharacterTextSplitter
 except ImportError:
@@ -37,24 +40,58 @@ except ImportError:
     HAS_PPTX = False
 
 import pypdf
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_LENGTH_UNIT, EMBEDDING_MODEL, STREAM_WINDOW_MB,
+    PARENT_CHUNK_SIZE
+)
+from rag.token_chunker import build_token_chunker
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# What ``surrogateescape`` decodes each invalid UTF-8 byte to
+_ESCAPED_BYTE = re.compile("[\udc80-\udcff]")
+
 class DocumentProcessor:
     """Processes various document formats and extracts text with image OCR."""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(
+        self,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_overlap: int = CHUNK_OVERLAP,
+        length_unit: str = CHUNK_LENGTH_UNIT,
+        parent_chunk_size: int = PARENT_CHUNK_SIZE
+    ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        self.length_unit = length_unit.lower()
+        # Token chunks match the embedding model's window; sizes are then in tokens
+        self.text_splitter = None
+        if self.length_unit == "tokens":
+            self.text_splitter = build_token_chunker(chunk_size, chunk_overlap, EMBEDDING_MODEL)
+            if self.text_splitter is None:
+                self.length_unit = "chars"
+        if self.text_splitter is None:
+            self.text_splitter = self._char_splitter(chunk_size, chunk_overlap)
+        # Child chunks are cut from parent sections, which bound context expansion
+        self.parent_splitter = None
+        if parent_chunk_size > chunk_size:
+            if self.length_unit == "tokens":
+                self.parent_splitter = build_token_chunker(parent_chunk_size, 0, EMBEDDING_MODEL)
+            else:
+                self.parent_splitter = self._char_splitter(parent_chunk_size, 0)
+        logger.info("DocumentProcessor initialized", 
+                   chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                   length_unit=self.length_unit,
+                   parent_chunk_size=parent_chunk_size if self.parent_splitter else 0)
+    
+    def _char_splitter(self, chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+        return RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             length_function=len,
             separators=["\n\n", "\n", ". ", " ", ""]
         )
-        logger.info("DocumentProcessor initialized", 
-                   chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     
     def extract_text_from_image(self, image_path: str) -> str:
         """Extract text from image using OCR."""
@@ -170,6 +207,117 @@ class DocumentProcessor:
             logger.error("TXT processing failed", file_path=file_path, error=str(e))
         return documents
     
+    def iter_txt_chunks(self, file_path: str) -> Iterator[Document]:
+        """Stream chunks of a plain text file without reading it into memory.
+        
+        The file is memory-mapped and decoded one window (``STREAM_WINDOW_MB``)
+        at a time; windows end on a blank line or newline where possible, so
+        chunks rarely straddle them. Each chunk records the file's ``doc_id`` and
+        its ``byte_offset`` and ``byte_length`` in the file (plus its parent
+        section's, see ``chunk_documents``). Peak memory is about one window plus its
+        chunks, whatever the file size.
+        """
+        window = max(1, int(STREAM_WINDOW_MB * 1024 * 1024))
+        doc_id = str(uuid.uuid4())
+        with open(file_path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                start = 0
+                total = 0
+                while start < size:
+                    end = self._window_end(mapped, start, min(start + window, size), size)
+                    text = self._decode_window(mapped[start:end])
+                    for chunk, byte_offset, parent in self._chunk_text(text, start):
+                        total += 1
+                        yield Document(
+                            page_content=chunk,
+                            metadata={"source": file_path, "type": "txt", "doc_id": doc_id,
+                                      "byte_offset": byte_offset,
+                                      "byte_length": len(chunk.encode("utf-8")), **parent}
+                        )
+                    self._release_window(mapped, start, end)
+                    start = end
+        logger.info("TXT streamed", file_path=file_path, bytes=size, chunks=total)
+    
+    def _decode_window(self, data: bytes) -> str:
+        """Decode UTF-8, turning each invalid byte into one "?".
+        
+        A replacement character would take three bytes where the file has
+        one, shifting every later chunk's ``byte_offset``; "?" keeps the text's
+        UTF-8 encoding exactly as long as the bytes it came from.
+        """
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            return _ESCAPED_BYTE.sub("?", data.decode("utf-8", errors="surrogateescape"))
+    
+    def _release_window(self, mapped: mmap.mmap, start: int, end: int):
+        """Drop pages of a finished window from this process's resident set."""
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        page_start = start - start % mmap.PAGESIZE
+        page_end = end - end % mmap.PAGESIZE
+        if page_end > page_start:
+            mapped.madvise(mmap.MADV_DONTNEED, page_start, page_end - page_start)
+    
+    def _window_end(self, mapped: mmap.mmap, start: int, end: int, size: int) -> int:
+        """Pull a window end back to a paragraph/line break or a UTF-8 character start."""
+        if end >= size:
+            return size
+        floor = start + (end - start) // 2
+        for separator in (b"\n\n", b"\n"):
+            cut = mapped.rfind(separator, floor, end)
+            if cut >= 0:
+                return cut + len(separator)
+        while end > start + 1 and mapped[end] & 0xC0 == 0x80:
+            end -= 1
+        return end
+    
+    def _chunk_text(self, text: str, base: int = 0) -> Iterator[Tuple[str, int, Dict[str, Any]]]:
+        """Child chunks of ``text`` with byte offsets and parent-section metadata.
+        
+        Offsets are shifted by ``base`` bytes. Without a parent splitter the
+        metadata is empty; otherwise it holds the ``parent_offset`` and
+        ``parent_length`` of the section the chunk was cut from.
+        """
+        if self.parent_splitter is None:
+            for chunk, byte_offset in self._split_with_byte_offsets(text):
+                yield chunk, base + byte_offset, {}
+            return
+        for section, section_offset in self._split_with_byte_offsets(text, self.parent_splitter):
+            parent = {"parent_offset": base + section_offset,
+                      "parent_length": len(section.encode("utf-8"))}
+            for chunk, byte_offset in self._split_with_byte_offsets(section):
+                yield chunk, base + section_offset + byte_offset, parent
+    
+    def _split_with_byte_offsets(self, text: str, splitter=None) -> Iterator[Tuple[str, int]]:
+        """Chunks of ``text`` with the UTF-8 byte offset where each starts."""
+        splitter = splitter or self.text_splitter
+        starts = []
+        if hasattr(splitter, "split_spans"):
+            for span_start, span_end in splitter.split_spans(text):
+                raw = text[span_start:span_end]
+                starts.append((raw.strip(), span_start + len(raw) - len(raw.lstrip())))
+        else:
+            cursor = 0
+            for chunk in splitter.split_text(text):
+                index = text.find(chunk, cursor)
+                index = cursor if index < 0 else index
+                starts.append((chunk, index))
+                cursor = index + 1
+        ascii_text = text.isascii()
+        char_pos = byte_pos = 0
+        for chunk, char_start in starts:
+            if not chunk:
+                continue
+            if not ascii_text:
+                # Chunk starts only move forward, so count bytes incrementally
+                byte_pos += len(text[char_pos:char_start].encode("utf-8"))
+                char_pos = char_start
+            yield chunk, char_start if ascii_text else byte_pos
+    
     def process_pptx(self, file_path: str) -> List[Document]:
         """Process PowerPoint presentation."""
         if not HAS_PPTX:
@@ -243,11 +391,23 @@ class DocumentProcessor:
         return processor(file_path)
     
     def chunk_documents(self, documents: List[Document]) -> List[Document]:
-        """Chunk documents with overlap strategy."""
+        """Chunk documents with overlap strategy.
+        
+        Chunks keep the document's metadata plus a ``doc_id`` shared by all
+        chunks of the document and their ``byte_offset``/``byte_length`` in
+        its UTF-8 text. With a parent chunk size, documents are first cut
+        into parent sections and chunks also carry their section's
+        ``parent_offset``/``parent_length``.
+        """
         chunked_docs = []
         for doc in documents:
-            chunks = self.text_splitter.split_documents([doc])
-            chunked_docs.extend(chunks)
+            doc_id = str(uuid.uuid4())
+            for chunk, byte_offset, parent in self._chunk_text(doc.page_content):
+                chunked_docs.append(Document(
+                    page_content=chunk,
+                    metadata={**doc.metadata, "doc_id": doc_id, "byte_offset": byte_offset,
+                              "byte_length": len(chunk.encode("utf-8")), **parent}
+                ))
         
         logger.info("Documents chunked", 
                    original_count=len(documents), 
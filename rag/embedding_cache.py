@@ -0,0 +1,173 @@
+"""Query embedding cache with micro-batching of concurrent lookups."""
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    from langchain.embeddings.base import Embeddings
+from utils.logger import get_logger
+from utils.shared_cache import SharedCache
+
+logger = get_logger(__name__)
+
+class _PendingBatch:
+    """Queries collected during one batching window."""
+
+    def __init__(self):
+        self.queries: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.vectors: Optional[List[List[float]]] = None
+        self.error: Optional[BaseException] = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embeddings model with an LRU query cache and micro-batching.
+
+    Concurrent ``embed_query`` calls that miss the cache within the same
+    batching window are sent to the model as a single ``embed_documents``
+    request. The first caller of a window waits for it to elapse (or fill
+    up) and issues the request; the others block until it returns.
+
+    With a ``shared`` cache (see ``utils.shared_cache``), queries that miss
+    the in-process LRU are looked up there before going to the model, and
+    new vectors are stored there, so worker processes embed a query once.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache_size: int = 2048,
+        batch_window_ms: float = 2.0,
+        max_batch_size: int = 64,
+        shared: Optional[SharedCache] = None
+    ):
+        self.embeddings = embeddings
+        self.shared = shared
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending: Optional[_PendingBatch] = None
+        # Misses are counted once neither the LRU nor the shared tier had the query
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0, "batches": 0,
+                       "batched_queries": 0}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents directly; document embeddings are not cached."""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, serving repeats from the cache."""
+        vector = self._cache_get(text)
+        if vector is not None:
+            return vector
+        vector = self._shared_get(text)
+        if vector is not None:
+            self._cache_put(text, vector)
+            return list(vector)
+        with self._lock:
+            self._stats["misses"] += 1
+
+        if self.batch_window <= 0:
+            vector = self.embeddings.embed_query(text)
+            self._cache_put(text, vector)
+            self._shared_put([(text, vector)])
+            return list(vector)
+        return self._embed_batched(text)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache and batching counters."""
+        with self._lock:
+            stats = {**self._stats, "size": len(self._cache)}
+        if self.shared is not None:
+            stats["shared"] = self.shared.metrics()
+        return stats
+
+    def clear(self):
+        """Drop all cached query embeddings."""
+        with self._lock:
+            self._cache.clear()
+
+    def _cache_get(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is None:
+                return None
+            self._cache.move_to_end(text)
+            self._stats["hits"] += 1
+            return list(vector)
+
+    def _cache_put(self, text: str, vector: List[float]):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _shared_get(self, text: str) -> Optional[List[float]]:
+        if self.shared is None:
+            return None
+        value = self.shared.get(text)
+        if value is None:
+            return None
+        with self._lock:
+            self._stats["shared_hits"] += 1
+        return array("d", value).tolist()
+
+    def _shared_put(self, items: List[tuple]):
+        if self.shared is not None:
+            self.shared.set_many([(text, array("d", vector).tobytes()) for text, vector in items])
+
+    def _embed_batched(self, text: str) -> List[float]:
+        """Join the open batch (or open one) and wait for its result."""
+        with self._lock:
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = _PendingBatch()
+            if text not in batch.positions:
+                batch.positions[text] = len(batch.queries)
+                batch.queries.append(text)
+            position = batch.positions[text]
+            if len(batch.queries) >= self.max_batch_size:
+                # Close the batch so later callers start a new one
+                self._pending = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.batch_window)
+            with self._lock:
+                if self._pending is batch:
+                    self._pending = None
+            self._flush(batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return list(batch.vectors[position])
+
+    def _flush(self, batch: _PendingBatch):
+        """Embed every query of a closed batch in one model call."""
+        try:
+            batch.vectors = self.embeddings.embed_documents(batch.queries)
+            for query, vector in zip(batch.queries, batch.vectors):
+                self._cache_put(query, vector)
+            self._shared_put(list(zip(batch.queries, batch.vectors)))
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["batched_queries"] += len(batch.queries)
+            if len(batch.queries) > 1:
+                logger.debug("Query embeddings batched", batch_size=len(batch.queries))
+        except BaseException as e:
+            batch.error = e
+            logger.error("Query embedding batch failed",
+                        batch_size=len(batch.queries), error=str(e))
+        finally:
+            batch.done.set()
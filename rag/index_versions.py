@@ -0,0 +1,153 @@
+"""Blue/green index versions with an atomically swapped pointer."""
+import itertools
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+from config import STREAM_BATCH_SIZE
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+VERSIONS_DIR = "versions"
+POINTER_FILE = "versions.json"
+
+class IndexVersionManager:
+    """Tracks index builds under ``<root>/versions/<version>``.
+
+    ``versions.json`` names the live version and the publish history. It is
+    rewritten with ``os.replace``, so readers always see either the old or
+    the new pointer. Roots without a pointer file (indexes created before
+    versioning) are served from the root directory itself.
+    """
+
+    def __init__(self, root: Path, keep: int = 3):
+        self.root = Path(root)
+        self.keep = max(2, keep)
+        self.versions_dir = self.root / VERSIONS_DIR
+        self.pointer_file = self.root / POINTER_FILE
+
+    def _read_pointer(self) -> Dict[str, Any]:
+        try:
+            with open(self.pointer_file, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"current": None, "history": []}
+
+    def _write_pointer(self, pointer: Dict[str, Any]):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.pointer_file.with_name(POINTER_FILE + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(pointer, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.pointer_file)
+
+    def current(self) -> Optional[str]:
+        """Name of the live version, or None for an unversioned root."""
+        return self._read_pointer()["current"]
+
+    def path_for(self, version: Optional[str]) -> Path:
+        return self.versions_dir / version if version else self.root
+
+    def pointer_mtime(self) -> int:
+        """Modification time of the pointer, for cheap change detection."""
+        try:
+            return self.pointer_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def new_version(self) -> str:
+        """Reserve a directory for a new build."""
+        version = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.path_for(version).mkdir(parents=True)
+        return version
+
+    def publish(self, version: str):
+        """Make ``version`` live and prune old builds."""
+        pointer = self._read_pointer()
+        history = [v for v in pointer["history"] if v != version] + [version]
+        kept = history[-self.keep:]
+        self._write_pointer({"current": version, "history": kept})
+        logger.info("Index version published", root=str(self.root), version=version,
+                   previous=pointer["current"])
+        for old in history[:-self.keep]:
+            shutil.rmtree(self.path_for(old), ignore_errors=True)
+            logger.info("Old index version removed", version=old)
+
+    def rollback(self) -> Optional[str]:
+        """Point back at the previously published version."""
+        pointer = self._read_pointer()
+        history = pointer["history"]
+        if len(history) < 2:
+            logger.warning("No previous index version to roll back to", root=str(self.root))
+            return None
+        history = history[:-1]
+        self._write_pointer({"current": history[-1], "history": history})
+        logger.info("Index version rolled back", root=str(self.root),
+                   version=history[-1], discarded=pointer["current"])
+        return history[-1]
+
+    def discard(self, version: str):
+        """Delete an unpublished build."""
+        if version in self._read_pointer()["history"]:
+            raise ValueError(f"Cannot discard published version {version}")
+        shutil.rmtree(self.path_for(version), ignore_errors=True)
+
+    def list_versions(self) -> List[str]:
+        if not self.versions_dir.exists():
+            return []
+        return sorted(p.name for p in self.versions_dir.iterdir() if p.is_dir())
+
+class IndexBuild:
+    """An offline build writing into its own version directory.
+
+    Nothing is visible to live ``VectorStore`` instances until ``publish``
+    swaps the pointer; the index is persisted once, at publish time.
+    """
+
+    def __init__(self, manager: IndexVersionManager, backend_factory):
+        self.manager = manager
+        self.version = manager.new_version()
+        self.path = manager.path_for(self.version)
+        self.backend = backend_factory(self.path)
+        self.count = 0
+        logger.info("Index build started", version=self.version, path=str(self.path))
+
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        ids = self.backend.add_documents(documents)
+        self.count += len(ids)
+        return ids
+
+    def add_documents_stream(
+        self,
+        documents: Iterable[Document],
+        batch_size: int = STREAM_BATCH_SIZE
+    ) -> int:
+        """Add documents from an iterator, ``batch_size`` at a time."""
+        added = 0
+        iterator = iter(documents)
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                return added
+            added += len(self.add_documents(batch))
+
+    def publish(self) -> str:
+        self.backend.persist()
+        self.backend.close()
+        self.manager.publish(self.version)
+        logger.info("Index build published", version=self.version, documents=self.count)
+        return self.version
+
+    def abort(self):
+        self.backend.close()
+        self.manager.discard(self.version)
+        logger.info("Index build aborted", version=self.version)
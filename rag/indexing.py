@@ -0,0 +1,249 @@
+"""Incremental indexing of single files through a background queue."""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from config import SUPPORTED_FILE_TYPES, STREAM_BATCH_SIZE
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+MODIFIED = "modified"
+DELETED = "deleted"
+# Finished jobs kept for status lookups
+MAX_JOBS = 1000
+
+def is_supported(path: Path) -> bool:
+    """Whether ``path`` is a document type the processor handles (not a temp file)."""
+    return (path.suffix.lower() in SUPPORTED_FILE_TYPES
+            and not path.name.startswith((".", "~$")))
+
+def index_file(
+    file_path: Path,
+    processor,
+    target,
+    progress: Optional[Callable[[int], None]] = None,
+    **write_options
+) -> int:
+    """Chunk one file into ``target``, returning the number of chunks added.
+
+    ``target`` is anything with ``add_documents`` and ``add_documents_stream``
+    (a ``VectorStore`` or an ``IndexBuild``). Text files are streamed so
+    large exports are never loaded whole. ``progress`` is called with the
+    number of chunks produced so far. ``write_options`` are passed on to the
+    target's add methods (``raise_errors=True`` for a ``VectorStore``).
+    """
+    if file_path.suffix.lower() == ".txt":
+        return target.add_documents_stream(_counted(processor.iter_txt_chunks(str(file_path)),
+                                                    progress), **write_options)
+    documents = processor.process_file(str(file_path))
+    if not documents:
+        return 0
+    chunked = processor.chunk_documents(documents)
+    if progress:
+        progress(len(chunked))
+    return len(target.add_documents(chunked, **write_options))
+
+def _counted(chunks: Iterator, progress: Optional[Callable[[int], None]]) -> Iterator:
+    count = 0
+    for chunk in chunks:
+        yield chunk
+        count += 1
+        if progress and count % STREAM_BATCH_SIZE == 0:
+            progress(count)
+
+class IndexingQueue:
+    """Background worker that (re)indexes changed files into the live index.
+
+    ``submit`` queues a path as ``modified`` or ``deleted`` and returns a job
+    id; a path already waiting is not queued twice (its latest change wins
+    and it keeps its job). One worker takes paths in order and, in a thread,
+    removes the file's old chunks and indexes the new version, so searches
+    keep running meanwhile. Listeners get a snapshot of the job whenever its
+    status or progress changes; the last ``MAX_JOBS`` jobs can be looked up
+    with ``job``. ``metrics`` reports queue depth and throughput.
+
+    A job submitted with ``tenant_id`` is indexed into that tenant's store,
+    looked up in ``tenants`` (a ``TenantRegistry``).
+    """
+
+    def __init__(self, vector_store, processor=None, tenants=None):
+        self.vector_store = vector_store
+        self.tenants = tenants
+        self._processor = processor
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        # Path -> job id of paths waiting in the queue
+        self._pending: Dict[str, str] = {}
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._listeners: List[Callable[[Dict[str, Any]], Any]] = []
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._current: Optional[Dict[str, Any]] = None
+        self.stats = {
+            "submitted": 0, "coalesced": 0, "indexed": 0, "deleted": 0, "failed": 0,
+            "chunks_added": 0, "chunks_removed": 0, "max_depth": 0, "last_duration_ms": None
+        }
+
+    @property
+    def processor(self):
+        if self._processor is None:
+            from rag.document_processor import DocumentProcessor
+            self._processor = DocumentProcessor()
+        return self._processor
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], Any]):
+        """Call ``callback`` (sync or async) with a job snapshot on every update."""
+        self._listeners.append(callback)
+
+    def submit(self, path: Path, kind: str = MODIFIED, **info) -> str:
+        """Queue ``path`` and return its job id (the waiting job's, if any).
+
+        Extra keyword arguments (e.g. the upload size) are stored on the job.
+        """
+        key = str(path)
+        self.stats["submitted"] += 1
+        if key in self._pending:
+            job = self._jobs[self._pending[key]]
+            job.update(kind=kind, **info)
+            self.stats["coalesced"] += 1
+            return job["id"]
+        job = {"id": uuid.uuid4().hex, "path": key, "kind": kind, "status": "queued",
+               "stage": None, "chunks_added": 0, "chunks_removed": 0, "error": None,
+               "submitted_at": time.time(), "started_at": None, "finished_at": None, **info}
+        self._jobs[job["id"]] = job
+        while len(self._jobs) > MAX_JOBS:
+            self._jobs.popitem(last=False)
+        self._pending[key] = job["id"]
+        self._queue.put_nowait(key)
+        self.stats["max_depth"] = max(self.stats["max_depth"], self._queue.qsize())
+        self._publish(job)
+        return job["id"]
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent jobs, newest first."""
+        return [dict(job) for job in list(self._jobs.values())[::-1][:limit]]
+
+    def is_active(self, path: Path) -> bool:
+        """Whether ``path`` is waiting or being indexed."""
+        key = str(path)
+        return key in self._pending or (self._current is not None and self._current["path"] == key)
+
+    async def start(self):
+        if self._worker is None:
+            loop = asyncio.get_running_loop()
+            if self._loop is not None and self._loop is not loop:
+                # Restarted on a new event loop: the old queue is bound to the old one
+                queue: "asyncio.Queue[str]" = asyncio.Queue()
+                while not self._queue.empty():
+                    queue.put_nowait(self._queue.get_nowait())
+                self._queue = queue
+            self._loop = loop
+            self._worker = asyncio.create_task(self._run())
+            logger.info("Indexing queue started")
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            logger.info("Indexing queue stopped", pending=self._queue.qsize())
+
+    async def join(self):
+        """Wait until every queued path has been processed."""
+        await self._queue.join()
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        oldest = min((self._jobs[job_id]["submitted_at"] for job_id in self._pending.values()),
+                     default=None)
+        return {
+            **self.stats,
+            "depth": self._queue.qsize(),
+            "busy": self._current["path"] if self._current is not None else None,
+            "oldest_wait_seconds": round(now - oldest, 3) if oldest is not None else 0.0
+        }
+
+    async def _run(self):
+        while True:
+            key = await self._queue.get()
+            try:
+                job = self._jobs.get(self._pending.pop(key))
+                if job is None:
+                    continue
+                self._current = job
+                job.update(status="running", started_at=time.time())
+                self._publish(job)
+                with self._store_for(job) as store:
+                    await asyncio.to_thread(self._process, job, store)
+                    reindex = store.take_reindex_sources()
+                for source in reindex:
+                    if Path(source).exists():
+                        self.submit(Path(source), tenant_id=job.get("tenant_id"))
+                self._publish(job)
+            except Exception as e:
+                logger.error("Indexing worker failed", path=key, error=str(e))
+            finally:
+                self._current = None
+                self._queue.task_done()
+
+    def _store_for(self, job: Dict[str, Any]):
+        tenant_id = job.get("tenant_id")
+        if tenant_id is None:
+            return nullcontext(self.vector_store)
+        if self.tenants is None:
+            from rag.tenancy import TenantRegistry
+            self.tenants = TenantRegistry(self.vector_store)
+        return self.tenants.use(tenant_id)
+
+    def _process(self, job: Dict[str, Any], store):
+        path = Path(job["path"])
+        started = time.perf_counter()
+
+        def progress(chunks: int):
+            job.update(stage="indexing", chunks_added=chunks)
+            self._loop.call_soon_threadsafe(self._publish, dict(job))
+
+        try:
+            job["stage"] = "removing"
+            job["chunks_removed"] = store.delete_source(str(path), raise_errors=True)
+            if job["kind"] == MODIFIED:
+                job["stage"] = "processing"
+                job["chunks_added"] = index_file(path, self.processor, store, progress,
+                                                 raise_errors=True)
+                self.stats["indexed"] += 1
+            else:
+                self.stats["deleted"] += 1
+            job["status"] = "completed"
+        except Exception as e:
+            job.update(status="failed", error=str(e))
+            self.stats["failed"] += 1
+        job.update(stage=None, finished_at=time.time(),
+                   duration_ms=round((time.perf_counter() - started) * 1000, 1))
+        self.stats["chunks_added"] += job["chunks_added"]
+        self.stats["chunks_removed"] += job["chunks_removed"]
+        self.stats["last_duration_ms"] = job["duration_ms"]
+        log = logger.info if job["status"] == "completed" else logger.error
+        log("Document reindexed", path=job["path"], kind=job["kind"], status=job["status"],
+            tenant_id=job.get("tenant_id"),
+            chunks_added=job["chunks_added"], chunks_removed=job["chunks_removed"],
+            duration_ms=job["duration_ms"], error=job["error"])
+
+    def _publish(self, job: Dict[str, Any]):
+        snapshot = dict(job)
+        for callback in self._listeners:
+            try:
+                outcome = callback(snapshot)
+                if asyncio.iscoroutine(outcome):
+                    asyncio.ensure_future(outcome)
+            except Exception as e:
+                logger.error("Indexing listener failed", error=str(e))
@@ -0,0 +1,251 @@
+"""Metadata filters and a precomputed metadata-to-row bitmap index."""
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Filters use Chroma's ``where`` syntax, e.g.
+#   {"type": "pdf"}
+#   {"type": {"$in": ["pdf", "docx"]}, "pages": {"$gte": 10}}
+#   {"$or": [{"source": {"$prefix": "data/documents/payments/"}}, {"type": "txt"}]}
+COMPARISON_OPS = ("$eq", "$ne", "$in", "$nin", "$gt", "$gte", "$lt", "$lte", "$prefix")
+LOGICAL_OPS = ("$and", "$or")
+
+def normalize_filter(filter: Dict[str, Any]) -> Dict[str, Any]:
+    """Rewrite a filter into explicit ``$and``/``$or`` and ``{field: {op: value}}`` form."""
+    if not isinstance(filter, dict) or not filter:
+        raise ValueError(f"Invalid metadata filter: {filter!r}")
+    clauses = []
+    for key, value in filter.items():
+        if key in LOGICAL_OPS:
+            if not isinstance(value, list) or not value:
+                raise ValueError(f"{key} expects a non-empty list of filters")
+            clauses.append({key: [normalize_filter(f) for f in value]})
+        elif key.startswith("$"):
+            raise ValueError(f"Unknown filter operator: {key}")
+        elif isinstance(value, dict):
+            if len(value) != 1 or next(iter(value)) not in COMPARISON_OPS:
+                raise ValueError(f"Invalid condition for {key}: {value!r}")
+            clauses.append({key: value})
+        else:
+            clauses.append({key: {"$eq": value}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def filter_fields(filter: Dict[str, Any]) -> List[str]:
+    """Metadata fields referenced by a normalized filter."""
+    fields = []
+    for key, value in filter.items():
+        if key in LOGICAL_OPS:
+            for sub in value:
+                fields.extend(filter_fields(sub))
+        else:
+            fields.append(key)
+    return fields
+
+def filter_operators(filter: Dict[str, Any]) -> List[str]:
+    """Comparison operators used by a normalized filter."""
+    operators = []
+    for key, value in filter.items():
+        if key in LOGICAL_OPS:
+            for sub in value:
+                operators.extend(filter_operators(sub))
+        else:
+            operators.append(next(iter(value)))
+    return operators
+
+def _compare(op: str, actual: Any, expected: Any) -> bool:
+    if op == "$eq":
+        return actual == expected
+    if op == "$ne":
+        return actual != expected
+    if op == "$in":
+        return actual in expected
+    if op == "$nin":
+        return actual not in expected
+    if op == "$prefix":
+        return isinstance(actual, str) and actual.startswith(expected)
+    if actual is None or isinstance(actual, str) != isinstance(expected, str):
+        return False
+    return {"$gt": actual > expected, "$gte": actual >= expected,
+            "$lt": actual < expected, "$lte": actual <= expected}[op]
+
+def matches(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """Evaluate a normalized filter against one metadata dict."""
+    for key, value in filter.items():
+        if key == "$and":
+            if not all(matches(metadata, sub) for sub in value):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, sub) for sub in value):
+                return False
+        else:
+            op, expected = next(iter(value.items()))
+            if not _compare(op, metadata.get(key), expected):
+                return False
+    return True
+
+class MetadataIndex:
+    """Inverted index from (field, value) to row ids, evaluated as bitmaps.
+
+    Each distinct value keeps a compact posting list of rows. A filter is
+    answered by turning the postings of the matching values into boolean
+    row masks and combining them with vectorized ``&``/``|``; recently used
+    value bitmaps are cached. Backends use the mask to restrict scoring to
+    the matching rows instead of post-filtering a top-k.
+    """
+
+    def __init__(self, fields: Sequence[str], cache_size: int = 64):
+        self.fields = list(fields)
+        self.row_count = 0
+        self._postings: Dict[str, Dict[Any, List[int]]] = {f: {} for f in self.fields}
+        self._arrays: Dict[Tuple[str, Any], np.ndarray] = {}
+        self._bitmaps: "OrderedDict[Tuple[str, Any], np.ndarray]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def add(self, first_row: int, metadatas: Iterable[Dict[str, Any]]):
+        """Index the metadata of consecutive rows starting at ``first_row``."""
+        with self._lock:
+            row = first_row
+            for metadata in metadatas:
+                for field in self.fields:
+                    value = metadata.get(field)
+                    if isinstance(value, (str, int, float, bool)):
+                        self._postings[field].setdefault(value, []).append(row)
+                        self._arrays.pop((field, value), None)
+                row += 1
+            self.row_count = max(self.row_count, row)
+            self._bitmaps.clear()
+
+    def truncate(self, row_count: int):
+        """Forget rows at or beyond ``row_count``."""
+        with self._lock:
+            for postings in self._postings.values():
+                for value in list(postings):
+                    rows = [r for r in postings[value] if r < row_count]
+                    if rows:
+                        postings[value] = rows
+                    else:
+                        del postings[value]
+            self._arrays.clear()
+            self._bitmaps.clear()
+            self.row_count = min(self.row_count, row_count)
+
+    def evaluate(self, filter: Dict[str, Any], row_count: Optional[int] = None) -> np.ndarray:
+        """Boolean mask of the rows matching ``filter``."""
+        filter = normalize_filter(filter)
+        unindexed = [f for f in filter_fields(filter) if f not in self._postings]
+        if unindexed:
+            raise ValueError(f"Metadata fields not indexed: {', '.join(unindexed)}")
+        with self._lock:
+            return self._evaluate(filter, row_count or self.row_count)
+
+    def _evaluate(self, filter: Dict[str, Any], n: int) -> np.ndarray:
+        mask = np.ones(n, dtype=bool)
+        for key, value in filter.items():
+            if key == "$and":
+                for sub in value:
+                    mask &= self._evaluate(sub, n)
+            elif key == "$or":
+                union = np.zeros(n, dtype=bool)
+                for sub in value:
+                    union |= self._evaluate(sub, n)
+                mask &= union
+            else:
+                op, expected = next(iter(value.items()))
+                mask &= self._field_mask(key, op, expected, n)
+        return mask
+
+    def _field_mask(self, field: str, op: str, expected: Any, n: int) -> np.ndarray:
+        postings = self._postings[field]
+        if op == "$eq":
+            values = [expected] if expected in postings else []
+        elif op == "$in":
+            values = [v for v in expected if v in postings]
+        else:
+            # Range, prefix and negations scan distinct values, not rows
+            values = [v for v in postings if _compare(op, v, expected)]
+        mask = np.zeros(n, dtype=bool)
+        for value in values:
+            mask |= self._bitmap(field, value, n)
+        if op in ("$ne", "$nin"):
+            # Rows without the field never match a negation either
+            present = np.zeros(n, dtype=bool)
+            for value in postings:
+                present |= self._bitmap(field, value, n)
+            mask &= present
+        return mask
+
+    def _bitmap(self, field: str, value: Any, n: int) -> np.ndarray:
+        key = (field, value)
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None or len(bitmap) != n:
+            rows = self._arrays.get(key)
+            if rows is None:
+                rows = self._arrays[key] = np.asarray(self._postings[field][value], dtype=np.int64)
+            bitmap = np.zeros(n, dtype=bool)
+            bitmap[rows[rows < n]] = True
+            self._bitmaps[key] = bitmap
+            while len(self._bitmaps) > self._cache_size:
+                self._bitmaps.popitem(last=False)
+        self._bitmaps.move_to_end(key)
+        return bitmap
+
+    def save(self, path: Path):
+        """Write postings to ``path`` (JSON keys plus one NumPy array per value)."""
+        with self._lock:
+            keys = []
+            arrays = {}
+            for field, postings in self._postings.items():
+                for value, rows in postings.items():
+                    arrays[f"p{len(keys)}"] = np.asarray(rows, dtype=np.int64)
+                    keys.append([field, value])
+            header = json.dumps({"fields": self.fields, "row_count": self.row_count, "keys": keys})
+            tmp_file = Path(str(path) + ".tmp")
+            with open(tmp_file, "wb") as f:
+                np.savez(f, header=np.frombuffer(header.encode("utf-8"), dtype=np.uint8), **arrays)
+            os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "MetadataIndex":
+        """Load an index written by ``save``."""
+        with np.load(path) as data:
+            header = json.loads(data["header"].tobytes().decode("utf-8"))
+            index = cls(header["fields"])
+            index.row_count = header["row_count"]
+            for i, (field, value) in enumerate(header["keys"]):
+                index._postings[field][value] = data[f"p{i}"].tolist()
+        return index
+
+def open_metadata_index(
+    path: Path,
+    fields: Sequence[str],
+    row_count: int,
+    metadatas: Callable[[], Iterable[Dict[str, Any]]]
+) -> MetadataIndex:
+    """Load the saved index for a backend, rebuilding it when it is stale.
+
+    ``metadatas`` yields the metadata of every stored row in row order and is
+    only called when the saved index is missing, unreadable or does not
+    cover exactly ``row_count`` rows (e.g. an index built before filtering
+    existed, or a crash between saving the vectors and the bitmap index).
+    """
+    if path.exists():
+        try:
+            index = MetadataIndex.load(path)
+            if index.row_count == row_count and set(fields) <= set(index.fields):
+                return index
+        except Exception as e:
+            logger.warning("Metadata index unreadable, rebuilding", path=str(path), error=str(e))
+    index = MetadataIndex(fields)
+    if row_count:
+        index.add(0, metadatas())
+        index.truncate(row_count)
+        logger.info("Metadata index rebuilt", path=str(path), rows=index.row_count)
+    return index
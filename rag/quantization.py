@@ -0,0 +1,126 @@
+"""Compact embedding codes for first-pass candidate search."""
+from typing import Optional, Tuple
+import numpy as np
+
+QUANTIZATION_MODES = ("int8", "binary")
+
+# Rows scored per block, bounding the float32 temporaries of a scan
+SCORE_BLOCK_ROWS = 8192
+
+# Set bits per byte value, for Hamming distances on packed binary codes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def truncate_dims(vectors: np.ndarray, dims: Optional[int]) -> np.ndarray:
+    """Keep the leading ``dims`` dimensions and renormalize (Matryoshka-style).
+
+    ``text-embedding-3-*`` models are trained so that prefixes of the
+    embedding remain usable embeddings on their own.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dims and dims < vectors.shape[1]:
+        vectors = vectors[:, :dims]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+class Quantizer:
+    """Encodes unit vectors as int8 or sign-bit codes and scores queries.
+
+    int8 codes use a per-dimension scale set from the largest magnitude
+    seen; ``widen`` grows it when new vectors go beyond it, after which
+    codes encoded earlier must be encoded again (``encode`` itself clips).
+    Binary codes keep one sign bit per dimension and score by Hamming
+    distance.
+    """
+
+    def __init__(self, mode: str = "int8", dims: Optional[int] = None,
+                 scales: Optional[np.ndarray] = None):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.mode = mode
+        self.dims = dims or None
+        self.scales = scales
+
+    def widen(self, vectors: np.ndarray) -> bool:
+        """Grow the int8 scales to cover ``vectors``; True if existing codes are now stale."""
+        if self.mode == "binary" or len(vectors) == 0:
+            return False
+        absmax = np.abs(truncate_dims(vectors, self.dims)).max(axis=0)
+        needed = np.where(absmax > 0, absmax / 127.0, 1.0).astype(np.float32)
+        if self.scales is None:
+            self.scales = needed
+            return False
+        if not np.any(needed > self.scales):
+            return False
+        self.scales = np.maximum(self.scales, needed)
+        return True
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode full-precision vectors into compact codes."""
+        vectors = truncate_dims(vectors, self.dims)
+        if self.mode == "binary":
+            return np.packbits(vectors > 0, axis=1)
+        if self.scales is None:
+            self.widen(vectors)
+        codes = np.clip(np.rint(vectors / self.scales), -127, 127)
+        return codes.astype(np.int8)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Approximate similarity of ``query`` against every code row."""
+        query = truncate_dims(np.asarray(query).reshape(1, -1), self.dims)[0]
+        scores = np.empty(len(codes), dtype=np.float32)
+        if self.mode == "binary":
+            query_bits = np.packbits(query > 0)
+            for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+                block = codes[start:start + SCORE_BLOCK_ROWS]
+                distances = _POPCOUNT[np.bitwise_xor(block, query_bits)].sum(axis=1, dtype=np.int32)
+                scores[start:start + len(block)] = -distances
+            return scores
+        # Fold the scales into the query instead of dequantizing the codes
+        scaled_query = query * self.scales
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ scaled_query
+        return scores
+
+    def bytes_per_vector(self, full_dims: int) -> int:
+        """Size of one code, for reporting compression ratios."""
+        dims = min(self.dims or full_dims, full_dims)
+        return (dims + 7) // 8 if self.mode == "binary" else dims
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+def two_stage_search(
+    quantizer: Quantizer,
+    codes: np.ndarray,
+    full_vectors: np.ndarray,
+    query: np.ndarray,
+    k: int,
+    oversample: int = 10,
+    rows: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Coarse search on codes, then exact rescoring of the candidates.
+
+    ``full_vectors`` may be a read-only memmap; only the candidate rows are
+    read from it. ``rows`` restricts both stages to a subset of rows (e.g. a
+    metadata filter). Returns ``(scores, rows)`` with exact cosine scores.
+    """
+    limit = k * max(1, oversample)
+    if rows is None:
+        candidates = top_k(quantizer.score(codes, query), limit)
+    else:
+        candidates = rows[top_k(quantizer.score(codes[rows], query), limit)]
+    if len(candidates) == 0:
+        return np.empty(0, dtype=np.float32), candidates
+    # Sorted row order keeps memmap reads sequential
+    candidates = np.sort(candidates)
+    query = truncate_dims(np.asarray(query).reshape(1, -1), None)[0]
+    exact = np.asarray(full_vectors[candidates], dtype=np.float32) @ query
+    best = top_k(exact, k)
+    return exact[best], candidates[best]
@@ -0,0 +1,72 @@
+"""Adaptive k and relevance cutoffs for scored retrieval."""
+from typing import Any, Dict, List, Optional, Tuple
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+from config import (
+    RETRIEVAL_BASE_K, RETRIEVAL_MAX_K, RETRIEVAL_MIN_SCORE, RETRIEVAL_SCORE_GAP
+)
+
+# Multipliers on the base k: urgent incidents get more context, chat less
+URGENCY_K_FACTORS = {"low": 0.6, "medium": 1.0, "high": 1.4, "critical": 2.0}
+TYPE_K_FACTORS = {"chat": 0.6, "query": 1.0, "ticket": 1.2}
+INTENT_K_FACTORS = {"question": 1.0, "incident_report": 1.4, "complaint": 0.8, "request": 0.8}
+
+class AdaptiveRetrievalPolicy:
+    """Decides how many chunks to fetch and which ones are worth keeping."""
+
+    def __init__(
+        self,
+        base_k: int = RETRIEVAL_BASE_K,
+        max_k: int = RETRIEVAL_MAX_K,
+        min_score: float = RETRIEVAL_MIN_SCORE,
+        score_gap: float = RETRIEVAL_SCORE_GAP
+    ):
+        self.base_k = base_k
+        self.max_k = max(max_k, 1)
+        self.min_score = min_score
+        self.score_gap = score_gap
+
+    def choose_k(
+        self,
+        normalized_input: Dict[str, Any],
+        intent_classification: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """Scale the base k by intent, urgency and input type.
+
+        Retrieval runs in parallel with intent classification, so the
+        classification is often not available yet; urgency then falls back
+        to the ticket's own ``urgency``/``priority`` metadata.
+        """
+        classification = {}
+        if intent_classification and intent_classification.get("status") == "success":
+            classification = intent_classification.get("output", {})
+        metadata = normalized_input.get("metadata") or {}
+
+        urgency = str(classification.get("urgency") or metadata.get("urgency")
+                      or metadata.get("priority") or "medium").lower()
+        intent = str(classification.get("intent") or "").lower()
+
+        factor = URGENCY_K_FACTORS.get(urgency, 1.0)
+        factor *= TYPE_K_FACTORS.get(normalized_input.get("type"), 1.0)
+        factor *= INTENT_K_FACTORS.get(intent, 1.0)
+        return max(1, min(self.max_k, round(self.base_k * factor)))
+
+    def select(
+        self,
+        scored: List[Tuple[Document, float]]
+    ) -> Tuple[List[Tuple[Document, float]], str]:
+        """Keep results above the threshold and before the first large score gap.
+
+        Returns the kept results and the reason the list was cut.
+        """
+        ranked = sorted(scored, key=lambda item: item[1], reverse=True)
+        kept = []
+        for doc, score in ranked:
+            if score < self.min_score:
+                return kept, "below_threshold"
+            if kept and kept[-1][1] - score > self.score_gap:
+                return kept, "score_gap"
+            kept.append((doc, score))
+        return kept, "complete"
@@ -0,0 +1,166 @@
+"""Per-tenant vector stores, opened on demand and evicted least recently used."""
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from config import TENANT_CACHE_SIZE
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TENANTS_SUBDIR = "tenants"
+_TENANT_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+def validate_tenant(tenant_id: Any) -> Optional[str]:
+    """Normalized tenant id, or None for the default (shared) tenant.
+
+    Tenant ids become directory names, so only letters, digits, ``_``,
+    ``-`` and ``.`` are accepted.
+    """
+    if tenant_id is None or tenant_id == "":
+        return None
+    tenant_id = str(tenant_id)
+    if not _TENANT_ID.match(tenant_id) or ".." in tenant_id:
+        raise ValueError(f"Invalid tenant id: {tenant_id!r}")
+    return tenant_id
+
+def tenant_for_path(path: Path, documents_dir: Path) -> Optional[str]:
+    """Tenant owning a document stored under ``<documents_dir>/tenants/<tenant_id>/``."""
+    try:
+        parts = Path(path).relative_to(documents_dir).parts
+    except ValueError:
+        return None
+    if len(parts) > 2 and parts[0] == TENANTS_SUBDIR:
+        try:
+            return validate_tenant(parts[1])
+        except ValueError:
+            return None
+    return None
+
+class TenantRegistry:
+    """Routes tenant ids to their own ``VectorStore`` (own collection and index).
+
+    The default tenant's store is always loaded. Other tenants' stores are
+    opened on first use and at most ``max_loaded`` stay open; the least
+    recently used one is evicted beyond that, so memory follows the active
+    tenants and each query only searches its tenant's index.
+
+    Stores are borrowed with ``use``, which counts their users: an evicted
+    store is closed once its last user is done, so searches and indexing
+    jobs running on it can finish. A tenant's store is opened outside the
+    registry lock (under that tenant's own lock), so a slow load does not
+    hold up other tenants.
+    """
+
+    def __init__(
+        self,
+        default=None,
+        max_loaded: int = TENANT_CACHE_SIZE,
+        factory: Optional[Callable[[str], Any]] = None
+    ):
+        self.default = default
+        self.max_loaded = max(1, max_loaded)
+        self._factory = factory
+        self._stores: "OrderedDict[str, Any]" = OrderedDict()
+        # id(store) -> callers currently using it
+        self._users: Dict[int, int] = {}
+        # Evicted stores still in use, closed by their last user
+        self._retired: Dict[int, Any] = {}
+        # Tenant id -> lock held while its store is being opened
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0}
+
+    def _create(self, tenant_id: str):
+        if self._factory is not None:
+            return self._factory(tenant_id)
+        from rag.vector_store import VectorStore
+        embeddings = self.default.embeddings if self.default is not None else None
+        return VectorStore(tenant=tenant_id, embeddings=embeddings)
+
+    @contextmanager
+    def use(self, tenant_id: Any = None) -> Iterator[Any]:
+        """Borrow the store for ``tenant_id`` (the default store for None)."""
+        tenant_id = validate_tenant(tenant_id)
+        if tenant_id is None:
+            if self.default is None:
+                from rag.vector_store import VectorStore
+                self.default = VectorStore()
+            yield self.default
+            return
+        store = self._acquire(tenant_id)
+        try:
+            yield store
+        finally:
+            self._release(store)
+
+    def _acquire(self, tenant_id: str):
+        with self._lock:
+            store = self._borrow(tenant_id)
+            if store is not None:
+                return store
+            loading = self._loading.setdefault(tenant_id, threading.Lock())
+        with loading:
+            with self._lock:
+                store = self._borrow(tenant_id)
+                if store is not None:
+                    return store
+            store = self._create(tenant_id)
+            with self._lock:
+                self._loading.pop(tenant_id, None)
+                self._stores[tenant_id] = store
+                self._users[id(store)] = 1
+                self.stats["loads"] += 1
+                evicted = []
+                while len(self._stores) > self.max_loaded:
+                    evicted.append(self._stores.popitem(last=False))
+                self.stats["evictions"] += len(evicted)
+                idle = []
+                for _, old in evicted:
+                    if self._users.get(id(old)):
+                        self._retired[id(old)] = old
+                    else:
+                        self._users.pop(id(old), None)
+                        idle.append(old)
+        for old in idle:
+            old.close()
+        for old_id, _ in evicted:
+            logger.info("Tenant index evicted", tenant_id=old_id)
+        logger.info("Tenant index loaded", tenant_id=tenant_id, loaded=len(self._stores))
+        return store
+
+    def _borrow(self, tenant_id: str):
+        store = self._stores.get(tenant_id)
+        if store is not None:
+            self._stores.move_to_end(tenant_id)
+            self._users[id(store)] += 1
+            self.stats["hits"] += 1
+        return store
+
+    def _release(self, store):
+        with self._lock:
+            if id(store) not in self._users:  # the registry was closed meanwhile
+                return
+            self._users[id(store)] -= 1
+            if self._users[id(store)] or id(store) not in self._retired:
+                return
+            del self._users[id(store)], self._retired[id(store)]
+        store.close()
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._stores)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "loaded": len(self._stores), "max_loaded": self.max_loaded,
+                "retired": len(self._retired)}
+
+    def close(self):
+        with self._lock:
+            for store in list(self._stores.values()) + list(self._retired.values()):
+                store.close()
+            self._stores.clear()
+            self._retired.clear()
+            self._users.clear()
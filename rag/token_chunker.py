@@ -0,0 +1,201 @@
+"""Token-aware text chunking with tiktoken."""
+import itertools
+import os
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import numpy as np
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+    tiktoken = None
+try:
+    from langchain_core.documents import Document
+except ImportError:
+    from langchain.schema import Document
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+WHITESPACE = np.array([ord(c) for c in " \t\n\r\f\v"], dtype=np.uint32)
+SENTENCE_END = np.array([ord(c) for c in ".!?"], dtype=np.uint32)
+NEWLINE = ord("\n")
+# Texts longer than this are tokenized in paragraph-aligned segments on
+# tiktoken's thread pool
+PARALLEL_ENCODE_CHARS = 256 * 1024
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str):
+    """tiktoken encoding for an embedding model, loaded once per process."""
+    if not HAS_TIKTOKEN:
+        raise ImportError("tiktoken not available. Install tiktoken.")
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+@lru_cache(maxsize=8)
+def _token_byte_lengths(encoding) -> np.ndarray:
+    """UTF-8 byte length of every token id, so offsets need no per-token decode."""
+    lengths = np.zeros(encoding.max_token_value + 1, dtype=np.int64)
+    for token in range(len(lengths)):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            pass
+    return lengths
+
+def token_char_offsets(encoding, text: str) -> np.ndarray:
+    """Character offset where each token starts, plus ``len(text)`` at the end.
+
+    The text is encoded exactly once; token byte offsets come from a cached
+    per-encoding length table and are mapped to character offsets with a
+    vectorized UTF-8 lead-byte count. A token that ends inside a multi-byte
+    character is attributed to that character.
+    """
+    tokens = _encode(encoding, text)
+    byte_starts = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(_token_byte_lengths(encoding)[tokens], out=byte_starts[1:])
+    if text.isascii():
+        return byte_starts
+    raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    # Index of the character each byte belongs to
+    char_of_byte = np.cumsum((raw & 0xC0) != 0x80) - 1
+    offsets = np.empty(len(byte_starts), dtype=np.int64)
+    offsets[:-1] = char_of_byte[np.minimum(byte_starts[:-1], len(raw) - 1)]
+    offsets[-1] = len(text)
+    return offsets
+
+def _encode(encoding, text: str) -> np.ndarray:
+    """Token ids of ``text``, encoding large texts in parallel segments.
+
+    Segments end after a blank line, where BPE pre-tokenization splits
+    anyway, so the concatenated ids match a single-pass encode up to the
+    whitespace token at each seam.
+    """
+    threads = os.cpu_count() or 1
+    if len(text) <= PARALLEL_ENCODE_CHARS or threads == 1:
+        return np.asarray(encoding.encode_ordinary(text), dtype=np.int64)
+    segments = []
+    start = 0
+    while start < len(text):
+        cut = text.find("\n\n", start + PARALLEL_ENCODE_CHARS)
+        end = len(text) if cut < 0 else cut + 2
+        segments.append(text[start:end])
+        start = end
+    batches = encoding.encode_ordinary_batch(segments, num_threads=min(threads, len(segments)))
+    return np.fromiter(itertools.chain.from_iterable(batches), dtype=np.int64,
+                       count=sum(len(batch) for batch in batches))
+
+class TokenChunker:
+    """Splits text into chunks of at most ``chunk_size`` tokens.
+
+    Each document is tokenized once. Cut points are then chosen on the
+    token offsets: the strongest boundary (paragraph, line, sentence, word)
+    in the second half of the token window wins, found by binary search over
+    precomputed boundary positions, so candidate splits are never
+    re-encoded. Overlapping chunks start on a word boundary.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        model: str = "text-embedding-3-large",
+        encoding=None
+    ):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding = encoding or get_encoding(model)
+
+    def split_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Character ``(start, end)`` spans of the chunks of ``text``."""
+        offsets = token_char_offsets(self.encoding, text)
+        n_tokens = len(offsets) - 1
+        if n_tokens <= self.chunk_size:
+            return [(0, len(text))] if text.strip() else []
+
+        levels = _boundary_levels(text, offsets)
+
+        spans = []
+        start = 0
+        while start < n_tokens:
+            end = min(start + self.chunk_size, n_tokens)
+            if end < n_tokens:
+                end = self._cut(levels, start + self.chunk_size // 2, end)
+            spans.append((int(offsets[start]), int(offsets[end])))
+            if end >= n_tokens:
+                break
+            start = self._next_start(levels[-1], start, end)
+        return spans
+
+    def _cut(self, levels: List[np.ndarray], lo: int, hi: int) -> int:
+        """Last token boundary in ``(lo, hi]``, preferring stronger boundaries."""
+        for boundaries in levels:
+            i = np.searchsorted(boundaries, hi, side="right") - 1
+            if i >= 0 and boundaries[i] > lo:
+                return int(boundaries[i])
+        return hi
+
+    def _next_start(self, words: np.ndarray, start: int, end: int) -> int:
+        """Start of the next chunk: ``chunk_overlap`` tokens back, on a word boundary."""
+        target = end - self.chunk_overlap
+        i = np.searchsorted(words, target, side="left")
+        if i < len(words) and words[i] < end:
+            target = int(words[i])
+        return max(target, start + 1)
+
+    def split_text(self, text: str) -> List[str]:
+        chunks = (text[s:e].strip() for s, e in self.split_spans(text))
+        return [chunk for chunk in chunks if chunk]
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Chunk documents, copying each document's metadata onto its chunks."""
+        chunks = []
+        for doc in documents:
+            for text in self.split_text(doc.page_content):
+                chunks.append(Document(page_content=text, metadata=dict(doc.metadata)))
+        return chunks
+
+def _boundary_levels(text: str, offsets: np.ndarray) -> List[np.ndarray]:
+    """Token indices that start after a paragraph, line, sentence or word break.
+
+    Only the characters around each token start are inspected, so the cost
+    scales with the number of tokens rather than scanning the text per
+    separator. Returned strongest first.
+    """
+    if text.isascii():
+        codes = np.frombuffer(text.encode("ascii"), dtype=np.uint8).astype(np.uint32)
+    else:
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    # Pad so every token start has two characters of context on each side
+    codes = np.concatenate([[NEWLINE, NEWLINE], codes, [NEWLINE, NEWLINE]])
+    at = offsets[1:-1] + 2
+    before2, before, current, after = codes[at - 2], codes[at - 1], codes[at], codes[at + 1]
+
+    space_before = np.isin(before, WHITESPACE)
+    space_at = np.isin(current, WHITESPACE)
+    word = space_before | space_at
+    line = (before == NEWLINE) | (current == NEWLINE)
+    paragraph = (((before == NEWLINE) & ((before2 == NEWLINE) | (current == NEWLINE)))
+                 | ((current == NEWLINE) & (after == NEWLINE)))
+    sentence = ((np.isin(before, SENTENCE_END) & space_at)
+                | (space_before & np.isin(before2, SENTENCE_END)))
+    # Token 0 is never a cut point, hence the + 1
+    return [np.flatnonzero(mask) + 1 for mask in (paragraph, line, sentence, word)]
+
+def build_token_chunker(
+    chunk_size: int,
+    chunk_overlap: int,
+    model: str
+) -> Optional[TokenChunker]:
+    """A ``TokenChunker``, or None when the tokenizer cannot be loaded."""
+    try:
+        return TokenChunker(chunk_size, chunk_overlap, model)
+    except Exception as e:
+        logger.warning("Token chunker unavailable, falling back to characters",
+                      model=model, error=str(e))
+        return None
@@ -1,103 +1,336 @@
-"""Vector store for RAG with ChromaDB."""
-from typing import List, Optional
+"""Vector store for RAG with pluggable index backends."""
+import itertools
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
 try:
-    from langchain_community.vectorstores import Chroma
     from langchain_openai import OpenAIEmbeddings
 except ImportError:
-    from langchain.vectorstores import Chroma
     from langchain.embeddings import OpenAIEmbeddings
 try:
     from langchain_core.documents import Document
 except ImportError:
     from langchain.schema import Document
-from config import CHROMA_DB_DIR, EMBEDDING_MODEL, OPENAI_API_KEY
+from config import (
+    EMBEDDING_MODEL, OPENAI_API_KEY, VECTOR_BACKEND,
+    EMBEDDING_CACHE_SIZE, EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_MAX_BATCH_SIZE, SHARED_CACHE,
+    INDEX_VERSIONS_KEEP, INDEX_SWAP_CHECK_SECONDS, STREAM_BATCH_SIZE
+)
+from rag.backends import VectorBackend, backend_root, create_backend
+from rag.embedding_cache import CachedEmbeddings
+from rag.index_versions import IndexBuild, IndexVersionManager
+from rag.metadata_index import normalize_filter
+from rag.tenancy import validate_tenant
 from utils.logger import get_logger
+from utils.shared_cache import SharedCache
 
 logger = get_logger(__name__)
 
 class VectorStore:
-    """Manages vector store for RAG retrieval."""
-    
-    def __init__(self):
-        if OpenAIEmbeddings is None:
-            raise ImportError("OpenAIEmbeddings not available. Install langchain-openai.")
-        if Chroma is None:
-            raise ImportError("Chroma not available. Install chromadb and langchain-community.")
-        
-        self.embeddings = OpenAIEmbeddings(
-            model=EMBEDDING_MODEL,
-            openai_api_key=OPENAI_API_KEY
-        )
-        self.vectorstore: Optional[Chroma] = None
+    """Manages vector store for RAG retrieval.
+
+    ``tenant`` selects a tenant's own index (see ``rag.tenancy``); stores of
+    several tenants can share one ``embeddings`` object and its cache.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[str] = None,
+        tenant: Optional[str] = None,
+        embeddings: Optional[CachedEmbeddings] = None
+    ):
+        if embeddings is None:
+            if OpenAIEmbeddings is None:
+                raise ImportError("OpenAIEmbeddings not available. Install langchain-openai.")
+            embeddings = CachedEmbeddings(
+                OpenAIEmbeddings(
+                    model=EMBEDDING_MODEL,
+                    openai_api_key=OPENAI_API_KEY
+                ),
+                cache_size=EMBEDDING_CACHE_SIZE,
+                batch_window_ms=EMBEDDING_BATCH_WINDOW_MS,
+                max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+                shared=SharedCache(f"embeddings:{EMBEDDING_MODEL}") if SHARED_CACHE else None
+            )
+        self.embeddings = embeddings
+        self.tenant = validate_tenant(tenant)
+        self.backend_name = (backend or VECTOR_BACKEND).lower()
+        self.versions = IndexVersionManager(backend_root(self.backend_name, self.tenant),
+                                            keep=INDEX_VERSIONS_KEEP)
+        self.backend: Optional[VectorBackend] = None
+        self.version: Optional[str] = None
+        self._retired: Optional[VectorBackend] = None
+        self._pointer_mtime = 0
+        self._next_swap_check = 0.0
+        self._swap_lock = threading.Lock()
         self._initialize_store()
-        logger.info("VectorStore initialized")
-    
+        logger.info("VectorStore initialized", backend=self.backend_name, tenant_id=self.tenant)
+
     def _initialize_store(self):
         """Initialize or load existing vector store."""
         try:
-            # Try to import chromadb
-            try:
-                import chromadb
-            except ImportError:
-                # Check if pydantic-settings is the issue
-                try:
-                    import pydantic_settings
-                    import chromadb
-                except Exception as e:
-                    logger.warning("ChromaDB import failed, will use fallback", error=str(e))
-                    self.vectorstore = None
-                    return
-            
-            self.vectorstore = Chroma(
-                persist_directory=str(CHROMA_DB_DIR),
-                embedding_function=self.embeddings
-            )
-            logger.info("Vector store loaded", path=str(CHROMA_DB_DIR))
+            self._pointer_mtime = self.versions.pointer_mtime()
+            version = self.versions.current()
+            self.backend = create_backend(self.backend_name, self.embeddings,
+                                          self.versions.path_for(version))
+            self.version = version
+            logger.info("Vector store loaded", backend=self.backend_name,
+                       path=str(self.backend.path), version=version)
         except Exception as e:
-            logger.warning("Could not initialize vector store", error=str(e))
-            # Create empty store that will work but won't have data
+            logger.warning("Vector store initialization failed, using fallback mode",
+                          backend=self.backend_name, error=str(e))
+            self.backend = None
+
+    def _check_for_swap(self):
+        """Hot-swap to a newly published index version (throttled)."""
+        now = time.monotonic()
+        if now < self._next_swap_check:
+            return
+        self._next_swap_check = now + INDEX_SWAP_CHECK_SECONDS
+        if self.versions.pointer_mtime() == self._pointer_mtime:
+            return
+        self.swap_to(self.versions.current())
+
+    def swap_to(self, version: Optional[str]):
+        """Atomically replace the live backend with the one for ``version``."""
+        with self._swap_lock:
+            self._pointer_mtime = self.versions.pointer_mtime()
+            if version == self.version and self.backend is not None:
+                return
             try:
-                self.vectorstore = Chroma(
-                    persist_directory=str(CHROMA_DB_DIR),
-                    embedding_function=self.embeddings
-                )
-            except Exception as e2:
-                logger.warning("Vector store initialization failed, using fallback mode", error=str(e2))
-                self.vectorstore = None
-    
-    def add_documents(self, documents: List[Document]) -> List[str]:
-        """Add documents to vector store."""
-        if not self.vectorstore:
+                backend = create_backend(self.backend_name, self.embeddings,
+                                         self.versions.path_for(version))
+            except Exception as e:
+                logger.error("Index swap failed, keeping current version",
+                            version=version, error=str(e))
+                return
+            # Searches already running keep their reference to the old backend,
+            # so it is only closed on the following swap.
+            if self._retired is not None:
+                self._retired.close()
+            self._retired, self.backend = self.backend, backend
+            previous, self.version = self.version, version
+        logger.info("Vector store swapped index version", version=version, previous=previous)
+
+    def close(self):
+        """Release the live and retired backends."""
+        with self._swap_lock:
+            for backend in (self.backend, self._retired):
+                if backend is not None:
+                    backend.close()
+            self.backend = self._retired = None
+
+    def start_build(self) -> IndexBuild:
+        """Begin an offline build in a fresh version directory."""
+        return IndexBuild(
+            self.versions,
+            lambda path: create_backend(self.backend_name, self.embeddings, path)
+        )
+
+    def publish_build(self, build: IndexBuild) -> str:
+        """Publish a finished build and switch this instance to it."""
+        version = build.publish()
+        self.swap_to(version)
+        return version
+
+    def rollback(self) -> Optional[str]:
+        """Return to the previously published index version."""
+        version = self.versions.rollback()
+        if version:
+            self.swap_to(version)
+        return version
+
+    def add_documents(self, documents: List[Document], raise_errors: bool = False) -> List[str]:
+        """Add documents to vector store.
+
+        A failure is logged and nothing is reported added, unless
+        ``raise_errors`` is set, in which case it is re-raised after logging.
+        """
+        if not self.backend:
             self._initialize_store()
-        
+
         try:
-            ids = self.vectorstore.add_documents(documents)
-            self.vectorstore.persist()
+            ids = self.backend.add_documents(documents)
+            self.backend.persist()
             logger.info("Documents added to vector store", count=len(documents))
             return ids
         except Exception as e:
             logger.error("Failed to add documents", error=str(e))
+            if raise_errors:
+                raise
+            return []
+
+    def add_documents_stream(
+        self,
+        documents: Iterable[Document],
+        batch_size: int = STREAM_BATCH_SIZE,
+        raise_errors: bool = False
+    ) -> int:
+        """Add documents from an iterator in batches, persisting once at the end.
+
+        Only one batch of chunks is held at a time, so a generator such as
+        ``DocumentProcessor.iter_txt_chunks`` can feed arbitrarily large files.
+        Returns the number of documents added; on a failure, the batches added
+        so far are kept and persisted, and the error is re-raised if
+        ``raise_errors`` is set.
+        """
+        if not self.backend:
+            self._initialize_store()
+
+        added = 0
+        iterator = iter(documents)
+        try:
+            while True:
+                batch = list(itertools.islice(iterator, batch_size))
+                if not batch:
+                    break
+                added += len(self.backend.add_documents(batch))
+            logger.info("Document stream added to vector store", count=added)
+        except Exception as e:
+            logger.error("Failed to add document stream", error=str(e), added=added)
+            if raise_errors:
+                raise
+        finally:
+            if added:
+                self.backend.persist()
+        return added
+
+    def delete_source(self, source: str, raise_errors: bool = False) -> int:
+        """Remove every chunk of ``source`` from the live index, returning how many.
+
+        With ``raise_errors`` a failure (or an unavailable store) raises
+        instead of being logged and counted as nothing removed.
+        """
+        if not self.backend:
+            self._initialize_store()
+            if not self.backend:
+                if raise_errors:
+                    raise RuntimeError("Vector store is not available")
+                return 0
+        try:
+            removed = len(self.backend.delete_source(source))
+            if removed:
+                self.backend.persist()
+                logger.info("Source removed from vector store", source=source, chunks=removed)
+            return removed
+        except Exception as e:
+            logger.error("Failed to delete source", source=source, error=str(e))
+            if raise_errors:
+                raise
+            return 0
+
+    def take_reindex_sources(self) -> List[str]:
+        """Sources whose duplicate chunks were only indexed under a deleted source."""
+        pending = getattr(self.backend, "reindex_sources", None)
+        if not pending:
             return []
-    
+        sources = sorted(pending)
+        pending.clear()
+        return sources
+
     def similarity_search(
-        self, 
-        query: str, 
-        k: int = 5
+        self,
+        query: str,
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
     ) -> List[Document]:
-        """Search for similar documents."""
-        if not self.vectorstore:
+        """Search for similar documents.
+
+        ``filter`` restricts the search to chunks whose metadata matches, in
+        Chroma ``where`` syntax, e.g. ``{"type": "pdf"}`` or
+        ``{"source": {"$prefix": "data/documents/runbooks/"}}``.
+        """
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Search for similar documents with cosine similarity scores."""
+        if filter:
+            # Reject malformed filters here rather than returning no results
+            normalize_filter(filter)
+        if not self.backend:
             self._initialize_store()
-            if not self.vectorstore:
+            if not self.backend:
                 logger.warning("Vector store unavailable, returning empty results")
                 return []
-        
+
+        self._check_for_swap()
         try:
-            results = self.vectorstore.similarity_search(query, k=k)
-            logger.info("Similarity search completed", 
-                       query=query[:50], 
-                       results_count=len(results))
+            started = time.perf_counter()
+            vector = self.embeddings.embed_query(query)
+            backend = self.backend
+            results = backend.similarity_search_by_vector(vector, k=k, filter=filter)
+            materialized = backend.materialize([doc for doc, _ in results])
+            results = [(doc, score) for doc, (_, score) in zip(materialized, results)]
+            logger.info("Similarity search completed",
+                       query=query[:50],
+                       filter=filter,
+                       results_count=len(results),
+                       top_score=round(results[0][1], 4) if results else None,
+                       duration_ms=round((time.perf_counter() - started) * 1000, 1))
             return results
         except Exception as e:
             logger.error("Similarity search failed", query=query, error=str(e))
             return []
-    
+
+    def materialize(self, documents: List[Document]) -> List[Document]:
+        """Load the text of documents returned as pointers into the chunk text store."""
+        if not self.backend or not documents:
+            return documents
+        documents = self.backend.materialize(documents)
+        if self._retired is not None and any(not doc.page_content for doc in documents):
+            # Results fetched just before an index swap point into the old version
+            documents = self._retired.materialize(documents)
+        return documents
+
+    def read_text(self, doc_id: str, offset: int, length: int) -> str:
+        """Stored document text at a byte range, or "" when none is kept."""
+        backend = self.backend
+        if not backend:
+            return ""
+        text = backend.read_text(doc_id, offset, length)
+        if not text and self._retired is not None:
+            text = self._retired.read_text(doc_id, offset, length)
+        return text
+
+    def similarity_search_with_vectors(
+        self,
+        query: str,
+        k: int = 5,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Tuple[Document, float]], np.ndarray, np.ndarray]:
+        """Scored search that also returns hit and query vectors (for re-ranking).
+
+        With ``CHUNK_TEXT_STORE`` the documents come back without text; call
+        ``materialize`` on the ones that are kept.
+        """
+        empty = ([], np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.float32))
+        if filter:
+            normalize_filter(filter)
+        if not self.backend:
+            self._initialize_store()
+            if not self.backend:
+                logger.warning("Vector store unavailable, returning empty results")
+                return empty
+
+        self._check_for_swap()
+        try:
+            started = time.perf_counter()
+            vector = self.embeddings.embed_query(query)
+            results, vectors = self.backend.similarity_search_with_vectors(
+                vector, k=k, filter=filter)
+            logger.info("Similarity search completed",
+                       query=query[:50],
+                       filter=filter,
+                       results_count=len(results),
+                       top_score=round(results[0][1], 4) if results else None,
+                       duration_ms=round((time.perf_counter() - started) * 1000, 1))
+            return results, vectors, np.asarray(vector, dtype=np.float32)
+        except Exception as e:
+            logger.error("Similarity search failed", query=query, error=str(e))
+            return empty
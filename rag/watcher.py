@@ -0,0 +1,215 @@
+"""Background watcher that keeps the index in step with the documents directory."""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    HAS_WATCHDOG = True
+except ImportError:
+    HAS_WATCHDOG = False
+    FileSystemEventHandler = object
+    Observer = None
+from config import WATCH_POLL_SECONDS, WATCH_DEBOUNCE_SECONDS, WATCH_NATIVE
+from rag.indexing import DELETED, MODIFIED, IndexingQueue, is_supported
+from rag.tenancy import tenant_for_path
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+Signature = Tuple[int, int]
+
+class _EventHandler(FileSystemEventHandler):
+    """Forwards watchdog events (on its thread) to the watcher's event loop."""
+
+    def __init__(self, watcher: "DocumentWatcher", loop: asyncio.AbstractEventLoop):
+        self.watcher = watcher
+        self.loop = loop
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            # A moved or removed directory only reports itself
+            self.loop.call_soon_threadsafe(self.watcher.request_rescan)
+            return
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            if path:
+                self.loop.call_soon_threadsafe(self.watcher.touch, Path(path))
+
+class DocumentWatcher:
+    """Watches a directory tree and queues changed documents for reindexing.
+
+    Changes come from inotify (via ``watchdog``, when installed) or from
+    polling the tree every ``poll_seconds``. A path is only queued after it
+    has been quiet for ``debounce_seconds``, so a burst of writes to one
+    file indexes it once. Files are compared by ``(mtime_ns, size)`` with a
+    manifest of what was indexed, kept in ``state_path``; on start, files
+    changed while the server was down are queued. Without a manifest the
+    current tree is assumed indexed (e.g. by ``setup_knowledge_base.py``).
+    Files under ``tenants/<tenant_id>/`` are indexed into that tenant's store.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        queue: IndexingQueue,
+        state_path: Path,
+        poll_seconds: float = WATCH_POLL_SECONDS,
+        debounce_seconds: float = WATCH_DEBOUNCE_SECONDS,
+        native: bool = WATCH_NATIVE
+    ):
+        self.directory = Path(directory)
+        self.queue = queue
+        self.state_path = Path(state_path)
+        self.poll_seconds = poll_seconds
+        self.debounce_seconds = debounce_seconds
+        self.native = native and HAS_WATCHDOG
+        self._indexed: Dict[str, Signature] = {}
+        self._snapshot: Dict[str, Signature] = {}
+        # Path -> monotonic time of its last change
+        self._changed: Dict[str, float] = {}
+        # Signature of each queued path, recorded in the manifest once indexed
+        self._queued: Dict[str, Optional[Signature]] = {}
+        self._rescan = False
+        self._tasks = []
+        self._observer = None
+        self.stats = {"events": 0, "queued": 0, "unchanged": 0, "scans": 0}
+        queue.add_listener(self._on_processed)
+
+    def scan(self) -> Dict[str, Signature]:
+        """Signatures of every supported file under the directory."""
+        snapshot = {}
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                path = Path(root) / name
+                if not is_supported(path):
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                snapshot[str(path)] = (stat.st_mtime_ns, stat.st_size)
+        self.stats["scans"] += 1
+        return snapshot
+
+    async def start(self):
+        self._snapshot = await asyncio.to_thread(self.scan)
+        if self.state_path.exists():
+            with open(self.state_path, "r") as f:
+                self._indexed = {path: tuple(sig) for path, sig in json.load(f).items()}
+            # Catch up on changes made while nobody was watching
+            for path in set(self._snapshot) | set(self._indexed):
+                if self._snapshot.get(path) != self._indexed.get(path):
+                    self.touch(Path(path))
+        else:
+            self._indexed = dict(self._snapshot)
+            self._save_state()
+
+        loop = asyncio.get_running_loop()
+        if self.native:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self, loop), str(self.directory), recursive=True)
+            self._observer.start()
+        else:
+            self._tasks.append(asyncio.create_task(self._poll()))
+        self._tasks.append(asyncio.create_task(self._debounce()))
+        logger.info("Document watcher started", directory=str(self.directory),
+                   mode="inotify" if self.native else "polling", files=len(self._snapshot),
+                   catching_up=len(self._changed))
+
+    async def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            await asyncio.to_thread(self._observer.join)
+            self._observer = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Document watcher stopped", directory=str(self.directory))
+
+    def touch(self, path: Path):
+        """Note a change to ``path``; it is queued once it has been quiet long enough."""
+        if not is_supported(path):
+            return
+        self.stats["events"] += 1
+        self._changed[str(path)] = time.monotonic()
+
+    def request_rescan(self):
+        self._rescan = True
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "mode": "inotify" if self.native else "polling",
+                "files": len(self._indexed), "settling": len(self._changed)}
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            await self._diff_scan()
+
+    async def _diff_scan(self):
+        snapshot = await asyncio.to_thread(self.scan)
+        for path in set(snapshot) | set(self._snapshot):
+            if snapshot.get(path) != self._snapshot.get(path):
+                self.touch(Path(path))
+        self._snapshot = snapshot
+
+    async def _debounce(self):
+        tick = max(0.05, min(self.debounce_seconds, self.poll_seconds) / 2)
+        while True:
+            await asyncio.sleep(tick)
+            if self._rescan:
+                self._rescan = False
+                await self._diff_scan()
+            now = time.monotonic()
+            settled = [p for p, changed in self._changed.items()
+                       if now - changed >= self.debounce_seconds]
+            for path in settled:
+                del self._changed[path]
+                self._flush(Path(path))
+
+    @staticmethod
+    def _signature(path: Path) -> Optional[Signature]:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _flush(self, path: Path):
+        signature = self._signature(path)
+        key = str(path)
+        if signature == self._indexed.get(key):
+            self.stats["unchanged"] += 1
+            return
+        if key not in self._queued and self.queue.is_active(path):
+            # Submitted by someone else (an upload); check again once it is done
+            self._changed[key] = time.monotonic()
+            return
+        self._queued[key] = signature
+        self.queue.submit(path, DELETED if signature is None else MODIFIED,
+                          tenant_id=tenant_for_path(path, self.directory))
+        self.stats["queued"] += 1
+
+    def _on_processed(self, job: Dict[str, Any]):
+        if job["status"] not in ("completed", "failed"):
+            return
+        key = job["path"]
+        # Queued here: the signature seen then; otherwise (uploads) the file as it is now
+        signature = self._queued.pop(key) if key in self._queued else self._signature(Path(key))
+        if job["status"] != "completed" or not Path(key).is_relative_to(self.directory):
+            return
+        if job["kind"] == DELETED or signature is None:
+            self._indexed.pop(key, None)
+        else:
+            self._indexed[key] = signature
+        self._save_state()
+
+    def _save_state(self):
+        tmp_file = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(self._indexed, f)
+        os.replace(tmp_file, self.state_path)
@@ -6,19 +6,51 @@ import os
 # Add current directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from config import HOST, PORT, WORKERS, SHARED_CACHE, VECTOR_BACKEND
+
+def warmup(workers: int):
+    """Prepare state the workers share before they are started.
+
+    Workers would otherwise race to create the SQLite schemas and switch the
+    files to WAL mode on their first requests. With several workers, events
+    are relayed between them unless ``EVENT_TRANSPORT`` says otherwise (each
+    worker reads the environment when it imports ``config``). Only one
+    worker writes to the index, so the document watcher is on unless
+    ``DOCUMENT_WATCHER`` says otherwise: it hands that worker the files
+    uploaded to the others. FAISS and quantized indexes are written in place
+    by one process, so they refuse several workers.
+    """
+    from memory import MemoryStore
+    from rag.backends import SINGLE_PROCESS_BACKENDS
+    from utils.shared_cache import SharedCache
+    if workers > 1 and VECTOR_BACKEND.lower() in SINGLE_PROCESS_BACKENDS:
+        raise SystemExit(
+            f"WORKERS={workers} is not supported with VECTOR_BACKEND={VECTOR_BACKEND}: "
+            "its index is written in place, so workers would corrupt it and miss each "
+            "other's changes. Use VECTOR_BACKEND=chroma or WORKERS=1.")
+    MemoryStore()
+    if SHARED_CACHE:
+        SharedCache("warmup").close()
+    if workers > 1:
+        os.environ.setdefault("EVENT_TRANSPORT", "unix")
+        os.environ.setdefault("DOCUMENT_WATCHER", "true")
+
 if __name__ == "__main__":
     print("=" * 70)
     print("Starting Collaborative Agent System")
     print("=" * 70)
-    print("Server will be available at: http://localhost:8000")
+    print(f"Server will be available at: http://localhost:{PORT}")
+    print(f"Worker processes: {WORKERS}")
     print("Press Ctrl+C to stop the server")
     print("=" * 70)
     print()
-    
+
+    warmup(WORKERS)
     uvicorn.run(
         "ui.main:app",
-        host="0.0.0.0",
-        port=8000,
+        host=HOST,
+        port=PORT,
+        workers=WORKERS,
         reload=False,
         log_level="info"
     )
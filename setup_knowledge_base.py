@@ -1,22 +1,30 @@
 """Setup script to index documents in the knowledge base."""
+import argparse
 import os
 from pathlib import Path
+from typing import Optional
 from rag import DocumentProcessor, VectorStore
+from rag.indexing import index_file, is_supported
+from rag.tenancy import TENANTS_SUBDIR, validate_tenant
 from config import GENERATED_DIR, DOCUMENTS_DIR
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-def index_documents(directory: Path):
-    """Index all documents in a directory."""
-    processor = DocumentProcessor()
-    vector_store = VectorStore()
+def index_documents(directory: Path, target=None, exclude: Optional[Path] = None):
+    """Index all documents in a directory and its subdirectories.
     
-    supported_extensions = [".pdf", ".docx", ".txt", ".pptx", ".png", ".jpg", ".jpeg"]
-    files = []
+    ``target`` is anything with ``add_documents`` and
+    ``add_documents_stream`` (a ``VectorStore`` or an ``IndexBuild``); a new
+    ``VectorStore`` is used when omitted. Text files are streamed. Files
+    under ``exclude`` are skipped.
+    """
+    processor = DocumentProcessor()
+    vector_store = target or VectorStore()
     
-    for ext in supported_extensions:
-        files.extend(list(directory.glob(f"*{ext}")))
+    files = sorted(path for path in directory.rglob("*")
+                   if path.is_file() and is_supported(path)
+                   and not (exclude and path.is_relative_to(exclude)))
     
     logger.info("Found files to index", count=len(files), directory=str(directory))
     
@@ -24,29 +32,70 @@ def index_documents(directory: Path):
     for file_path in files:
         try:
             logger.info("Processing file", file_path=str(file_path))
-            documents = processor.process_file(str(file_path))
-            if documents:
-                chunked = processor.chunk_documents(documents)
-                vector_store.add_documents(chunked)
-                total_documents += len(chunked)
-                logger.info("File indexed", file_path=str(file_path), chunks=len(chunked))
+            added = index_file(file_path, processor, vector_store)
+            total_documents += added
+            logger.info("File indexed", file_path=str(file_path), chunks=added)
         except Exception as e:
             logger.error("Failed to index file", file_path=str(file_path), error=str(e))
     
     logger.info("Indexing completed", total_documents=total_documents)
     return total_documents
 
+def build_tenant(tenant_id: str, directory: Path, embeddings=None) -> str:
+    """Build and publish a tenant's own index from its documents directory."""
+    vector_store = VectorStore(tenant=tenant_id, embeddings=embeddings)
+    build = vector_store.start_build()
+    try:
+        index_documents(directory, build)
+    except BaseException:
+        build.abort()
+        raise
+    version = vector_store.publish_build(build)
+    vector_store.close()
+    return version
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the knowledge base index")
+    parser.add_argument("--rollback", action="store_true",
+                        help="switch back to the previously published index version")
+    args = parser.parse_args()
+
+    vector_store = VectorStore()
+    if args.rollback:
+        version = vector_store.rollback()
+        print(f"Rolled back to index version {version}" if version
+              else "No previous index version to roll back to")
+        raise SystemExit(0)
+
     print("Setting up knowledge base...")
-    
-    # Index generated test data
-    if GENERATED_DIR.exists():
-        print(f"Indexing test data from {GENERATED_DIR}...")
-        index_documents(GENERATED_DIR)
-    
-    # Index any documents in documents directory
-    if DOCUMENTS_DIR.exists():
-        print(f"Indexing documents from {DOCUMENTS_DIR}...")
-        index_documents(DOCUMENTS_DIR)
-    
-    print("✅ Knowledge base setup complete!")
+    # Build into a fresh version directory; running servers keep serving the
+    # current index until the build is published.
+    build = vector_store.start_build()
+    try:
+        # Index generated test data
+        if GENERATED_DIR.exists():
+            print(f"Indexing test data from {GENERATED_DIR}...")
+            index_documents(GENERATED_DIR, build)
+
+        # Index any documents in documents directory (tenants get their own)
+        if DOCUMENTS_DIR.exists():
+            print(f"Indexing documents from {DOCUMENTS_DIR}...")
+            index_documents(DOCUMENTS_DIR, build, exclude=DOCUMENTS_DIR / TENANTS_SUBDIR)
+    except BaseException:
+        build.abort()
+        raise
+
+    version = vector_store.publish_build(build)
+    print(f"✅ Knowledge base setup complete! Published index version {version}")
+
+    tenants_dir = DOCUMENTS_DIR / TENANTS_SUBDIR
+    if tenants_dir.exists():
+        for directory in sorted(path for path in tenants_dir.iterdir() if path.is_dir()):
+            try:
+                tenant_id = validate_tenant(directory.name)
+            except ValueError as e:
+                logger.warning("Skipping tenant directory", path=str(directory), error=str(e))
+                continue
+            print(f"Indexing tenant {tenant_id} from {directory}...")
+            version = build_tenant(tenant_id, directory, vector_store.embeddings)
+            print(f"✅ Tenant {tenant_id}: published index version {version}")
@@ -1,6 +1,8 @@
 """Test suite for agent system."""
 import pytest
 import asyncio
+import json
+import logging
 from agents import (
     IngestionAgent, PlannerAgent, IntentClassificationAgent,
     KnowledgeRetrievalAgent, MemoryAgent, ReasoningAgent,
@@ -78,6 +80,51 @@ class TestKnowledgeRetrievalAgent:
         result = agent.retrieve(normalized)
         assert result["status"] in ["success", "error"]
 
+class TestRetrievalPolicy:
+    """Test adaptive k and relevance cutoff."""
+    
+    def test_k_scales_with_urgency(self):
+        from rag.retrieval_policy import AdaptiveRetrievalPolicy
+        policy = AdaptiveRetrievalPolicy(base_k=5, max_k=10)
+        low = policy.choose_k({"type": "query", "metadata": {"urgency": "low"}})
+        critical = policy.choose_k({"type": "ticket", "metadata": {"priority": "critical"}})
+        assert low < 5 < critical <= 10
+    
+    def test_threshold_and_gap_cutoff(self):
+        from rag.retrieval_policy import AdaptiveRetrievalPolicy
+        policy = AdaptiveRetrievalPolicy(min_score=0.3, score_gap=0.15)
+        kept, cutoff = policy.select([("a", 0.82), ("b", 0.78), ("c", 0.5), ("d", 0.45)])
+        assert [doc for doc, _ in kept] == ["a", "b"]
+        assert cutoff == "score_gap"
+        kept, cutoff = policy.select([("a", 0.2)])
+        assert kept == [] and cutoff == "below_threshold"
+
+class TestMMR:
+    """Test MMR diversification."""
+    
+    def test_near_duplicates_are_skipped(self):
+        import numpy as np
+        from rag.mmr import maximal_marginal_relevance
+        query = np.array([1.0, 0.0, 0.0])
+        candidates = np.array([
+            [0.9, 0.1, 0.0],
+            [0.9, 0.11, 0.0],   # near-duplicate of the first
+            [0.7, 0.0, 0.7],
+        ])
+        assert maximal_marginal_relevance(query, candidates, 2, lambda_mult=0.5) == [0, 2]
+        assert maximal_marginal_relevance(query, candidates, 2, lambda_mult=1.0) == [0, 1]
+    
+    def test_per_source_cap(self):
+        import numpy as np
+        from rag.mmr import maximal_marginal_relevance
+        rng = np.random.default_rng(0)
+        candidates = rng.normal(size=(10, 16))
+        groups = ["a"] * 8 + ["b"] * 2
+        picks = maximal_marginal_relevance(candidates[0], candidates, 4, lambda_mult=1.0,
+                                           groups=groups, max_per_group=2)
+        assert sum(groups[i] == "a" for i in picks) == 2
+        assert len(picks) == 4
+
 class TestMemoryAgent:
     """Test memory agent."""
     
@@ -158,6 +205,1180 @@ class TestDocumentProcessor:
         chunks = processor.chunk_documents(docs)
         assert len(chunks) > 1  # Should create multiple chunks
 
+    def test_streamed_txt_chunks_map_to_byte_ranges(self, tmp_path, monkeypatch):
+        import rag.document_processor as document_processor
+        monkeypatch.setattr(document_processor, "STREAM_WINDOW_MB", 0.002)
+        path = tmp_path / "export.txt"
+        lines = [f"{i:05d} naïve payment timeout on node-{i % 7}" for i in range(400)]
+        path.write_text("\n".join(lines), encoding="utf-8")
+        processor = DocumentProcessor(chunk_size=300, chunk_overlap=50, length_unit="chars")
+        chunks = list(processor.iter_txt_chunks(str(path)))
+        data = path.read_bytes()
+        assert len(chunks) > 10
+        for chunk in chunks:
+            start = chunk.metadata["byte_offset"]
+            raw = data[start:start + chunk.metadata["byte_length"]]
+            assert raw.decode("utf-8") == chunk.page_content
+        assert lines[0] in chunks[0].page_content and lines[-1] in chunks[-1].page_content
+
+    def test_invalid_bytes_do_not_shift_byte_offsets(self, tmp_path, monkeypatch):
+        import rag.document_processor as document_processor
+        monkeypatch.setattr(document_processor, "STREAM_WINDOW_MB", 0.002)
+        path = tmp_path / "latin1.txt"
+        lines = [f"{i:05d} caf\xe9 timeout on node-{i % 7}".encode("latin-1") for i in range(400)]
+        data = b"\n".join(lines)
+        path.write_bytes(data)
+        processor = DocumentProcessor(chunk_size=300, chunk_overlap=50, length_unit="chars")
+        chunks = list(processor.iter_txt_chunks(str(path)))
+        assert len(chunks) > 10
+        for chunk in chunks:
+            start, length = chunk.metadata["byte_offset"], chunk.metadata["byte_length"]
+            raw = data[start:start + length]
+            assert raw.decode("utf-8", errors="replace").replace("\ufffd", "?") == chunk.page_content
+        assert "00399 caf? timeout" in chunks[-1].page_content
+
+class TestTokenChunker:
+    """Test token-aware chunking."""
+
+    def _encoding(self):
+        tiktoken = pytest.importorskip("tiktoken")
+        # Byte-level BPE (one token per UTF-8 byte) that needs no download
+        return tiktoken.Encoding(name="bytes", pat_str=r"\S+|\s+",
+                                 mergeable_ranks={bytes([i]): i for i in range(256)},
+                                 special_tokens={})
+
+    def test_chunks_fit_token_window_and_cut_on_sentences(self):
+        from rag.token_chunker import TokenChunker
+        encoding = self._encoding()
+        sentence = "The gateway timed out after the deploy. "
+        text = "\n\n".join(sentence * 5 for _ in range(20))
+        chunker = TokenChunker(chunk_size=120, chunk_overlap=20, encoding=encoding)
+        chunks = chunker.split_text(text)
+        assert len(chunks) > 1
+        assert all(len(encoding.encode_ordinary(c)) <= 120 for c in chunks)
+        assert all(c.endswith(".") for c in chunks)
+        assert chunks[0] in text and chunks[-1] in text
+
+    def test_offsets_with_multibyte_text(self):
+        from rag.token_chunker import TokenChunker, token_char_offsets
+        encoding = self._encoding()
+        text = "café déjà vu — naïve résumé. " * 40
+        offsets = token_char_offsets(encoding, text)
+        assert offsets[0] == 0 and offsets[-1] == len(text)
+        assert (offsets[1:] >= offsets[:-1]).all()
+        chunker = TokenChunker(chunk_size=100, chunk_overlap=10, encoding=encoding)
+        spans = chunker.split_spans(text)
+        assert spans[0][0] == 0 and spans[-1][1] == len(text)
+        assert all(len(text[s:e].encode("utf-8")) <= 100 for s, e in spans)
+
+class FakeEmbeddings:
+    """Deterministic embeddings that count model calls."""
+
+    def __init__(self, dim: int = 8):
+        self.dim = dim
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float((hash(t) >> i) & 0xFF) for i in range(self.dim)] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+class TestEmbeddingCache:
+    """Test query embedding cache and micro-batching."""
+
+    def test_repeated_query_served_from_cache(self):
+        from rag.embedding_cache import CachedEmbeddings
+        fake = FakeEmbeddings()
+        cached = CachedEmbeddings(fake, cache_size=10, batch_window_ms=0)
+        first = cached.embed_query("payment failing")
+        second = cached.embed_query("payment failing")
+        assert first == second
+        assert len(fake.calls) == 1
+        assert cached.stats()["hits"] == 1
+
+    def test_concurrent_queries_share_one_call(self):
+        import threading
+        from rag.embedding_cache import CachedEmbeddings
+        fake = FakeEmbeddings()
+        cached = CachedEmbeddings(fake, cache_size=10, batch_window_ms=50)
+        results = {}
+        threads = [
+            threading.Thread(target=lambda q=q: results.update({q: cached.embed_query(q)}))
+            for q in ["a", "b", "c"]
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(fake.calls) == 1
+        assert sorted(fake.calls[0]) == ["a", "b", "c"]
+        assert results["b"] == fake.embed_query("b")
+
+    def test_shared_tier_serves_other_workers(self, tmp_path):
+        from rag.embedding_cache import CachedEmbeddings
+        from utils.shared_cache import SharedCache
+        fake = FakeEmbeddings()
+        # Separate connections to one file, as in separate worker processes
+        first = CachedEmbeddings(fake, batch_window_ms=0,
+                                 shared=SharedCache("embeddings:test", tmp_path / "cache.db"))
+        second = CachedEmbeddings(fake, batch_window_ms=5,
+                                  shared=SharedCache("embeddings:test", tmp_path / "cache.db"))
+        vector = first.embed_query("refund status")
+        assert second.embed_query("refund status") == vector
+        assert len(fake.calls) == 1
+        assert second.stats()["shared"]["hits"] == 1
+        assert (second.stats()["shared_hits"], second.stats()["misses"]) == (1, 0)
+        assert (first.stats()["shared_hits"], first.stats()["misses"]) == (0, 1)
+
+    def test_llm_response_cache_round_trip(self, tmp_path):
+        from langchain_core.messages import AIMessage
+        from langchain_core.outputs import ChatGeneration
+        from utils.shared_cache import LLMResponseCache, SharedCache
+        cache = LLMResponseCache(SharedCache("llm", tmp_path / "cache.db"))
+        cache.update("prompt", "model-a", [ChatGeneration(message=AIMessage(content="Reset it."))])
+        assert cache.lookup("prompt", "model-a")[0].message.content == "Reset it."
+        assert cache.lookup("prompt", "model-b") is None
+
+class TestFaissBackend:
+    """Test FAISS vector index backend."""
+
+    def test_failed_docstore_write_releases_the_lock(self, tmp_path):
+        import sqlite3
+        from langchain_core.documents import Document
+        from rag.backends.docstore import SqliteDocstore
+        store = SqliteDocstore(tmp_path / "docstore.db")
+        store.add(0, ["a"], [Document(page_content="first")])
+        with pytest.raises(sqlite3.IntegrityError):
+            store.add(0, ["b"], [Document(page_content="same row")])
+        # Another connection (another worker) can still write
+        other = SqliteDocstore(tmp_path / "docstore.db")
+        other._db.execute("PRAGMA busy_timeout = 100")
+        other.add(1, ["c"], [Document(page_content="second")])
+        assert sorted(doc.page_content for doc in store.get([0, 1]).values()) == ["first", "second"]
+
+    @pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+    def test_persist_and_mmap_reload(self, tmp_path, index_type):
+        pytest.importorskip("faiss")
+        from langchain_core.documents import Document
+        from rag.backends.faiss_backend import FaissBackend
+        fake = FakeEmbeddings()
+        backend = FaissBackend(tmp_path, fake, index_type=index_type)
+        docs = [Document(page_content=f"runbook {i}", metadata={"source": f"doc{i}.txt"})
+                for i in range(20)]
+        backend.add_documents(docs)
+        backend.persist()
+        backend.close()
+
+        reloaded = FaissBackend(tmp_path, fake, index_type=index_type, use_mmap=True)
+        assert reloaded.count() == 20
+        hits = reloaded.similarity_search_by_vector(fake.embed_query("runbook 3"), k=3)
+        assert hits[0][0].metadata["source"] == "doc3.txt"
+        assert hits[0][1] == pytest.approx(1.0, abs=1e-4)
+
+class TestQuantizedSearch:
+    """Test quantized two-stage search."""
+
+    @pytest.mark.parametrize("mode,dims", [("int8", None), ("int8", 128), ("binary", None)])
+    def test_two_stage_recall(self, mode, dims):
+        import numpy as np
+        from rag.quantization import Quantizer, top_k, truncate_dims, two_stage_search
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(40, 256))
+        corpus = centers[rng.integers(0, 40, 2000)] + 0.7 * rng.normal(size=(2000, 256))
+        corpus = truncate_dims(corpus * np.exp(-np.arange(256) / 128), None)
+        quantizer = Quantizer(mode, dims)
+        codes = quantizer.encode(corpus)
+        hits = 0
+        for query in corpus[:20]:
+            expected = set(top_k(corpus @ query, 5).tolist())
+            _, rows = two_stage_search(quantizer, codes, corpus, query, 5, oversample=10)
+            hits += len(expected & set(rows.tolist()))
+        assert hits / 100 >= 0.9
+
+    def test_backend_persists_codes(self, tmp_path):
+        from langchain_core.documents import Document
+        from rag.backends.quantized_backend import QuantizedBackend
+        fake = FakeEmbeddings()
+        backend = QuantizedBackend(tmp_path, fake, mode="int8", dims=None)
+        backend.add_documents([Document(page_content=f"chunk {i}", metadata={"i": i})
+                               for i in range(50)])
+        backend.persist()
+        backend.close()
+
+        reloaded = QuantizedBackend(tmp_path, fake)
+        assert reloaded.count() == 50
+        doc, score = reloaded.similarity_search_by_vector(fake.embed_query("chunk 7"), k=1)[0]
+        assert doc.metadata["i"] == 7
+        assert score == pytest.approx(1.0, abs=1e-4)
+
+    def test_small_first_batch_does_not_fix_the_scales(self, tmp_path):
+        import numpy as np
+        from langchain_core.documents import Document
+        from rag.backends.quantized_backend import QuantizedBackend
+        from rag.quantization import Quantizer, truncate_dims
+        rng = np.random.default_rng(1)
+        # One upload of near-identical vectors, then a varied corpus in batches
+        first = truncate_dims(np.ones((1, 64)) + 0.01 * rng.normal(size=(1, 64)), None)
+        corpus = truncate_dims(rng.normal(size=(3000, 64)), None)
+        batches = [first] + np.array_split(corpus, 30)
+
+        class BatchEmbeddings:
+            def __init__(self):
+                self.batches = iter(batches)
+
+            def embed_documents(self, texts):
+                return next(self.batches).tolist()
+
+        backend = QuantizedBackend(tmp_path, BatchEmbeddings(), mode="int8", dims=None)
+        for batch in batches:
+            backend.add_documents([Document(page_content="x") for _ in batch])
+        everything = np.vstack([first, corpus])
+        expected = Quantizer("int8", None)
+        expected.widen(everything)
+        np.testing.assert_array_equal(backend.codes, expected.encode(everything))
+        assert backend.count() == 3001
+        backend.close()
+
+class TestMetadataFilter:
+    """Test metadata-filtered search."""
+
+    def _docs(self):
+        from langchain_core.documents import Document
+        return [
+            Document(page_content=f"chunk {i}",
+                     metadata={"source": f"data/{'runbooks' if i % 3 == 0 else 'faq'}/doc{i}.txt",
+                               "type": "pdf" if i % 2 else "txt", "pages": i})
+            for i in range(30)
+        ]
+
+    def test_bitmap_index_matches_filters(self):
+        from rag.metadata_index import MetadataIndex, matches, normalize_filter
+        docs = self._docs()
+        index = MetadataIndex(["source", "type", "pages"])
+        index.add(0, [doc.metadata for doc in docs])
+        filters = [
+            {"type": "pdf"},
+            {"type": {"$in": ["txt"]}, "pages": {"$gte": 10}},
+            {"$or": [{"source": {"$prefix": "data/runbooks/"}}, {"pages": {"$lt": 3}}]},
+            {"type": {"$ne": "pdf"}},
+        ]
+        for f in filters:
+            expected = [i for i, doc in enumerate(docs) if matches(doc.metadata, normalize_filter(f))]
+            assert index.evaluate(f).nonzero()[0].tolist() == expected
+        with pytest.raises(ValueError):
+            index.evaluate({"author": "x"})
+
+    @pytest.mark.parametrize("backend_name", ["faiss", "quantized"])
+    def test_filter_applied_before_scoring(self, tmp_path, backend_name):
+        pytest.importorskip("faiss")
+        from rag.backends import create_backend
+        fake = FakeEmbeddings()
+        backend = create_backend(backend_name, fake, tmp_path)
+        backend.add_documents(self._docs())
+        backend.persist()
+        backend.close()
+        # Drop the saved bitmaps to check they are rebuilt from the docstore
+        (tmp_path / "metadata_index.npz").unlink()
+
+        reloaded = create_backend(backend_name, fake, tmp_path)
+        query = fake.embed_query("chunk 4")
+        hits = reloaded.similarity_search_by_vector(
+            query, k=5, filter={"source": {"$prefix": "data/runbooks/"}})
+        assert len(hits) == 5
+        assert all("runbooks" in doc.metadata["source"] for doc, _ in hits)
+        assert reloaded.similarity_search_by_vector(query, k=5, filter={"type": "docx"}) == []
+
+class TestChunkDedup:
+    """Test index-time chunk deduplication."""
+
+    def test_duplicates_skipped_and_sources_recorded(self, tmp_path):
+        pytest.importorskip("faiss")
+        from langchain_core.documents import Document
+        from rag.backends import create_backend
+        words = [f"clause{i}" for i in range(100)]
+        footer = " ".join(words)
+        near = " ".join(words[:50] + ["amended"] + words[51:])
+        fake = FakeEmbeddings()
+        backend = create_backend("faiss", fake, tmp_path, dedup=True)
+        ids = backend.add_documents([
+            Document(page_content=footer, metadata={"source": "a.txt"}),
+            Document(page_content=footer.upper() + "  ", metadata={"source": "b.txt"}),
+            Document(page_content=near, metadata={"source": "c.txt"}),
+            Document(page_content="restart the payment service", metadata={"source": "a.txt"}),
+        ])
+        assert len(ids) == 2
+        assert sum(len(call) for call in fake.calls) == 2
+        backend.persist()
+        backend.close()
+
+        reopened = create_backend("faiss", fake, tmp_path, dedup=True)
+        reopened.similarity_search_by_vector(fake.embed_query(footer), k=1)
+        assert reopened._dedup is None  # fingerprints are only loaded to write
+        assert reopened.add_documents([Document(page_content=footer, metadata={"source": "d.txt"})]) == []
+        hits = reopened.similarity_search_by_vector(fake.embed_query(footer), k=1)
+        metadata = hits[0][0].metadata
+        assert metadata["source"] == "a.txt"
+        assert metadata["duplicate_sources"] == "b.txt; c.txt; d.txt"
+        assert metadata["duplicate_count"] == 3
+        assert reopened.count() == 2
+
+class TestChunkTextStore:
+    """Test the compressed chunk text store."""
+
+    def test_overlapping_chunks_stored_once(self, tmp_path):
+        from rag.chunk_store import ChunkTextStore
+        text = "".join(f"line {i}: disk pressure on node {i % 5}\n" for i in range(300)).encode()
+        store = ChunkTextStore(tmp_path, block_bytes=512)
+        for offset in range(0, len(text), 300):
+            store.append("doc", max(0, offset - 80), text[max(0, offset - 80):offset + 300])
+        assert store.raw_size == len(text)
+        assert store.read("doc", 1000, 700) == text[1000:1700].decode()
+        store.persist()
+        store.append("other", 0, b"not persisted")
+        store.close()
+
+        reopened = ChunkTextStore(tmp_path, block_bytes=512)
+        assert reopened.read("doc", 5, 2000) == text[5:2005].decode()
+        assert reopened.read("other", 0, 5) == ""
+        assert (tmp_path / "texts.zz").stat().st_size < len(text) / 2
+
+    def test_backend_keeps_pointers_and_materializes(self, tmp_path):
+        pytest.importorskip("faiss")
+        from langchain_core.documents import Document
+        from rag.backends import create_backend
+        processor = DocumentProcessor(chunk_size=200, chunk_overlap=40, length_unit="chars")
+        text = " ".join(f"Step {i}: drain the node and restart kubelet." for i in range(60))
+        chunks = processor.chunk_documents([Document(page_content=text, metadata={"source": "r.txt"})])
+        fake = FakeEmbeddings()
+        backend = create_backend("faiss", fake, tmp_path, dedup=False, text_store=True)
+        backend.add_documents(chunks)
+        backend.persist()
+
+        hits = backend.similarity_search_by_vector(fake.embed_query(chunks[3].page_content), k=2)
+        assert hits[0][0].page_content == ""
+        materialized = backend.materialize([doc for doc, _ in hits])
+        assert materialized[0].page_content == chunks[3].page_content
+
+    def test_skipped_duplicates_keep_their_text(self, tmp_path):
+        pytest.importorskip("faiss")
+        from langchain_core.documents import Document
+        from rag.backends import create_backend
+        processor = DocumentProcessor(chunk_size=60, chunk_overlap=0, length_unit="chars")
+        footer = "Contact the on-call engineer before any restart."
+        text = "\n\n".join([f"Step {i}: drain node {i} and restart kubelet." if i % 2 else footer
+                            for i in range(6)])
+        chunks = processor.chunk_documents([Document(page_content=text, metadata={"source": "r.txt"})])
+        backend = create_backend("faiss", FakeEmbeddings(), tmp_path, dedup=True, text_store=True)
+        assert len(backend.add_documents(chunks)) < len(chunks)
+        for chunk in chunks:
+            ref = chunk.metadata
+            assert backend.text_store.read(ref["doc_id"], ref["byte_offset"], ref["byte_length"]) == chunk.page_content
+
+class TestContextExpansion:
+    """Test parent/child chunking and budgeted context expansion."""
+
+    def _chunks(self):
+        from langchain_core.documents import Document
+        processor = DocumentProcessor(chunk_size=120, chunk_overlap=0, length_unit="chars",
+                                      parent_chunk_size=600)
+        text = "\n\n".join(
+            " ".join(f"Section {s} step {i}: check the pod logs and restart it." for i in range(10))
+            for s in range(4))
+        return text, processor.chunk_documents([Document(page_content=text,
+                                                         metadata={"source": "runbook.md"})])
+
+    def _hit(self, chunk, score=0.9):
+        from agents.knowledge_retrieval_agent import REF_KEYS
+        return {"content": chunk.page_content, "source": chunk.metadata["source"], "score": score,
+                "ref": {key: chunk.metadata[key] for key in REF_KEYS}}
+
+    def test_children_carry_parent_sections(self):
+        text, chunks = self._chunks()
+        data = text.encode()
+        assert len({c.metadata["parent_offset"] for c in chunks}) > 1
+        for chunk in chunks:
+            start, length = chunk.metadata["byte_offset"], chunk.metadata["byte_length"]
+            parent = chunk.metadata["parent_offset"]
+            assert data[start:start + length].decode() == chunk.page_content
+            assert parent <= start and start + length <= parent + chunk.metadata["parent_length"]
+
+    def test_expansion_stays_in_parent_and_budget(self):
+        from rag.context_expansion import ContextExpander
+        text, chunks = self._chunks()
+        data = text.encode()
+        read = lambda doc_id, offset, length: data[offset:offset + length].decode()
+        count = lambda t: len(t.split())
+        expander = ContextExpander(read_text=read, count_tokens=count, step_tokens=8)
+        hit = chunks[len(chunks) // 2]
+        parent = data[hit.metadata["parent_offset"]:
+                      hit.metadata["parent_offset"] + hit.metadata["parent_length"]].decode()
+
+        sections = expander.expand([self._hit(hit)], token_budget=60)
+        assert hit.page_content in sections[0]["content"] and sections[0]["content"] in parent
+        assert count(hit.page_content) < count(sections[0]["content"]) <= 64
+
+        sections = expander.expand([self._hit(hit)], token_budget=10_000)
+        assert sections[0]["content"] == parent.strip()
+
+    def test_neighbouring_hits_merge_and_unknown_refs_fall_back(self):
+        from rag.context_expansion import ContextExpander
+        text, chunks = self._chunks()
+        data = text.encode()
+        expander = ContextExpander(read_text=lambda d, o, n: data[o:o + n].decode(),
+                                   count_tokens=lambda t: len(t.split()))
+        first, second = chunks[0], chunks[1]
+        sections = expander.expand([self._hit(first), self._hit(second, 0.8)], token_budget=200)
+        assert len(sections) == 1 and first.page_content in sections[0]["content"]
+
+        bare = ContextExpander(count_tokens=lambda t: len(t.split()))
+        sections = bare.expand([self._hit(first), self._hit(second, 0.8)], token_budget=200)
+        assert [s["content"] for s in sections] == [first.page_content, second.page_content]
+
+class RecordingStore:
+    """Stands in for VectorStore, recording what the indexing queue does."""
+
+    def __init__(self):
+        self.chunks = {}
+        self.deletes = []
+
+    def add_documents(self, documents, raise_errors=False):
+        for doc in documents:
+            self.chunks.setdefault(doc.metadata["source"], []).append(doc.page_content)
+        return [str(i) for i in range(len(documents))]
+
+    def add_documents_stream(self, documents, raise_errors=False):
+        return len(self.add_documents(list(documents)))
+
+    def delete_source(self, source, raise_errors=False):
+        self.deletes.append(source)
+        return len(self.chunks.pop(source, []))
+
+    def take_reindex_sources(self):
+        return []
+
+    def close(self):
+        self.closed = True
+
+class TestDocumentWatcher:
+    """Test background indexing of changed documents."""
+
+    def test_delete_source_masks_rows_and_forgets_fingerprints(self, tmp_path):
+        pytest.importorskip("faiss")
+        from langchain_core.documents import Document
+        from rag.backends import create_backend
+        fake = FakeEmbeddings()
+        backend = create_backend("faiss", fake, tmp_path, dedup=True, text_store=False)
+        shared = "Restart the payment gateway pods after rotating the TLS certificate."
+        backend.add_documents([Document(page_content=shared, metadata={"source": "a.txt"}),
+                               Document(page_content="Scale the queue workers.", metadata={"source": "a.txt"})])
+        backend.add_documents([Document(page_content=shared, metadata={"source": "b.txt"})])
+        backend.persist()
+
+        assert len(backend.delete_source("a.txt")) == 2
+        assert backend.reindex_sources == {"b.txt"}
+        hits = backend.similarity_search_by_vector(fake.embed_query(shared), k=5)
+        assert hits == []
+        # The file's new version is not a duplicate of its deleted chunks
+        ids = backend.add_documents([Document(page_content=shared, metadata={"source": "a.txt"})])
+        assert len(ids) == 1
+        backend.persist()
+        backend.close()
+
+        reopened = create_backend("faiss", fake, tmp_path, dedup=False, text_store=False)
+        hits = reopened.similarity_search_by_vector(fake.embed_query(shared), k=5)
+        assert [doc.metadata["source"] for doc, _ in hits] == ["a.txt"]
+
+    @pytest.mark.asyncio
+    async def test_watcher_debounces_and_tracks_changes(self, tmp_path):
+        from rag.indexing import IndexingQueue
+        from rag.watcher import DocumentWatcher
+        docs = tmp_path / "documents"
+        (docs / "runbooks").mkdir(parents=True)
+        (docs / "old.txt").write_text("Existing runbook already indexed.")
+        store = RecordingStore()
+        queue = IndexingQueue(store, DocumentProcessor(chunk_size=200, chunk_overlap=0,
+                                                        length_unit="chars"))
+        watcher = DocumentWatcher(docs, queue, tmp_path / "manifest.json",
+                                  poll_seconds=0.05, debounce_seconds=0.2, native=False)
+        await queue.start()
+        await watcher.start()
+        try:
+            new = docs / "runbooks" / "disk.txt"
+            for i in range(5):
+                new.write_text(f"Disk pressure runbook revision {i}.")
+                await asyncio.sleep(0.06)
+            (docs / "notes.tmp").write_text("ignored")
+            await asyncio.sleep(0.6)
+            await queue.join()
+            assert store.chunks == {str(new): ["Disk pressure runbook revision 4."]}
+            assert queue.metrics()["indexed"] == 1
+
+            new.unlink()
+            await asyncio.sleep(0.6)
+            await queue.join()
+            assert store.chunks == {} and queue.metrics()["deleted"] == 1
+        finally:
+            await watcher.stop()
+            await queue.stop()
+
+        # Changes made while stopped are picked up from the manifest
+        (docs / "old.txt").write_text("Existing runbook, edited offline.")
+        restarted = DocumentWatcher(docs, queue, tmp_path / "manifest.json",
+                                    poll_seconds=0.05, debounce_seconds=0.05, native=False)
+        await queue.start()
+        await restarted.start()
+        try:
+            await asyncio.sleep(0.3)
+            await queue.join()
+            assert store.chunks == {str(docs / "old.txt"): ["Existing runbook, edited offline."]}
+        finally:
+            await restarted.stop()
+            await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_failed_job_is_left_out_of_the_manifest(self, tmp_path):
+        from rag.indexing import IndexingQueue
+        from rag.watcher import DocumentWatcher
+
+        class FailingStore(RecordingStore):
+            def add_documents(self, documents, raise_errors=False):
+                raise RuntimeError("index write failed")
+
+        docs = tmp_path / "documents"
+        docs.mkdir()
+        queue = IndexingQueue(FailingStore(), DocumentProcessor(chunk_size=200, chunk_overlap=0,
+                                                                length_unit="chars"))
+        watcher = DocumentWatcher(docs, queue, tmp_path / "manifest.json",
+                                  poll_seconds=0.05, debounce_seconds=0.05, native=False)
+        await queue.start()
+        await watcher.start()
+        try:
+            (docs / "disk.txt").write_text("Disk pressure runbook.")
+            await asyncio.sleep(0.3)
+            await queue.join()
+            assert queue.metrics()["failed"] == 1
+        finally:
+            await watcher.stop()
+            await queue.stop()
+        # Not recorded, so the next start retries it
+        assert json.loads((tmp_path / "manifest.json").read_text()) == {}
+
+    @pytest.mark.asyncio
+    async def test_failed_index_write_fails_the_job(self, tmp_path, monkeypatch):
+        import rag.vector_store as vector_store
+        from rag.backends.quantized_backend import QuantizedBackend
+        from rag.indexing import IndexingQueue
+
+        class BrokenEmbeddings(FakeEmbeddings):
+            def embed_documents(self, texts):
+                raise RuntimeError("embedding service down")
+
+        monkeypatch.setattr(vector_store, "backend_root", lambda name, tenant=None: tmp_path / "index")
+        monkeypatch.setattr(vector_store, "create_backend",
+                            lambda name, embeddings, path: QuantizedBackend(path, BrokenEmbeddings()))
+        store = vector_store.VectorStore("quantized")
+        doc = tmp_path / "cert.txt"
+        doc.write_text("Rotate the gateway certificate.")
+        queue = IndexingQueue(store, DocumentProcessor(chunk_size=200, chunk_overlap=0,
+                                                        length_unit="chars"))
+        await queue.start()
+        try:
+            job_id = queue.submit(doc)
+            await queue.join()
+        finally:
+            await queue.stop()
+            store.backend.close()
+        job = queue.job(job_id)
+        assert job["status"] == "failed" and "embedding service down" in job["error"]
+        assert queue.metrics()["failed"] == 1 and queue.metrics()["indexed"] == 0
+
+    def test_several_workers_refused_for_single_process_backends(self, monkeypatch):
+        import run
+        monkeypatch.setattr(run, "VECTOR_BACKEND", "faiss")
+        with pytest.raises(SystemExit, match="WORKERS=4"):
+            run.warmup(4)
+
+    def test_only_one_worker_holds_the_watcher_lock(self, tmp_path):
+        from utils.process_lock import try_lock
+        lock_path = tmp_path / "manifest.json.lock"
+        held = try_lock(lock_path)
+        assert held is not None
+        assert try_lock(lock_path) is None
+        held.close()
+        assert try_lock(lock_path) is not None
+
+class TestDocumentUpload:
+    """Test the document upload endpoint and its background job."""
+
+    def test_upload_returns_job_and_indexes_in_background(self, tmp_path, monkeypatch):
+        import time
+        from fastapi.testclient import TestClient
+        import ui.main as main
+        store = RecordingStore()
+        monkeypatch.setattr(main, "DOCUMENTS_DIR", tmp_path)
+        monkeypatch.setattr(main.indexing_queue, "vector_store", store)
+        monkeypatch.setattr(main.indexing_queue, "_processor",
+                            DocumentProcessor(chunk_size=200, chunk_overlap=0, length_unit="chars"))
+        events = []
+        main.event_stream.subscribe(events.append)
+        body = b"Rotate the gateway certificate, then restart the pods."
+        try:
+            with TestClient(main.app) as client:
+                response = client.post("/api/documents", params={"filename": "../cert.txt"},
+                                       content=body)
+                assert response.status_code == 202
+                job_id = response.json()["job_id"]
+                for _ in range(100):
+                    job = client.get(f"/api/documents/jobs/{job_id}").json()
+                    if job["status"] in ("completed", "failed"):
+                        break
+                    time.sleep(0.05)
+                assert job["status"] == "completed" and job["chunks_added"] == 1
+                assert client.post("/api/documents", params={"filename": "x.exe"},
+                                   content=b"1").status_code == 400
+                assert client.get("/api/documents/jobs/missing").status_code == 404
+                assert client.post("/api/documents", params={"filename": "a.txt", "tenant_id": "../x"},
+                                   content=b"1").status_code == 400
+        finally:
+            main.event_stream.unsubscribe(events.append)
+        assert (tmp_path / "cert.txt").read_bytes() == body
+        assert store.chunks == {str(tmp_path / "cert.txt"): [body.decode()]}
+        statuses = [e["data"]["status"] for e in events if e["type"] == "document_job"]
+        assert statuses[0] == "queued" and statuses[-1] == "completed"
+
+    def test_upload_left_to_the_watchers_worker(self, tmp_path, monkeypatch):
+        from fastapi.testclient import TestClient
+        import ui.main as main
+        store = RecordingStore()
+        monkeypatch.setattr(main, "DOCUMENTS_DIR", tmp_path)
+        monkeypatch.setattr(main, "DOCUMENT_WATCHER", True)
+        # Another worker holds the watcher lock
+        monkeypatch.setattr(main, "try_lock", lambda path: None)
+        monkeypatch.setattr(main.indexing_queue, "vector_store", store)
+        with TestClient(main.app) as client:
+            response = client.post("/api/documents", params={"filename": "cert.txt"},
+                                   content=b"Rotate the gateway certificate.")
+            assert response.status_code == 202
+            assert response.json()["job_id"] is None and response.json()["status"] == "saved"
+            assert not main.indexing_queue.is_active(tmp_path / "cert.txt")
+        assert (tmp_path / "cert.txt").read_bytes() == b"Rotate the gateway certificate."
+        assert store.chunks == {}
+
+    def test_upload_refused_off_the_indexing_worker_without_watcher(self, tmp_path, monkeypatch):
+        from fastapi.testclient import TestClient
+        import ui.main as main
+        monkeypatch.setattr(main, "DOCUMENTS_DIR", tmp_path)
+        monkeypatch.setattr(main, "DOCUMENT_WATCHER", False)
+        monkeypatch.setattr(main, "try_lock", lambda path: None)
+        with TestClient(main.app) as client:
+            response = client.post("/api/documents", params={"filename": "cert.txt"},
+                                   content=b"Rotate the gateway certificate.")
+            assert response.status_code == 503
+        assert not (tmp_path / "cert.txt").exists()
+
+    def test_several_workers_turn_the_watcher_on(self, monkeypatch):
+        import os
+        import run
+        monkeypatch.setattr(run, "VECTOR_BACKEND", "chroma")
+        monkeypatch.setattr(run, "SHARED_CACHE", False)
+        for name in ("DOCUMENT_WATCHER", "EVENT_TRANSPORT"):
+            monkeypatch.setenv(name, "unset")
+            monkeypatch.delenv(name)
+        run.warmup(2)
+        assert os.environ["DOCUMENT_WATCHER"] == "true"
+
+class TestTenancy:
+    """Test per-tenant index routing and the LRU of loaded tenant stores."""
+
+    def test_registry_loads_lazily_and_evicts_lru(self):
+        from rag.tenancy import TenantRegistry
+        default = RecordingStore()
+        created = {}
+        registry = TenantRegistry(default, max_loaded=2,
+                                  factory=lambda t: created.setdefault(t, RecordingStore()))
+
+        def get(tenant_id):
+            with registry.use(tenant_id) as store:
+                return store
+
+        assert get(None) is default and created == {}
+        acme = get("acme")
+        get("globex")
+        assert get("acme") is acme
+        get("initech")  # evicts globex, the least recently used
+        assert registry.loaded() == ["acme", "initech"]
+        assert created["globex"].closed  # nobody was using it
+        assert registry.metrics()["evictions"] == 1 and registry.metrics()["hits"] == 1
+
+    def test_evicted_store_closed_after_its_last_user(self):
+        import threading
+        from rag.tenancy import TenantRegistry
+        created = {}
+        registry = TenantRegistry(RecordingStore(), max_loaded=1,
+                                  factory=lambda t: created.setdefault(t, RecordingStore()))
+        with registry.use("acme") as acme:
+            with registry.use("globex"):  # evicts acme while it is in use
+                pass
+            assert registry.loaded() == ["globex"] and not hasattr(acme, "closed")
+        assert acme.closed and registry.metrics()["retired"] == 0
+
+        # A slow load does not hold up other tenants
+        loading, release = threading.Event(), threading.Event()
+
+        def slow(tenant_id):
+            if tenant_id == "slow":
+                loading.set()
+                release.wait(5)
+            return created.setdefault(tenant_id, RecordingStore())
+
+        registry = TenantRegistry(RecordingStore(), max_loaded=4, factory=slow)
+        def load_slow():
+            with registry.use("slow"):
+                pass
+
+        thread = threading.Thread(target=load_slow)
+        thread.start()
+        assert loading.wait(5)
+        with registry.use("acme") as store:
+            assert store is created["acme"]
+        release.set()
+        thread.join(5)
+        assert registry.loaded() == ["acme", "slow"]
+
+    def test_tenant_ids_and_paths(self, tmp_path):
+        from rag.backends import backend_root
+        from rag.tenancy import tenant_for_path, validate_tenant
+        assert validate_tenant("") is None and validate_tenant("acme-eu.1") == "acme-eu.1"
+        for bad in ("../etc", "a/b", "..", ".hidden"):
+            with pytest.raises(ValueError):
+                validate_tenant(bad)
+        assert tenant_for_path(tmp_path / "tenants" / "acme" / "a.txt", tmp_path) == "acme"
+        assert tenant_for_path(tmp_path / "tenants" / "a.txt", tmp_path) is None
+        assert tenant_for_path(tmp_path / "runbooks" / "a.txt", tmp_path) is None
+        assert backend_root("faiss", "acme").parts[-3:] == ("tenants", "acme", "faiss")
+
+    @pytest.mark.asyncio
+    async def test_queue_indexes_into_tenant_store(self, tmp_path):
+        from rag.indexing import IndexingQueue
+        from rag.tenancy import TenantRegistry
+        default, tenant = RecordingStore(), RecordingStore()
+        queue = IndexingQueue(default, DocumentProcessor(chunk_size=200, chunk_overlap=0,
+                                                          length_unit="chars"),
+                              tenants=TenantRegistry(default, factory=lambda t: tenant))
+        path = tmp_path / "acme.txt"
+        path.write_text("Acme escalation contacts.")
+        await queue.start()
+        try:
+            job_id = queue.submit(path, tenant_id="acme")
+            await queue.join()
+        finally:
+            await queue.stop()
+        assert queue.job(job_id)["status"] == "completed"
+        assert tenant.chunks == {str(path): ["Acme escalation contacts."]}
+        assert default.chunks == {}
+
+class TestIndexVersions:
+    """Test blue/green index builds."""
+
+    def _build(self, manager, texts):
+        from langchain_core.documents import Document
+        from rag.backends.quantized_backend import QuantizedBackend
+        from rag.index_versions import IndexBuild
+        build = IndexBuild(manager, lambda path: QuantizedBackend(path, FakeEmbeddings()))
+        build.add_documents([Document(page_content=t, metadata={}) for t in texts])
+        return build
+
+    def test_publish_and_rollback(self, tmp_path):
+        from rag.index_versions import IndexVersionManager
+        manager = IndexVersionManager(tmp_path, keep=2)
+        assert manager.current() is None
+        assert manager.path_for(manager.current()) == tmp_path
+
+        first = self._build(manager, ["a", "b"])
+        assert manager.current() is None  # not visible until published
+        first.publish()
+        second = self._build(manager, ["c"])
+        second.publish()
+        assert manager.current() == second.version
+
+        assert manager.rollback() == first.version
+        assert manager.current() == first.version
+        assert (manager.path_for(first.version) / "codes.npy").exists()
+
+    def test_old_versions_pruned_and_abort_discards(self, tmp_path):
+        from rag.index_versions import IndexVersionManager
+        manager = IndexVersionManager(tmp_path, keep=2)
+        builds = [self._build(manager, ["x"]) for _ in range(3)]
+        for build in builds:
+            build.publish()
+        assert manager.list_versions() == sorted(b.version for b in builds[1:])
+
+        aborted = self._build(manager, ["y"])
+        aborted.abort()
+        assert aborted.version not in manager.list_versions()
+
+class TestEventStream:
+    """Test non-blocking fan-out to event subscribers."""
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_does_not_block_emit(self):
+        from observability import EventStream
+        stream = EventStream(max_queue=3, payload_policies={})
+        fast, slow = [], []
+        release = asyncio.Event()
+
+        async def slow_client(event):
+            await release.wait()
+            slow.append(event["data"]["n"])
+
+        stream.subscribe(lambda event: fast.append(event["data"]["n"]), max_queue=100)
+        stream.subscribe(slow_client)
+        started = asyncio.get_running_loop().time()
+        for n in range(10):
+            await stream.emit("agent_start", {"n": n})
+        assert asyncio.get_running_loop().time() - started < 0.1
+        await asyncio.sleep(0.01)
+        assert fast == list(range(10))
+
+        lagging = stream.metrics()[1]
+        # The oldest seven were dropped; one event is in flight, two wait
+        assert lagging["depth"] == 2 and lagging["dropped"] == 7
+        release.set()
+        assert await stream.drain()
+        assert slow == [7, 8, 9]
+
+    @pytest.mark.asyncio
+    async def test_coalesce_keeps_latest_state_per_key(self):
+        from observability import EventStream
+        stream = EventStream(policy="coalesce")
+        received = []
+        stream.subscribe(received.append)
+        for chunks in (10, 20, 30):
+            await stream.emit("document_job", {"id": "job-1", "chunks_added": chunks})
+        await stream.emit("document_job", {"id": "job-2", "chunks_added": 5})
+        assert await stream.drain()
+        assert [(e["data"]["id"], e["data"]["chunks_added"]) for e in received] == [
+            ("job-1", 30), ("job-2", 5)]
+        assert stream.metrics()[0]["coalesced"] == 2
+
+    @pytest.mark.asyncio
+    async def test_history_is_tagged_indexed_and_bounded_by_memory(self):
+        from observability import EventHistory, EventStream, request_context
+        stream = EventStream(history=EventHistory(max_bytes=4000), payload_policies={})
+        for request_id in ("req-a", "req-b"):
+            with request_context(request_id, "sess-1"):
+                for agent in ("planner", "reasoning"):
+                    await stream.emit("agent_start", {"agent": agent})
+                    await stream.emit("agent_complete", {"agent": agent, "result": "ok"})
+        events = stream.get_history(request_id="req-a")
+        assert [e["data"]["agent"] for e in events] == ["planner", "planner", "reasoning", "reasoning"]
+        assert all(e["session_id"] == "sess-1" for e in events)
+        assert [e["request_id"] for e in stream.get_history(
+            agent="reasoning", type="agent_complete")] == ["req-a", "req-b"]
+        newest = stream.get_history(limit=1)[0]["seq"]
+        assert stream.get_history(since=newest - 2, request_id="req-b") == stream.get_history(limit=2)
+
+        for i in range(100):
+            await stream.emit("agent_start", {"agent": "memory", "n": i})
+        history = stream.history.metrics()
+        assert history["bytes"] <= 4000 and history["evicted"] > 0
+        # Evicted events are gone from the indexes as well
+        assert stream.get_history(request_id="req-a") == []
+        assert stream.get_history(limit=1)[0]["data"]["n"] == 99
+        with pytest.raises(ValueError):
+            stream.get_history(user="x")
+
+    @pytest.mark.asyncio
+    async def test_event_log_replays_across_restarts(self, tmp_path):
+        import time
+        from observability import EventLog, EventStream, request_context
+        log = EventLog(tmp_path / "events.db", flush_ms=10)
+        stream = EventStream(log=log)
+        with request_context("req-a", "sess-1"):
+            await stream.emit("agent_start", {"agent": "planner"})
+        middle = time.time()
+        with request_context("req-b", "sess-1"):
+            await stream.emit("agent_start", {"agent": "planner"})
+            await stream.emit("agent_complete", {"agent": "planner"})
+        assert log.flush()
+        log.close()
+
+        # A restarted server continues the numbering and can replay the past
+        reopened = EventLog(tmp_path / "events.db", flush_ms=10)
+        restarted = EventStream(log=reopened)
+        await restarted.emit("agent_start", {"agent": "memory"})
+        assert [e["seq"] for e in restarted.replay(since=1)] == [2, 3, 4]
+        assert [e["seq"] for e in restarted.replay(request_id="req-b")] == [2, 3]
+        assert [e["request_id"] for e in restarted.replay(end=middle)] == ["req-a"]
+        assert restarted.last_seq == 4
+        reopened.close()
+
+    def test_event_log_retention(self, tmp_path):
+        import time
+        from observability import EventLog
+        log = EventLog(tmp_path / "events.db", max_mb=0.2, retention_hours=1, flush_ms=1)
+        payload = "x" * 1000
+        for seq in range(1, 401):
+            log.append({"seq": seq, "type": "agent_start", "data": {"text": payload}})
+        assert log.flush()
+        log._db.execute("UPDATE events SET ts = ? WHERE seq <= 10", (time.time() - 7200,))
+        log.enforce_retention()
+        remaining = log.replay(limit=1000)
+        assert remaining[-1]["seq"] == 400 and remaining[0]["seq"] > 10
+        assert log.metrics()["bytes"] <= 0.2 * 1024 * 1024
+        log.close()
+
+    @pytest.mark.asyncio
+    async def test_payload_policies_summarize_and_keep_full_data(self):
+        from observability import EventStream, PayloadPolicy
+        stream = EventStream()
+        stream.set_payload_policy("final_response", PayloadPolicy(max_bytes=300))
+        received = []
+        stream.subscribe(received.append)
+        result = {"agent": "planner", "status": "success", "output": {"steps": 3},
+                  "tool_calls": [{"tool": "llm", "input": {"content": "x" * 5000}}]}
+        await stream.emit("agent_complete", {"agent": "planner", "result": result})
+        await stream.emit("final_response", {"response": "y" * 2000})
+        await stream.emit("document_job", {"id": "job-1", "status": "queued"})
+        assert await stream.drain()
+
+        summary, truncated, small = received
+        assert summary["data"] == {"agent": "planner",
+                                   "result": {"status": "success", "output": {"steps": 3}}}
+        assert summary["truncated"] and len(truncated.to_json()) < 600
+        assert "truncated" not in small
+        assert json.loads(stream.full_payload(summary["seq"]))["result"]["tool_calls"]
+        assert stream.full_payload(small["seq"]) is None
+        # Serialized once: history, subscribers and responses share the text
+        assert stream.get_history(limit=1)[0].to_json() is small.to_json()
+        for event in received:
+            assert json.loads(event.to_json()) == event
+
+    @pytest.mark.asyncio
+    async def test_event_data_encoded_once(self, monkeypatch):
+        from observability import EventStream
+        stream = EventStream(payload_policies={})
+        received = []
+        stream.subscribe(received.append)
+        data = {"id": "job-1", "status": "queued", "chunks": list(range(50))}
+        encoded = []
+        dumps = json.dumps
+        monkeypatch.setattr(json, "dumps", lambda obj, **kwargs: encoded.append(obj) or dumps(obj, **kwargs))
+        await stream.emit("document_job", data)
+        assert await stream.drain()
+        text = received[0].to_json()
+        # Measured against the size limit, then spliced into the event's JSON
+        assert sum(obj is data or (isinstance(obj, dict) and obj.get("data") is data)
+                   for obj in encoded) == 1
+        assert json.loads(text) == received[0] and received[0]["data"] == data
+
+    @pytest.mark.asyncio
+    async def test_subscriptions_route_only_matching_events(self):
+        from observability import EventStream, request_context
+        stream = EventStream(payload_policies={})
+        everything, session, reasoning = [], [], []
+        stream.subscribe(everything.append)
+        stream.subscribe(session.append, subscriptions=[{"session_id": "s1"},
+                                                        {"type": "document_job"}])
+        stream.subscribe(reasoning.append)
+        stream.set_subscriptions(reasoning.append, [{"agent": "reasoning", "type": "agent_complete"}])
+        for session_id in ("s1", "s2"):
+            with request_context(f"req-{session_id}", session_id):
+                for agent in ("planner", "reasoning"):
+                    await stream.emit("agent_start", {"agent": agent})
+                    await stream.emit("agent_complete", {"agent": agent})
+        await stream.emit("document_job", {"id": "job-1"})
+        assert await stream.drain()
+
+        assert len(everything) == 9
+        assert [e["session_id"] for e in session] == ["s1"] * 4 + [None]
+        assert [(e["session_id"], e["type"]) for e in reasoning] == [
+            ("s1", "agent_complete"), ("s2", "agent_complete")]
+        with pytest.raises(ValueError):
+            stream.set_subscriptions(reasoning.append, [{"user": "x"}])
+        stream.set_subscriptions(session.append, [])
+        await stream.emit("agent_start", {"agent": "memory"})
+        assert await stream.drain()
+        assert len(session) == 6 and len(reasoning) == 2
+
+    def test_websocket_subscribe_messages(self):
+        from fastapi.testclient import TestClient
+        import ui.main as main
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/ws") as ws:
+                ws.send_text(json.dumps({"action": "subscribe", "session_id": "s1"}))
+                assert ws.receive_json()["data"]["subscriptions"] == [{"session_id": "s1"}]
+                ws.send_text(json.dumps({"action": "subscribe", "tenant": "x"}))
+                assert ws.receive_json()["type"] == "subscription_error"
+                ws.send_text(json.dumps({"action": "unsubscribe", "session_id": "s1"}))
+                assert ws.receive_json()["data"]["subscriptions"] == []
+                ws.send_text("ping")
+                assert ws.receive_json()["type"] == "pong"
+
+    @pytest.mark.asyncio
+    async def test_sse_resumes_from_last_event_id_with_heartbeats(self):
+        import zlib
+        from observability import EventStream, request_context
+        from observability.sse import gzip_stream, sse_events
+        stream = EventStream(payload_policies={})
+        with request_context("req-1", "s1"):
+            for n in range(3):
+                await stream.emit("agent_start", {"agent": "planner", "n": n})
+        await stream.emit("agent_start", {"agent": "planner", "n": 99})  # other session
+
+        messages = sse_events(stream, {"session_id": "s1"}, last_event_id=1,
+                              heartbeat_seconds=0.05)
+        assert (await messages.__anext__()).startswith("retry:")
+        replayed = [await messages.__anext__() for _ in range(2)]
+        assert [m.split("\n")[0] for m in replayed] == ["id: 2", "id: 3"]
+        assert await messages.__anext__() == ": keep-alive\n\n"
+        with request_context("req-2", "s1"):
+            await stream.emit("agent_complete", {"agent": "planner"})
+        live = await messages.__anext__()
+        assert live.startswith("id: 5\nevent: agent_complete\ndata: ")
+        assert json.loads(live.split("data: ", 1)[1])["request_id"] == "req-2"
+        await messages.aclose()
+        assert stream.subscribers == []
+
+        compressed = gzip_stream(sse_events(stream, last_event_id=4))
+        decompressor = zlib.decompressobj(31)
+        text = decompressor.decompress(await compressed.__anext__())
+        text += decompressor.decompress(await compressed.__anext__())
+        assert text.decode().startswith("retry: 3000\n\nid: 5\n")
+        await compressed.aclose()
+
+    @pytest.mark.asyncio
+    async def test_unix_transport_shares_events_across_streams(self, tmp_path):
+        from observability import EventStream
+        from observability.transport import UnixSocketTransport
+
+        async def wait_for(condition):
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.01)
+            raise AssertionError("timed out")
+
+        socket_path = tmp_path / "events.sock"
+        workers = [EventStream(payload_policies={},
+                               transport=UnixSocketTransport(socket_path, reconnect_seconds=0.05))
+                   for _ in range(2)]
+        received = [[], []]
+        for worker, inbox in zip(workers, received):
+            worker.subscribe(inbox.append)
+            await worker.start_transport()
+        await wait_for(lambda: all(w.transport.connected for w in workers))
+        broker, client = sorted(workers, key=lambda w: w.transport.role != "broker")
+        assert (broker.transport.role, client.transport.role) == ("broker", "client")
+
+        await client.emit("agent_start", {"agent": "planner"})
+        # Events are ordered by their arrival at the broker
+        await wait_for(lambda: broker.last_seq == 1)
+        await broker.emit("agent_complete", {"agent": "planner"})
+        await wait_for(lambda: all(len(inbox) == 2 for inbox in received))
+        for inbox in received:
+            assert [(e["seq"], e["type"]) for e in inbox] == [(1, "agent_start"), (2, "agent_complete")]
+        assert client.get_history(type="agent_complete")[0]["seq"] == 2
+
+        # The surviving worker takes over as broker and keeps the numbering
+        await broker.stop_transport()
+        await wait_for(lambda: client.transport.role == "broker")
+        await client.emit("final_response", {"response": "done"})
+        assert client.get_history(limit=1)[0]["seq"] == 3
+        await client.stop_transport()
+
+    @pytest.mark.asyncio
+    async def test_events_held_back_until_transport_reconnects(self, tmp_path):
+        from observability import EventStream
+        from observability.transport import UnixSocketTransport
+        stream = EventStream(payload_policies={},
+                             transport=UnixSocketTransport(tmp_path / "events.sock",
+                                                           reconnect_seconds=0.05))
+        received = []
+        stream.subscribe(received.append)
+        # Not connected yet: nothing is numbered locally
+        await stream.emit("agent_start", {"agent": "planner"})
+        await stream.emit("agent_complete", {"agent": "planner"})
+        assert stream.last_seq == 0 and stream.unsent_count == 2
+        await stream.start_transport()
+        for _ in range(200):
+            if len(received) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert [(e["seq"], e["type"]) for e in received] == [(1, "agent_start"), (2, "agent_complete")]
+        assert stream.unsent_count == 0
+        await stream.stop_transport()
+
+    @pytest.mark.asyncio
+    async def test_backlog_beyond_full_payloads_still_logged_as_own(self, tmp_path):
+        from observability import EventStream
+        from observability.event_log import EventLog
+        from observability.payloads import PayloadPolicy
+        from observability.transport import UnixSocketTransport
+        log = EventLog(tmp_path / "events.db")
+        stream = EventStream(payload_policies={"tool_result": PayloadPolicy(max_bytes=64)},
+                             log=log, max_full_payloads=500,
+                             transport=UnixSocketTransport(tmp_path / "events.sock",
+                                                           reconnect_seconds=0.05))
+        for i in range(600):
+            await stream.emit("tool_result", {"i": i, "output": "x" * 200})
+        assert stream.unsent_count == 600
+        await stream.start_transport()
+        for _ in range(200):
+            if stream.last_seq == 600:
+                break
+            await asyncio.sleep(0.01)
+        await stream.stop_transport()
+        assert log.flush() and log.last_seq() == 600
+        assert len(log.replay(limit=1000)) == 600
+        assert json.loads(stream.full_payload(600))["output"] == "x" * 200
+        log.close()
+
+    @pytest.mark.asyncio
+    async def test_lost_publish_resent_and_broker_continues_shared_log(self, tmp_path):
+        from observability import EventStream
+        from observability.event_log import EventLog
+        from observability.transport import UnixSocketTransport
+
+        async def wait_for(condition):
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.01)
+            raise AssertionError("timed out")
+
+        log = EventLog(tmp_path / "events.db")
+        socket_path = tmp_path / "events.sock"
+        workers = [EventStream(payload_policies={}, log=log,
+                               transport=UnixSocketTransport(socket_path, reconnect_seconds=0.05))
+                   for _ in range(2)]
+        # Another worker logged events this one never saw
+        other = EventLog(tmp_path / "events.db")
+        for seq in range(1, 11):
+            other.append({"seq": seq, "type": "agent_start", "data": {}})
+        assert other.flush()
+        for worker in workers:
+            await worker.start_transport()
+        await wait_for(lambda: all(w.transport.connected for w in workers))
+        broker, client = sorted(workers, key=lambda w: w.transport.role != "broker")
+        await broker.emit("agent_start", {"agent": "planner"})
+        assert broker.last_seq == 11
+
+        # A write lost with its connection is kept and sent again on reconnecting
+        client.transport._writer.write = lambda data: None
+        await client.emit("agent_complete", {"agent": "planner"})
+        assert client.unsent_count == 1
+        client.transport._writer.close()
+        await wait_for(lambda: client.unsent_count == 0)
+        assert client.last_seq == 12 and broker.get_history(limit=1)[0]["type"] == "agent_complete"
+        for worker in workers:
+            await worker.stop_transport()
+        assert log.flush() and [e["seq"] for e in log.replay(since=10)] == [11, 12]
+        other.close()
+        log.close()
+
 class TestMemoryStore:
     """Test memory store."""
     
@@ -192,6 +1413,133 @@ class TestMemoryStore:
         assert len(results) > 0
         assert results[0]["key"] == "test_key"
 
+class TestLogging:
+    """Test the queued JSON logging pipeline."""
+
+    def _record(self, name="test", msg="x" * 80, level=logging.INFO):
+        return logging.makeLogRecord({"name": name, "msg": msg, "levelno": level,
+                                      "levelname": logging.getLevelName(level)})
+
+    def test_rotated_files_are_compressed(self, tmp_path, monkeypatch):
+        import gzip
+        from utils.logger import CompressedRotatingFileHandler, JSONFormatter
+        monkeypatch.setattr(CompressedRotatingFileHandler, "reopen_check_seconds", 0)
+        handler = CompressedRotatingFileHandler(tmp_path / "app.log", 300, 2)
+        handler.setFormatter(JSONFormatter())
+        for _ in range(12):
+            handler.handle(self._record())
+        handler.close()
+        rotated = sorted(p.name for p in tmp_path.iterdir() if p.suffix == ".gz")
+        assert rotated == ["app.log.1.gz", "app.log.2.gz"]
+        with gzip.open(tmp_path / "app.log.1.gz", "rt") as f:
+            lines = f.read().splitlines()
+        assert lines and json.loads(lines[0])["logger"] == "test"
+
+    def test_rollover_leaves_compression_to_a_background_thread(self, tmp_path, monkeypatch):
+        import gzip
+        import time
+        from utils.logger import CompressedRotatingFileHandler, JSONFormatter
+        monkeypatch.setattr(CompressedRotatingFileHandler, "reopen_check_seconds", 0.3)
+        handler = CompressedRotatingFileHandler(tmp_path / "app.log", 300, 3)
+        handler.setFormatter(JSONFormatter())
+        started = time.monotonic()
+        for i in range(8):
+            handler.handle(self._record(msg=f"{i}" * 80))
+        assert time.monotonic() - started < 0.3
+        handler.close()
+        rotated = sorted(p.name for p in tmp_path.iterdir() if p.name.startswith("app.log."))
+        assert rotated == ["app.log.1.gz", "app.log.2.gz", "app.log.3.gz", "app.log.lock"]
+        first = [json.loads(line)["event"][0]
+                 for n in (3, 2, 1) for line in gzip.open(tmp_path / f"app.log.{n}.gz", "rt")]
+        assert first == sorted(first)
+
+    def test_full_queue_drops_and_reports(self):
+        import queue
+        from utils.logger import LogQueueHandler
+        log_queue = queue.Queue(maxsize=2)
+        handler = LogQueueHandler(log_queue)
+        for _ in range(4):
+            handler.handle(self._record())
+        assert handler.dropped == 2
+        log_queue.get_nowait()
+        log_queue.get_nowait()
+        handler.handle(self._record())
+        notice = log_queue.get_nowait()
+        assert notice.getMessage() == "Log queue full, dropped 2 records"
+
+    def test_event_rendered_before_leaving_the_calling_thread(self):
+        import queue
+        from utils.logger import JSONFormatter, LogQueueHandler
+        log_queue = queue.Queue()
+        handler = LogQueueHandler(log_queue)
+        sources = ["a.txt"]
+        record = self._record(msg={"event": "Search completed", "sources": sources})
+        record._logger, record._name = None, "info"
+        handler.handle(record)
+        sources.append("b.txt")  # changed by the caller after logging
+        line = JSONFormatter().format(log_queue.get_nowait())
+        assert json.loads(line)["sources"] == ["a.txt"]
+
+    def _sample(self, sampler, logger="agents.planner_agent", event="Planning started", **fields):
+        import structlog
+        try:
+            return sampler(None, "info", {"logger": logger, "level": "info", "event": event, **fields})
+        except structlog.DropEvent:
+            return None
+
+    def test_sampling_keeps_every_nth_and_counts_the_rest(self):
+        from utils.log_sampling import LogSampler, parse_rules
+        sampler = LogSampler(parse_rules("agents=0.25"), report_seconds=3600)
+        kept = [self._sample(sampler, i=i) for i in range(9)]
+        assert [event["i"] for event in kept if event] == [0, 4, 8]
+        assert kept[4]["suppressed"] == 3
+        assert self._sample(sampler, logger="rag.indexing") is not None
+        assert sampler.metrics()["suppressed"] == 6
+
+    def test_sampling_keeps_or_drops_whole_requests(self):
+        from observability import request_context
+        from utils.log_sampling import LogSampler, parse_rules
+        sampler = LogSampler(parse_rules("agents=0.25,memory=0.25"), report_seconds=3600)
+        kept_requests = 0
+        for i in range(200):
+            with request_context(f"req-{i}"):
+                kept = {self._sample(sampler) is not None,
+                        self._sample(sampler, event="Planning completed") is not None,
+                        self._sample(sampler, logger="memory.memory_store",
+                                     event="Working memory read") is not None}
+            assert len(kept) == 1
+            kept_requests += kept.pop()
+        assert 25 <= kept_requests <= 75
+        # An explicit request_id on the event decides the same way
+        with request_context("req-0"):
+            in_context = self._sample(sampler) is not None
+        assert (self._sample(sampler, request_id="req-0") is not None) == in_context
+
+    def test_errors_and_slow_calls_bypass_sampling(self):
+        from utils.log_sampling import LogSampler, parse_rules
+        sampler = LogSampler(parse_rules("*=0.01"), slow_ms=500, report_seconds=3600)
+        assert self._sample(sampler) is not None
+        assert self._sample(sampler) is None
+        assert self._sample(sampler, event="Planning completed", duration_ms=750.0) is not None
+        error = sampler(None, "error", {"logger": "agents.planner_agent", "level": "error",
+                                        "event": "Planning started"})
+        assert error["level"] == "error"
+
+    def test_rate_limit_and_rule_precedence(self):
+        from utils.log_sampling import LogSampler, parse_rules
+        sampler = LogSampler(parse_rules(
+            "memory=2/s,memory.memory_store:Working memory read=1,agents=0.5,agents.ingestion_agent=1"),
+            report_seconds=3600)
+        kept = [self._sample(sampler, logger="memory.memory_store", event="Semantic memory read")
+                for _ in range(5)]
+        assert sum(event is not None for event in kept) == 2
+        # A rate of 1 exempts a site or child logger from its parent's rule
+        assert all(self._sample(sampler, logger="memory.memory_store", event="Working memory read")
+                   for _ in range(5))
+        assert all(self._sample(sampler, logger="agents.ingestion_agent") for _ in range(5))
+        with pytest.raises(ValueError):
+            parse_rules("agents=2")
+
 @pytest.mark.asyncio
 class TestOrchestrator:
     """Test orchestrator."""
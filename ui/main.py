@@ -1,13 +1,26 @@
 """FastAPI server with WebSocket for live streaming."""
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any, List
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import asyncio
 import json
+import os
+import uuid
+import aiofiles
+from config import DOCUMENT_WATCHER, DOCUMENTS_DIR, WATCH_STATE_FILE, MAX_UPLOAD_MB
 from orchestration import AgentOrchestrator
 from memory import MemoryStore, MemoryType
-from observability import event_stream
+from observability import event_stream, request_context
+from observability.event_stream import normalize_subscription
+from observability.payloads import to_json
+from observability.sse import gzip_stream, sse_events
+from rag.indexing import IndexingQueue, is_supported
+from rag.tenancy import TENANTS_SUBDIR, validate_tenant
+from rag.watcher import DocumentWatcher
 from utils.logger import get_logger
+from utils.process_lock import try_lock
 
 logger = get_logger(__name__)
 
@@ -25,6 +38,12 @@ app.add_middleware(
 # Initialize components
 orchestrator = AgentOrchestrator()
 memory_store = MemoryStore()
+# Background (re)indexing into the retrieval agent's live index
+indexing_queue = IndexingQueue(orchestrator.knowledge_agent.vector_store,
+                               tenants=orchestrator.knowledge_agent.vector_stores)
+document_watcher: Optional[DocumentWatcher] = None
+# Held by the one worker process that writes to the index (and runs the watcher)
+indexer_lock = None
 
 # WebSocket connections
 active_connections: List[WebSocket] = []
@@ -32,71 +51,123 @@ active_connections: List[WebSocket] = []
 @app.on_event("startup")
 async def startup():
     """Initialize on startup."""
-    # Subscribe to events for broadcasting
-    event_stream.subscribe(broadcast_event)
+    global document_watcher, indexer_lock
+    await event_stream.start_transport()
+    indexing_queue.add_listener(lambda job: event_stream.emit("document_job", job))
+    await indexing_queue.start()
+    indexer_lock = try_lock(WATCH_STATE_FILE.with_name(WATCH_STATE_FILE.name + ".lock"))
+    if indexer_lock is None:
+        logger.info("Documents are indexed by another worker", pid=os.getpid(),
+                   watcher=DOCUMENT_WATCHER)
+    elif DOCUMENT_WATCHER:
+        document_watcher = DocumentWatcher(DOCUMENTS_DIR, indexing_queue, WATCH_STATE_FILE)
+        await document_watcher.start()
     logger.info("FastAPI server started")
 
 @app.on_event("shutdown")
 async def shutdown():
     """Cleanup on shutdown."""
+    if document_watcher is not None:
+        await document_watcher.stop()
+    if indexer_lock is not None:
+        indexer_lock.close()
+    await indexing_queue.stop()
+    orchestrator.knowledge_agent.vector_stores.close()
+    await event_stream.stop_transport()
+    if event_stream.log is not None:
+        event_stream.log.close()
     logger.info("FastAPI server shutting down")
 
-async def broadcast_event(event: Dict[str, Any]):
-    """Broadcast event to all WebSocket connections."""
-    if active_connections:
-        message = json.dumps(event)
-        disconnected = []
-        for connection in active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                disconnected.append(connection)
-        
-        # Remove disconnected connections
-        for conn in disconnected:
-            if conn in active_connections:
-                active_connections.remove(conn)
+def events_response(events: List[Dict[str, Any]], **fields: Any) -> Response:
+    """JSON response reusing each event's cached serialization."""
+    body = "[" + ",".join(to_json(event) for event in events) + "]"
+    if fields:
+        head = "".join(f"{json.dumps(key)}:{json.dumps(value)}," for key, value in fields.items())
+        body = "{" + head + '"events":' + body + "}"
+    return Response(content=body, media_type="application/json")
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for live streaming."""
+    """WebSocket endpoint for live streaming.
+    
+    Each connection is its own event subscriber with its own queue, so a
+    slow client drops or coalesces its own backlog without holding up
+    agents or other clients. A client gets every event until it narrows
+    the stream with ``{"action": "subscribe", "session_id": ...}`` messages
+    (any of ``request_id``, ``session_id``, ``agent`` and ``type``; several
+    subscriptions add up); ``{"action": "unsubscribe", ...}`` removes one,
+    or all of them when no fields are given.
+    """
     await websocket.accept()
+    
+    async def send_event(event: Dict[str, Any]):
+        # Serialized once per event, whatever the number of clients
+        await websocket.send_text(to_json(event))
+    
     active_connections.append(websocket)
+    event_stream.subscribe(send_event)
+    subscriptions: List[Dict[str, Any]] = []
     logger.info("WebSocket connection established", total_connections=len(active_connections))
     
     try:
         while True:
             data = await websocket.receive_text()
-            # Echo back for ping/pong
-            await websocket.send_text(json.dumps({"type": "pong", "data": {}}))
+            try:
+                message = json.loads(data)
+            except ValueError:
+                message = None
+            if not isinstance(message, dict) or message.get("action") not in ("subscribe", "unsubscribe"):
+                # Echo back for ping/pong
+                await websocket.send_text(json.dumps({"type": "pong", "data": {}}))
+                continue
+            fields = {key: value for key, value in message.items() if key != "action"}
+            try:
+                if message["action"] == "subscribe":
+                    wanted = subscriptions + [fields]
+                elif fields:
+                    wanted = [s for s in subscriptions if s != normalize_subscription(fields)]
+                else:
+                    wanted = []
+                subscriptions = event_stream.set_subscriptions(send_event, wanted)
+                reply = {"type": "subscribed", "data": {"subscriptions": subscriptions}}
+            except ValueError as e:
+                reply = {"type": "subscription_error", "data": {"error": str(e)}}
+            await websocket.send_text(json.dumps(reply))
     except WebSocketDisconnect:
+        pass
+    finally:
+        event_stream.unsubscribe(send_event)
         active_connections.remove(websocket)
         logger.info("WebSocket disconnected", total_connections=len(active_connections))
 
 @app.post("/api/process")
 async def process_request(request: Dict[str, Any]):
     """Process a request through the agent system."""
-    try:
-        # Emit start event
-        await event_stream.emit("agent_execution_start", {
-            "input": request
-        })
-        
-        # Process through orchestrator
-        result = await orchestrator.process_async(request)
-        
-        # Emit completion event
-        await event_stream.emit("agent_execution_complete", {
-            "result": result
-        })
-        
-        return JSONResponse(content=result)
-    except Exception as e:
-        logger.error("Request processing failed", error=str(e))
-        await event_stream.emit("agent_execution_error", {
-            "error": str(e)
-        })
-        raise HTTPException(status_code=500, detail=str(e))
+    # Every event of this request carries its id (see GET /api/events?request_id=)
+    request["id"] = request.get("id") or str(uuid.uuid4())
+    request["session_id"] = request.get("session_id") or str(uuid.uuid4())
+    with request_context(request["id"], request["session_id"]):
+        try:
+            # Emit start event
+            await event_stream.emit("agent_execution_start", {
+                "input": request
+            })
+            
+            # Process through orchestrator
+            result = await orchestrator.process_async(request)
+            
+            # Emit completion event
+            await event_stream.emit("agent_execution_complete", {
+                "result": result
+            })
+            
+            return JSONResponse(content=result)
+        except Exception as e:
+            logger.error("Request processing failed", error=str(e))
+            await event_stream.emit("agent_execution_error", {
+                "error": str(e)
+            })
+            raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/memories")
 async def get_memories(memory_type: str = "all", limit: int = 100):
@@ -150,10 +221,180 @@ async def update_memory(memory_type: str, memory_id: int, request: Dict[str, Any
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/events")
-async def get_events(limit: int = 100):
-    """Get recent events."""
-    events = event_stream.get_history(limit)
-    return JSONResponse(content=events)
+async def get_events(
+    limit: int = 100,
+    request_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    agent: Optional[str] = None,
+    event_type: Optional[str] = None,
+    since: Optional[int] = None
+):
+    """Get recent events, optionally only those of one request, session, agent or type.
+    
+    ``since`` returns only events after that ``seq``.
+    """
+    events = event_stream.get_history(limit, since=since, request_id=request_id,
+                                      session_id=session_id, agent=agent, type=event_type)
+    return events_response(events)
+
+@app.get("/api/events/replay")
+async def replay_events(
+    since: Optional[int] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    request_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    limit: int = 1000
+):
+    """Events after sequence number ``since`` and/or between ISO times ``start`` and ``end``.
+    
+    Reads the durable event log when ``EVENT_LOG`` is on, so a client can
+    catch up on what it missed, even across server restarts.
+    """
+    try:
+        events = await asyncio.to_thread(event_stream.replay, since=since, start=start, end=end,
+                                         request_id=request_id, session_id=session_id,
+                                         limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return events_response(events, last_seq=event_stream.last_seq)
+
+@app.get("/api/events/stream")
+async def stream_events(
+    request: Request,
+    request_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    agent: Optional[str] = None,
+    event_type: Optional[str] = None,
+    last_event_id: Optional[int] = None
+):
+    """Server-Sent Events stream of live events, optionally filtered.
+    
+    A reconnecting client's ``Last-Event-ID`` header (or ``last_event_id``)
+    replays what it missed first. Heartbeat comments keep idle connections
+    open; the stream is gzipped when the client accepts it.
+    """
+    header = request.headers.get("last-event-id")
+    if header:
+        try:
+            last_event_id = int(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    subscription = {field: value for field, value in (
+        ("request_id", request_id), ("session_id", session_id),
+        ("agent", agent), ("type", event_type)) if value is not None}
+    messages = sse_events(event_stream, subscription or None, last_event_id)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(gzip_stream(messages), media_type="text/event-stream",
+                                 headers=headers)
+    return StreamingResponse(messages, media_type="text/event-stream", headers=headers)
+
+@app.get("/api/events/{seq}/payload")
+async def get_event_payload(seq: int):
+    """Full data of an event published truncated (``"truncated": true``)."""
+    payload = event_stream.full_payload(seq)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Full payload not available")
+    return Response(content=payload, media_type="application/json")
+
+@app.get("/api/events/subscribers")
+async def get_event_subscribers():
+    """Queue depth, lag and dropped events of each event subscriber, and history and log usage."""
+    return JSONResponse(content={
+        "subscribers": event_stream.metrics(),
+        "history": event_stream.history.metrics(),
+        "log": event_stream.log.metrics() if event_stream.log is not None else None,
+        "transport": ({**event_stream.transport.metrics(), "unsent": event_stream.unsent_count,
+                       "unsent_dropped": event_stream.unsent_dropped}
+                      if event_stream.transport is not None else None)
+    })
+
+@app.post("/api/documents", status_code=202)
+async def upload_document(request: Request, filename: str, tenant_id: Optional[str] = None):
+    """Upload a document and index it in the background.
+    
+    The request body is the raw file, streamed to ``DOCUMENTS_DIR`` chunk by
+    chunk. The response carries a job id; progress is emitted as
+    ``document_job`` events and served by ``/api/documents/jobs/{job_id}``.
+    With ``tenant_id`` the file goes to ``DOCUMENTS_DIR/tenants/<tenant_id>/``
+    and into that tenant's index. Only one worker process writes to the
+    index. On the others the file is left to that worker's document watcher:
+    the response has no job id, and the job's ``document_job`` events carry
+    the file's path. Without the watcher such an upload is refused (503).
+    """
+    name = Path(filename).name
+    if not is_supported(Path(name)):
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {filename}")
+    try:
+        tenant_id = validate_tenant(tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    directory = DOCUMENTS_DIR
+    if tenant_id is not None:
+        directory = DOCUMENTS_DIR / TENANTS_SUBDIR / tenant_id
+        directory.mkdir(parents=True, exist_ok=True)
+    destination = directory / name
+    if indexer_lock is None and not DOCUMENT_WATCHER:
+        raise HTTPException(status_code=503, detail="Documents are indexed by another worker "
+                                                    "process; enable DOCUMENT_WATCHER")
+    # Hidden until complete, so the watcher never sees a partial file
+    partial = directory / f".{name}.{uuid.uuid4().hex}.part"
+    limit = MAX_UPLOAD_MB * 1024 * 1024
+    size = 0
+    try:
+        async with aiofiles.open(partial, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(status_code=413,
+                                        detail=f"Upload exceeds {MAX_UPLOAD_MB} MB")
+                await f.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty upload")
+        os.replace(partial, destination)
+    finally:
+        if partial.exists():
+            partial.unlink()
+    
+    if indexer_lock is None:
+        # Only the indexing worker writes to the index; its watcher picks the file up
+        logger.info("Document uploaded", path=str(destination), bytes=size,
+                   tenant_id=tenant_id, indexed_by="watcher")
+        return JSONResponse(status_code=202, content={
+            "job_id": None, "status": "saved", "path": str(destination), "bytes": size,
+            "tenant_id": tenant_id
+        })
+    job_id = indexing_queue.submit(destination, filename=name, bytes=size, tenant_id=tenant_id)
+    logger.info("Document uploaded", path=str(destination), bytes=size, job_id=job_id,
+               tenant_id=tenant_id)
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id, "status": "queued", "path": str(destination), "bytes": size,
+        "tenant_id": tenant_id
+    })
+
+@app.get("/api/documents/jobs")
+async def list_document_jobs(limit: int = 50):
+    """Recent indexing jobs, newest first."""
+    return JSONResponse(content=indexing_queue.jobs(limit))
+
+@app.get("/api/documents/jobs/{job_id}")
+async def get_document_job(job_id: str):
+    """Status and progress of one indexing job."""
+    job = indexing_queue.job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job)
+
+@app.get("/api/indexing")
+async def get_indexing_status():
+    """Background indexing queue and document watcher metrics."""
+    return JSONResponse(content={
+        "queue": indexing_queue.metrics(),
+        "tenants": orchestrator.knowledge_agent.vector_stores.metrics(),
+        "watcher": document_watcher.metrics() if document_watcher is not None else None
+    })
 
 @app.get("/")
 async def get_ui():
@@ -318,6 +559,19 @@ async def get_ui():
     <script>
         let ws = null;
         let reconnectAttempts = 0;
+        let lastSeq = parseInt(sessionStorage.getItem('lastSeq') || '0');
+        
+        async function catchUp() {
+            // Events emitted while this page was disconnected (or the server restarted)
+            const response = await fetch(
+                `/api/events/replay?since=${lastSeq}&session_id=${encodeURIComponent(getSessionId())}&limit=500`);
+            const data = await response.json();
+            if (data.last_seq < lastSeq) {
+                // Numbering restarted (no event log): start over
+                lastSeq = 0;
+            }
+            data.events.forEach(handleEvent);
+        }
         
         function connectWebSocket() {
             const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
@@ -328,6 +582,10 @@ async def get_ui():
                 document.getElementById('status').className = 'status-indicator status-connected';
                 document.getElementById('statusText').textContent = 'Connected';
                 reconnectAttempts = 0;
+                // Only this page's requests and background indexing jobs
+                ws.send(JSON.stringify({action: 'subscribe', session_id: getSessionId()}));
+                ws.send(JSON.stringify({action: 'subscribe', type: 'document_job'}));
+                catchUp().catch(error => console.error('Catch-up failed:', error));
             };
             
             ws.onmessage = (event) => {
@@ -347,6 +605,12 @@ async def get_ui():
         }
         
         function handleEvent(event) {
+            if (event.type === 'pong' || event.type === 'subscribed') return;
+            if (event.seq !== undefined) {
+                if (event.seq <= lastSeq) return;
+                lastSeq = event.seq;
+                sessionStorage.setItem('lastSeq', lastSeq);
+            }
             const logDiv = document.getElementById('executionLog');
             const entry = document.createElement('div');
             entry.className = 'log-entry agent';
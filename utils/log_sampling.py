@@ -0,0 +1,196 @@
+"""Sampling and per-call-site rate limits for hot-path logs (a structlog processor)."""
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+import structlog
+from config import LOG_SAMPLING_RULES, LOG_SLOW_MS, LOG_SUPPRESSED_REPORT_SECONDS
+
+# Levels that are never sampled
+ALWAYS_LOGGED = frozenset({"warning", "error", "critical"})
+# Call sites remembered; beyond this, sites without a rule are looked up each time
+MAX_SITES = 10000
+
+class SampleRule:
+    """Keep ``rate`` of a call site's events, and at most ``per_second`` of them."""
+
+    __slots__ = ("rate", "per_second")
+
+    def __init__(self, rate: float = 1.0, per_second: float = 0.0):
+        if not 0 < rate <= 1:
+            raise ValueError(f"Sample rate must be in (0, 1]: {rate}")
+        if per_second < 0:
+            raise ValueError(f"Rate limit must not be negative: {per_second}")
+        self.rate = rate
+        self.per_second = per_second
+
+    def __repr__(self) -> str:
+        return f"SampleRule(rate={self.rate}, per_second={self.per_second})"
+
+# Logged on every request (working memory by each agent), and nearly always uneventful
+DEFAULT_RULES: Dict[str, SampleRule] = {
+    "memory.memory_store:Working memory read": SampleRule(0.1),
+    "rag.vector_store:Similarity search completed": SampleRule(0.1),
+}
+
+def parse_rules(text: str) -> Dict[str, SampleRule]:
+    """Rules from ``"target=rate,target=N/s"`` (see ``LOG_SAMPLING_RULES``)."""
+    rules: Dict[str, SampleRule] = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        target, _, value = item.rpartition("=")
+        target, value = target.strip(), value.strip()
+        if not target:
+            raise ValueError(f"Log sampling rule needs a target: {item!r}")
+        rule = rules.get(target, SampleRule())
+        if value.endswith("/s"):
+            rules[target] = SampleRule(rule.rate, float(value[:-2]))
+        else:
+            rules[target] = SampleRule(float(value), rule.per_second)
+    return rules
+
+def request_sampled(request_id: str, rate: float) -> bool:
+    """Whether a request is among the ``rate`` kept; the same answer at every call site."""
+    return zlib.crc32(request_id.encode("utf-8")) < rate * 2 ** 32
+
+def _current_request_id() -> Optional[str]:
+    # Imported on use: observability itself logs through utils.logger
+    from observability.context import current_request_id
+    return current_request_id()
+
+def configured_rules() -> Dict[str, SampleRule]:
+    """``DEFAULT_RULES`` with ``LOG_SAMPLING_RULES`` applied on top."""
+    return {**DEFAULT_RULES, **parse_rules(LOG_SAMPLING_RULES)}
+
+class _Site:
+    __slots__ = ("rule", "credit", "tokens", "refilled", "suppressed")
+
+    def __init__(self, rule: SampleRule, now: float):
+        self.rule = rule
+        self.credit = 1.0
+        self.tokens = max(1.0, rule.per_second)
+        self.refilled = now
+        self.suppressed = 0
+
+    def admit(self, now: float, request_id: Optional[str] = None) -> bool:
+        rule = self.rule
+        if rule.rate < 1:
+            if request_id is not None:
+                sampled = request_sampled(request_id, rule.rate)
+            else:
+                # Tolerance for the rounding of repeated additions (10 x 0.1 < 1)
+                sampled = self.credit >= 1 - 1e-9
+                self.credit = (self.credit - 1 if sampled else self.credit) + rule.rate
+            if not sampled:
+                return False
+        if rule.per_second > 0:
+            self.tokens = min(max(1.0, rule.per_second),
+                              self.tokens + (now - self.refilled) * rule.per_second)
+            self.refilled = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+        return True
+
+class LogSampler:
+    """structlog processor that thins out repetitive INFO and DEBUG events.
+
+    A call site is a logger and event message; it follows the rule of its
+    ``logger:event`` target, else of its logger or the nearest parent logger
+    (``agents`` covers ``agents.planner_agent``), else of ``*``. A rate below
+    1 keeps that share of the requests (by a hash of the event's
+    ``request_id`` or the current one), so a kept request keeps its events at
+    every site with that rate or more; events outside a request are kept
+    evenly spaced, starting with the first. ``N/s`` keeps at most N events a
+    second per site, whatever the request. Warnings, errors and events
+    whose ``duration_ms`` reaches ``slow_ms`` always pass. The next event
+    kept at a site carries ``suppressed``, the number dropped there since the
+    last one, and every ``report_seconds`` a "Log messages suppressed" event
+    gives the counts per site.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[Dict[str, SampleRule]] = None,
+        slow_ms: float = LOG_SLOW_MS,
+        report_seconds: float = LOG_SUPPRESSED_REPORT_SECONDS
+    ):
+        self.rules = dict(DEFAULT_RULES if rules is None else rules)
+        self.slow_ms = slow_ms
+        self.report_seconds = report_seconds
+        self._sites: Dict[Tuple[str, str], Optional[_Site]] = {}
+        self._unreported: Dict[Tuple[str, str], int] = {}
+        self._next_report = time.monotonic() + report_seconds
+        self._lock = threading.Lock()
+        self._logger = structlog.get_logger(__name__)
+        self.stats = {"kept": 0, "suppressed": 0}
+
+    def __call__(self, logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        name = event_dict.get("logger", "")
+        if name == __name__ or event_dict.get("level") in ALWAYS_LOGGED or self._is_slow(event_dict):
+            return event_dict
+        key = (name, str(event_dict.get("event")))
+        request_id = event_dict.get("request_id") or _current_request_id()
+        now = time.monotonic()
+        report = None
+        with self._lock:
+            site = self._site(key, now)
+            if site is None:
+                return event_dict
+            keep = site.admit(now, str(request_id) if request_id is not None else None)
+            if keep:
+                if site.suppressed:
+                    event_dict["suppressed"] = site.suppressed
+                    site.suppressed = 0
+                self.stats["kept"] += 1
+            else:
+                site.suppressed += 1
+                self._unreported[key] = self._unreported.get(key, 0) + 1
+                self.stats["suppressed"] += 1
+            if self._unreported and now >= self._next_report:
+                report, self._unreported = self._unreported, {}
+                self._next_report = now + self.report_seconds
+        if report:
+            self._report(report)
+        if not keep:
+            raise structlog.DropEvent
+        return event_dict
+
+    def _is_slow(self, event_dict: Dict[str, Any]) -> bool:
+        duration = event_dict.get("duration_ms")
+        return isinstance(duration, (int, float)) and duration >= self.slow_ms
+
+    def _site(self, key: Tuple[str, str], now: float) -> Optional[_Site]:
+        if key in self._sites:
+            return self._sites[key]
+        rule = self._rule_for(*key)
+        site = _Site(rule, now) if rule is not None else None
+        if site is not None or len(self._sites) < MAX_SITES:
+            self._sites[key] = site
+        return site
+
+    def _rule_for(self, name: str, event: str) -> Optional[SampleRule]:
+        candidates = [f"{name}:{event}"]
+        parts = name.split(".")
+        candidates += [".".join(parts[:i]) for i in range(len(parts), 0, -1)]
+        for target in candidates + ["*"]:
+            rule = self.rules.get(target)
+            if rule is not None:
+                return rule if rule.rate < 1 or rule.per_second > 0 else None
+        return None
+
+    def _report(self, counts: Dict[Tuple[str, str], int]):
+        self._logger.info("Log messages suppressed", total=sum(counts.values()),
+                          counts={f"{name}:{event}": n for (name, event), n in counts.items()})
+
+    def report(self):
+        """Log the suppressed counts not yet reported (e.g. at shutdown)."""
+        with self._lock:
+            report, self._unreported = self._unreported, {}
+        if report:
+            self._report(report)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "sites": sum(1 for site in self._sites.values() if site)}
@@ -1,46 +1,278 @@
-"""Structured logging for observability."""
-import structlog
+"""Structured logging for observability.
+
+structlog builds each event on the calling thread, and the ``QueueHandler``
+renders it to JSON there, once, so values the caller changes afterwards
+cannot alter it. A ``QueueListener`` thread writes the line to the console
+and to a log file that is rotated by size and compressed, so logging never
+blocks the event loop on I/O. Hot-path events are sampled first (see
+``utils.log_sampling``).
+"""
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
 import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from config import LOG_LEVEL, LOG_FILE
-
-# Configure structlog
-structlog.configure(
-    processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.StackInfoRenderer(),
-        structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
-    ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
-    cache_logger_on_first_use=True,
-)
+from typing import IO, List, Optional
+import structlog
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+from config import LOG_LEVEL, LOG_FILE, LOG_MAX_MB, LOG_BACKUPS, LOG_QUEUE_SIZE, LOG_SAMPLING
+from utils.log_sampling import LogSampler, configured_rules
+from utils.process_lock import HAS_FCNTL
+if HAS_FCNTL:
+    import fcntl
 
 def get_logger(name: str):
     """Get a structured logger instance."""
     return structlog.get_logger(name)
 
-# File handler for persistent logging
-import logging
-file_handler = logging.FileHandler(LOG_FILE)
-file_handler.setLevel(getattr(logging, LOG_LEVEL))
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-file_handler.setFormatter(formatter)
-
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(getattr(logging, LOG_LEVEL))
-console_handler.setFormatter(formatter)
-
-root_logger = logging.getLogger()
-root_logger.addHandler(file_handler)
-root_logger.addHandler(console_handler)
-root_logger.setLevel(getattr(logging, LOG_LEVEL))
+def _dumps(event_dict, **kwargs) -> str:
+    if HAS_ORJSON:
+        try:
+            return orjson.dumps(event_dict, default=str,
+                                option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(event_dict, default=str)
+
+# Adds what structlog events already carry to records from stdlib loggers (uvicorn, httpx...)
+_FOREIGN_PRE_CHAIN = [
+    structlog.stdlib.add_logger_name,
+    structlog.stdlib.add_log_level,
+    structlog.processors.TimeStamper(fmt="iso"),
+]
+
+class JSONFormatter(structlog.stdlib.ProcessorFormatter):
+    """Renders structlog events and plain stdlib records as one JSON line.
+
+    The line is kept on the record, so it is encoded once however many
+    handlers write it.
+    """
+
+    def __init__(self):
+        super().__init__(
+            processors=[
+                structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+                structlog.processors.format_exc_info,
+                structlog.processors.JSONRenderer(serializer=_dumps),
+            ],
+            foreign_pre_chain=_FOREIGN_PRE_CHAIN,
+        )
+
+    def format(self, record: logging.LogRecord) -> str:
+        rendered = record.__dict__.get("rendered_json")
+        if rendered is None:
+            rendered = record.rendered_json = super().format(record)
+        return rendered
+
+class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotates the log file past ``max_bytes`` and gzips the rotated files.
+
+    Several worker processes can append to the same file: rotation happens
+    under an exclusive lock on ``<file>.lock`` (the first worker to get it
+    rotates, the others find the new, small file and just reopen it), and
+    each handler reopens the file when it notices it was rotated elsewhere.
+    Rotation itself only renames the file; a background thread compresses
+    it and shifts the numbered backups, so the listener thread never waits
+    on gzip.
+    """
+
+    reopen_check_seconds = 1.0
+
+    def __init__(self, filename: Path, max_bytes: int, backup_count: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count,
+                         encoding="utf-8", delay=True)
+        self.namer = lambda name: name + ".gz"
+        self.lock_path = self.baseFilename + ".lock"
+        self._next_reopen_check = 0.0
+        # One thread, so rotated files are compressed and numbered in order
+        self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-compress")
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        # Decided on the size so far, so the record is not formatted twice
+        if self.stream is None:
+            self.stream = self._open()
+        elif time.monotonic() >= self._next_reopen_check:
+            self._next_reopen_check = time.monotonic() + self.reopen_check_seconds
+            if self._rotated_elsewhere():
+                self.stream.close()
+                self.stream = self._open()
+        return self.maxBytes > 0 and self.stream.seek(0, os.SEEK_END) >= self.maxBytes
+
+    def _rotated_elsewhere(self) -> bool:
+        try:
+            on_disk = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        current = os.fstat(self.stream.fileno())
+        return (on_disk.st_ino, on_disk.st_dev) != (current.st_ino, current.st_dev)
+
+    def _locked(self):
+        lock_file = open(self.lock_path, "a")
+        if HAS_FCNTL:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        return lock_file
+
+    def doRollover(self):
+        with self._locked():
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            if (self.backupCount <= 0 or not os.path.exists(self.baseFilename)
+                    or os.path.getsize(self.baseFilename) < self.maxBytes):
+                return
+            rotated = f"{self.baseFilename}.{uuid.uuid4().hex}.tmp"
+            os.replace(self.baseFilename, rotated)
+        try:
+            self._compressor.submit(self._compress, rotated)
+        except RuntimeError:
+            # Interpreter shutting down: no more background work
+            self._compress(rotated)
+
+    def _compress(self, rotated: str):
+        # Other workers notice the rename within reopen_check_seconds; let the
+        # lines they append to the old file meanwhile land before compressing
+        time.sleep(self.reopen_check_seconds)
+        try:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            with self._locked():
+                for i in range(self.backupCount - 1, 0, -1):
+                    older = self.rotation_filename(f"{self.baseFilename}.{i}")
+                    if os.path.exists(older):
+                        os.replace(older, self.rotation_filename(f"{self.baseFilename}.{i + 1}"))
+                os.replace(rotated + ".gz", self.rotation_filename(self.baseFilename + ".1"))
+            os.remove(rotated)
+        except OSError as e:
+            sys.stderr.write(f"Compressing rotated log {rotated} failed: {e}\n")
+
+    def close(self):
+        self._compressor.shutdown(wait=True)
+        super().close()
+
+class StdoutHandler(logging.StreamHandler):
+    """Writes to whatever ``sys.stdout`` is when the record is written.
+
+    The listener thread outlives replacements of ``sys.stdout`` (such as a
+    test runner's capture), so the stream is not fixed at start-up.
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Renders records to JSON on the logging thread and enqueues them.
+
+    The event dict holds the caller's own objects, so it is rendered before
+    the record changes threads; the listener's handlers reuse the line.
+
+    The queue is bounded: when the writer falls behind, records are dropped
+    rather than blocking the caller, and the number dropped is logged once
+    there is room again.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.setFormatter(JSONFormatter())
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        self.format(record)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self._unreported:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"Log queue full, dropped {self._unreported} records"}))
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+def build_handlers(
+    log_file: Path = LOG_FILE,
+    level: str = LOG_LEVEL,
+    stream: Optional[IO] = None
+) -> List[logging.Handler]:
+    """The file and console handlers the listener thread writes to."""
+    formatter = JSONFormatter()
+    file_handler = CompressedRotatingFileHandler(log_file, int(LOG_MAX_MB * 1024 * 1024), LOG_BACKUPS)
+    console_handler = logging.StreamHandler(stream) if stream is not None else StdoutHandler()
+    for handler in (file_handler, console_handler):
+        handler.setLevel(getattr(logging, level))
+        handler.setFormatter(formatter)
+    return [file_handler, console_handler]
+
+def configure_logging(
+    log_file: Path = LOG_FILE,
+    level: str = LOG_LEVEL,
+    stream: Optional[IO] = None,
+    queue_size: int = LOG_QUEUE_SIZE,
+    sampler: Optional[LogSampler] = None
+) -> logging.handlers.QueueListener:
+    """Route structlog and stdlib logging through a queue to a writer thread."""
+    # The JSON lines carry none of the thread or process fields, so skip
+    # collecting them for every record (see "Optimization" in the logging docs)
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            structlog.stdlib.add_logger_name,
+            structlog.stdlib.add_log_level,
+            # Before the costlier steps, so dropped events skip them
+            *([sampler] if sampler is not None else []),
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.processors.StackInfoRenderer(),
+            structlog.processors.format_exc_info,
+            structlog.processors.UnicodeDecoder(),
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ],
+        context_class=dict,
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    listener = logging.handlers.QueueListener(
+        log_queue, *build_handlers(log_file, level, stream), respect_handler_level=True)
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        if isinstance(handler, LogQueueHandler):
+            root_logger.removeHandler(handler)
+    root_logger.addHandler(LogQueueHandler(log_queue))
+    root_logger.setLevel(getattr(logging, level))
+    listener.start()
+    return listener
+
+log_sampler = LogSampler(configured_rules()) if LOG_SAMPLING else None
+log_listener = configure_logging(sampler=log_sampler)
+
+@atexit.register
+def _flush_logs():
+    """Write out what is still queued when the process exits."""
+    if log_sampler is not None:
+        log_sampler.report()
+    log_listener.stop()
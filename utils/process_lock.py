@@ -0,0 +1,26 @@
+"""Advisory file locks for electing one worker process to do a job."""
+from pathlib import Path
+from typing import IO, Optional
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+def try_lock(path: Path) -> Optional[IO]:
+    """Take an exclusive lock on ``path`` without waiting.
+
+    Returns the open lock file, which holds the lock until it is closed (or
+    the process exits), or None when another process holds it. Without
+    ``fcntl`` (non-POSIX) there are no other workers to exclude, so the lock
+    is always granted.
+    """
+    lock_file = open(path, "a")
+    if not HAS_FCNTL:
+        return lock_file
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
@@ -0,0 +1,189 @@
+"""Cache tier in SQLite, shared by the worker processes of one host."""
+import hashlib
+import sqlite3
+import threading
+import time
+import warnings
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+try:
+    from langchain_core.caches import BaseCache
+    from langchain_core.globals import set_llm_cache
+    from langchain_core.load import dumps, loads
+    HAS_LANGCHAIN_CACHE = True
+except ImportError:
+    BaseCache = object
+    HAS_LANGCHAIN_CACHE = False
+from config import SHARED_CACHE_PATH, SHARED_CACHE_MB, SQLITE_BUSY_TIMEOUT
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Writes between checks of the size budget
+SIZE_CHECK_WRITES = 256
+# Share of the oldest entries removed when the cache is over its size budget
+TRIM_FRACTION = 0.1
+
+class SharedCache:
+    """Key/value cache in a SQLite file that every worker process opens.
+
+    Entries belong to a ``namespace`` (e.g. one per embedding model) and are
+    keyed by the SHA-256 of their key. In WAL mode workers read while another
+    writes; a writer blocked by another waits up to ``busy_timeout`` seconds.
+    Hits never write, so when the cache outgrows ``max_mb`` the entries
+    written first are removed first (the in-process caches in front of this
+    tier keep the hot ones). Database errors are logged and count as misses:
+    the cache never fails a request.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        path: Path = SHARED_CACHE_PATH,
+        max_mb: float = SHARED_CACHE_MB,
+        busy_timeout: float = SQLITE_BUSY_TIMEOUT
+    ):
+        self.namespace = namespace
+        self.path = Path(path)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._db = sqlite3.connect(str(self.path), timeout=busy_timeout, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key BLOB NOT NULL,
+                value BLOB NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "trimmed": 0, "errors": 0}
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return hashlib.sha256(key.encode("utf-8")).digest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT value FROM cache WHERE namespace = ? AND key = ?",
+                    (self.namespace, self._digest(key))).fetchone()
+        except sqlite3.Error as e:
+            self._failed("read", e)
+            return None
+        self.stats["hits" if row else "misses"] += 1
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes):
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Sequence[tuple]):
+        """Store ``(key, value)`` pairs in one transaction."""
+        now = time.time()
+        rows = [(self.namespace, self._digest(key), value, now) for key, value in items]
+        if not rows:
+            return
+        try:
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, created) "
+                    "VALUES (?, ?, ?, ?)", rows)
+                self._db.commit()
+                self._writes += len(rows)
+                if self._writes >= SIZE_CHECK_WRITES:
+                    self._writes = 0
+                    self._enforce_size()
+        except sqlite3.Error as e:
+            self._failed("write", e)
+            return
+        self.stats["writes"] += len(rows)
+
+    def _enforce_size(self):
+        while self.max_bytes > 0 and self._live_bytes() > self.max_bytes:
+            count = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count <= 1:
+                break
+            cursor = self._db.execute(
+                "DELETE FROM cache WHERE rowid IN "
+                "(SELECT rowid FROM cache ORDER BY created LIMIT ?)",
+                (max(1, int(count * TRIM_FRACTION)),))
+            self._db.commit()
+            self.stats["trimmed"] += cursor.rowcount
+
+    def _live_bytes(self) -> int:
+        """Bytes of the database in use (freed pages are reused, not counted)."""
+        page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        pages = self._db.execute("PRAGMA page_count").fetchone()[0]
+        free = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def _failed(self, operation: str, error: sqlite3.Error):
+        self.stats["errors"] += 1
+        logger.warning("Shared cache unavailable", namespace=self.namespace,
+                      operation=operation, error=str(error))
+
+    def clear(self):
+        """Drop this namespace's entries (for every worker)."""
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            self._db.commit()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            live_bytes = self._live_bytes()
+        return {**self.stats, "namespace": self.namespace, "bytes": live_bytes,
+                "max_bytes": self.max_bytes}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class LLMResponseCache(BaseCache):
+    """LangChain LLM cache on a ``SharedCache``.
+
+    LangChain keys lookups by the prompt and ``llm_string``, which includes
+    the model and its parameters, so a response is only reused for the same
+    prompt to an identically configured model, whichever worker produced it.
+    """
+
+    def __init__(self, cache: Optional[SharedCache] = None):
+        self.cache = cache if cache is not None else SharedCache("llm")
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return f"{llm_string}\x00{prompt}"
+
+    def lookup(self, prompt: str, llm_string: str):
+        value = self.cache.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        try:
+            # loads() is flagged beta; the payloads are ones this cache wrote
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                return loads(value.decode("utf-8"), allowed_objects="core")
+        except Exception as e:
+            logger.warning("Discarding unreadable cached LLM response", error=str(e))
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        self.cache.set(self._key(prompt, llm_string), dumps(list(return_val)).encode("utf-8"))
+
+    def clear(self, **kwargs: Any):
+        self.cache.clear()
+
+def install_llm_cache() -> Optional[LLMResponseCache]:
+    """Route every LangChain model call of this process through the shared cache."""
+    if not HAS_LANGCHAIN_CACHE:
+        logger.warning("LLM_CACHE is set but langchain_core caching is unavailable")
+        return None
+    cache = LLMResponseCache()
+    set_llm_cache(cache)
+    logger.info("Shared LLM response cache enabled", path=str(cache.cache.path))
+    return cache